@@ -2,26 +2,33 @@
 from __future__ import print_function
 # from memory_profiler import profile
 
-import os.path as op
-import os
 import pysam
-from collections import defaultdict
-from shlex import quote
+import multiprocessing
+from collections import defaultdict, deque
+from fnmatch import fnmatchcase
 
-import pybedtools
-
-from mirtop.libs import do
-from mirtop.libs.utils import file_exists
 import mirtop.libs.logger as mylog
 from mirtop.mirna.realign import isomir, hits, reverse_complement
-from mirtop.mirna.mapper import get_primary_transcript, guess_database
-from mirtop.bam import filter
+from mirtop.mirna.mapper import guess_database
+from mirtop.bam import filter, group, intervals
 from mirtop.gff import body
 from mirtop.mirna.annotate import annotate
-from mirtop.libs import sql
 
 logger = mylog.getLogger(__name__)
 
+# number of alignments sent to each worker with --threads
+BLOCK_SIZE = 10000
+
+# number of reads processed together with --low-memory
+CHUNK_READS = 50000
+
+# approximate bytes of the alignments kept with --low-memory
+CHUNK_BYTES = 100000000
+
+# rough size of the objects kept for each alignment, besides its
+# name and sequence, until the chunk is written
+ALIGNMENT_BYTES = 500
+
 # fp = open('memory_profiler.log', 'w+')
 
 
@@ -43,26 +50,17 @@ def read_bam(bam_fn, args, clean=True):
              keys are read_id and values are *mirtop.realign.hits*
 
     """
-    bam_fn = _sam_to_bam(bam_fn)
-    bam_fn = _bam_sort(bam_fn)
     reads = defaultdict(hits)
     if args.genomic:
         logger.warning("This is under development and variants can be unexact.")
-        bed_fn = os.path.join(args.out, os.path.basename(bam_fn) + ".bed")
-        logger.info("Making bed file.")
-        _bed(bam_fn, bed_fn)
-        logger.info("Intersecting bed file.")
-        intersect_fn = intersect(bed_fn, args.gtf)
-        # logger.info("Analyzing hits.")
-        # reads = _read_lifted_bam(intersect_fn, reads, args, clean)
-        logger.info("Loading database.")
-        conn = _read_lifted_bam_alpha(intersect_fn, bam_fn, args)
-        rows = sql.select_all_reads(conn)
-        logger.info("Analyzing database.")
+        logger.info("Lifting alignments to precursors.")
+        rows = list(_lifted_rows(bam_fn, args))
+        logger.info("Analyzing hits.")
         precursors = args.precursors
         database = guess_database(args)
         reads = _read_lifted_lines(rows, precursors, database)
-        conn.close()
+    elif _by_region(bam_fn, args):
+        reads = _read_region_bam(bam_fn, args, clean)
     else:
         reads = _read_original_bam(bam_fn, reads, args, clean)
     logger.info("Done.")
@@ -71,53 +69,160 @@ def read_bam(bam_fn, args, clean=True):
 
 # @profile(stream=fp)
 def low_memory_bam(bam_fn, sample, out_handle, args):
+    """
+    Realign, annotate and write the GFF lines of a BAM file
+    by chunks of *args.chunk_reads* reads, or less if the alignments
+    of the chunk take more than *args.chunk_bytes*.
+
+    The output is the same than processing each read by itself:
+    lines are written read by read in the order of the file.
+    """
     if args.genomic:
         raise ValueError("low-memory option is not compatible with genomic coordinates.")
+    if getattr(args, "precursor_names", None):
+        raise ValueError("low-memory option is not compatible with --precursors.")
     precursors = args.precursors
-    bam_fn = _sam_to_bam(bam_fn)
-    bam_fn = _bam_sort(bam_fn)
-    mode = "r" if bam_fn.endswith("sam") else "rb"
-    handle = pysam.Samfile(bam_fn, mode)
+    chunk_reads = max(1, getattr(args, "chunk_reads", CHUNK_READS))
+    chunk_bytes = max(1, getattr(args, "chunk_bytes", CHUNK_BYTES))
+    handle = group.open_bam(bam_fn)
     lines = []
     current = None
-    for line in handle:
-        if not current or current == line.query_name:
-            lines.append(line)
-            current = line.query_name
-        else:
-            reads = _read_lines(lines, precursors, handle, args)
-            ann = annotate(reads, args.matures, args.precursors, quiet=True)
-            gff_lines = body.create(ann, args.database, sample, args, quiet=True)
-            body.write_body_on_handle(gff_lines, out_handle)
+    n_reads = 0
+    n_bytes = 0
+    for line in group.by_name(handle, args.out):
+        if current != line.query_name:
+            if n_reads >= chunk_reads or n_bytes >= chunk_bytes:
+                _write_chunk(lines, precursors, handle, sample, out_handle, args)
+                lines = []
+                n_reads = 0
+                n_bytes = 0
             current = line.query_name
-            lines = []
-            lines.append(line)
+            n_reads += 1
+        lines.append(line)
+        n_bytes += _line_bytes(line)
+    _write_chunk(lines, precursors, handle, sample, out_handle, args)
+
+
+def _line_bytes(line):
+    """Approximate memory used by an alignment until it is written."""
+    return len(line.query_name) + 2 * (line.query_length or 0) + ALIGNMENT_BYTES
+
+
+def _write_chunk(lines, precursors, handle, sample, out_handle, args):
+    """Realign, annotate and write a chunk of reads."""
     reads = _read_lines(lines, precursors, handle, args)
+    body.write_chunk(reads, sample, args, out_handle)
+
+
+def read_bam_parallel(bam_fn, sample, args):
+    """
+    Realign, annotate and create the GFF lines of a BAM file
+    using *args.threads* processes.
+
+    The alignments grouped by name are split in blocks of complete reads,
+    each block is processed independently and the lines are merged
+    in the original order, so the output is the same than running
+    *read_bam()*, *annotate()* and *mirtop.gff.body.create()*.
+
+    Args:
+        *bam_fn*: a BAM file with alignments to the precursor
+
+        *sample(str)*: sample name used in the GFF lines.
+
+        *args(namedtuple)*: arguments from command line.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+    Returns:
+        *lines (nested dicts)*: gff_list has the format as
+            defined in *mirtop.gff.body.read()*.
+    """
+    if _by_region(bam_fn, args):
+        reads = _read_region_bam(bam_fn, args, True, args.threads)
+        ann = annotate(reads, args.matures, args.precursors, quiet=True)
+        return body.create(ann, args.database, sample, args)
+    handle = group.open_bam(bam_fn)
+    lines = defaultdict(defaultdict)
+    n_reads = 0
+    n_hits = 0
+    pool = multiprocessing.Pool(args.threads, initializer=_init_worker,
+                                initargs=(handle.header.to_dict(), sample, args))
+    try:
+        queue = deque()
+        for block in _blocks_by_name(group.by_name(handle, args.out),
+                                     BLOCK_SIZE):
+            queue.append(pool.apply_async(_analyze_block, (block,)))
+            if len(queue) >= args.threads * 2:
+                n_reads, n_hits = _merge_block(lines, queue.popleft().get(),
+                                               n_reads, n_hits)
+        while queue:
+            n_reads, n_hits = _merge_block(lines, queue.popleft().get(),
+                                           n_reads, n_hits)
+    finally:
+        pool.close()
+        pool.join()
+    handle.close()
+    logger.info("Hits after clean: %s" % n_reads)
+    logger.info("GFF miRNAs: %s" % len(lines))
+    logger.info("GFF hits %s" % n_hits)
+    return lines
+
+
+def _blocks_by_name(alignments, size):
+    """Yield list of SAM lines with at least *size* alignments
+    that never split the alignments of a read."""
+    block = []
+    current = None
+    for line in alignments:
+        if len(block) >= size and line.query_name != current:
+            yield block
+            block = []
+        current = line.query_name
+        block.append(line.to_string())
+    if block:
+        yield block
+
+
+_worker = {}
+
+
+def _init_worker(header, sample, args):
+    _worker["header"] = pysam.AlignmentHeader.from_dict(header)
+    _worker["sample"] = sample
+    _worker["args"] = args
+
+
+def _analyze_block(block):
+    header = _worker["header"]
+    args = _worker["args"]
+    stats = filter.tune_cache_stats()
+    lines = [pysam.AlignedSegment.fromstring(line, header) for line in block]
+    reads = _read_lines(lines, args.precursors, None, args)
     ann = annotate(reads, args.matures, args.precursors, quiet=True)
-    gff_lines = body.create(ann, args.database, sample, args, quiet=True)
-    body.write_body_on_handle(gff_lines, out_handle)
+    gff_lines = body.create(ann, args.database, _worker["sample"], args, quiet=True)
+    return len(reads), gff_lines, (filter.tune_cache_stats(), stats)
+
+
+def _merge_block(lines, result, n_reads, n_hits):
+    reads, gff_lines, stats = result
+    filter.add_tune_cache_stats(*stats)
+    for chrom in gff_lines:
+        for start in gff_lines[chrom]:
+            if start not in lines[chrom]:
+                lines[chrom][start] = []
+            lines[chrom][start].extend(gff_lines[chrom][start])
+            n_hits += len(gff_lines[chrom][start])
+    return n_reads + reads, n_hits
 
 
 def low_memory_genomic_bam(bam_fn, sample, out_handle, args):
     logger.info("Reading BAM file in low memory mode.")
     logger.warning("This is under development and variants can be unexact.")
     precursors = args.precursors
-    bam_fn = _sam_to_bam(bam_fn)
-    bam_fn = _bam_sort(bam_fn)
     database = guess_database(args)
-    bed_fn = os.path.join(args.out, os.path.basename(bam_fn) + ".bed")
-    logger.info("Making bed file.")
-    _bed(bam_fn, bed_fn)
-    logger.info("Intersecting bed file.")
-    intersect_fn = intersect(bed_fn, args.gtf)
-    logger.info("Loading database.")
-    # TODO this'll return conn_reads and conn_counts
-    conn = _read_lifted_bam_alpha(intersect_fn, bam_fn, args)
-    rows = sql.select_all_reads(conn)
     lines = []
     current = None
-    logger.info("Analyzing database.")
-    for row in rows:
+    logger.info("Lifting alignments to precursors.")
+    for row in _lifted_rows(bam_fn, args):
         if not current or current == row[0]:
             lines.append(row)
             current = row[0]
@@ -135,11 +240,10 @@ def low_memory_genomic_bam(bam_fn, sample, out_handle, args):
     ann = annotate(reads, args.matures, args.precursors, quiet=True)
     gff_lines = body.create(ann, args.database, sample, args, quiet=True)
     body.write_body_on_handle(gff_lines, out_handle)
-    conn.close()
     logger.info("Done")
 
 
-def _analyze_line(line, reads, precursors, handle, args):
+def _analyze_line(line, reads, precursors, handle, args, pending=None):
     if line.reference_id < 0:
         logger.debug("READ::Sequence not mapped: %s" % line.reference_id)
         return reads
@@ -161,14 +265,13 @@ def _analyze_line(line, reads, precursors, handle, args):
     if line.is_reverse and not args.genomic:
         logger.debug("READ::Sequence is reverse: %s" % line.query_name)
         return reads
-    chrom = handle.getrname(line.reference_id)
+    chrom = line.reference_name
     start = line.reference_start
 
     cigar = line.cigartuples
     # if line.cigarstring.find("I") > -1:
     #     indels_skip += 1
     iso = isomir()
-    iso.align = line
     iso.set_pos(start, len(reads[query_name].sequence))
     logger.debug("READ::From BAM start %s end %s at chrom %s" % (iso.start, iso.end, chrom))
     if len(precursors[chrom].replace("N","")) + 3 < start + len(reads[query_name].sequence):
@@ -178,8 +281,13 @@ def _analyze_line(line, reads, precursors, handle, args):
                                              len(reads[query_name].sequence),
                                              len(precursors[chrom])))
         return reads
-    iso.subs, iso.add, iso.cigar = filter.tune(
-        reads[query_name].sequence, precursors[chrom],
+    if pending is not None:
+        pending.append((reads[query_name], chrom, iso,
+                        (reads[query_name].sequence, chrom, precursors[chrom],
+                         start, cigar)))
+        return reads
+    iso.subs, iso.add, iso.cigar = filter.tune_cached(
+        reads[query_name].sequence, chrom, precursors[chrom],
         start, cigar)
     logger.debug("READ::After tune start %s end %s" % (iso.start, iso.end))
     logger.debug("READ::iso add %s iso subs %s" % (iso.add, iso.subs))
@@ -187,49 +295,103 @@ def _analyze_line(line, reads, precursors, handle, args):
     return reads
 
 
+def _tune_pending(pending, results=None):
+    """Realign the hits saved by *_analyze_line()* and add them to the reads.
+
+    *results* is the output of *mirtop.bam.filter.tune_many()*
+    when the hits were realigned already."""
+    if results is None:
+        results = filter.tune_many([item[3] for item in pending])
+    for (hit, chrom, iso, _), (subs, add, cigar) in zip(pending, results):
+        iso.subs, iso.add, iso.cigar = subs, add, cigar
+        logger.debug("READ::iso add %s iso subs %s" % (iso.add, iso.subs))
+        hit.set_precursor(chrom, iso)
+    del pending[:]
+
+
 def _read_lines(lines, precursors, handle, args, clean=True):
     reads = defaultdict(hits)
+    pending = []
     for line in lines:
-        reads = _analyze_line(line, reads, precursors, handle, args)
+        reads = _analyze_line(line, reads, precursors, handle, args, pending)
+    _tune_pending(pending)
     if clean:
         reads = filter.clean_hits(reads)
     return reads
 
 
-def _read_lifted_bam_alpha(bed_fn, bam_fn, args):
+def _lifted_rows(bam_fn, args):
+    """
+    Lift the alignments of a BAM file with genomic coordinates
+    to the precursors they overlap, in the same strand.
+
+    Only the first hit of each read to a precursor is kept, and
+    only one hit by sequence (or by name with *args.keep_name*)
+    to the same position.
+
+    Args:
+        *bam_fn(str)*: BAM file mapped against the genome.
+
+        *args(namedtuple)*: arguments from command line.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+    Returns:
+        *(generator)* of (name, sequence, precursor, start) tuples.
+    """
     database = guess_database(args)
-    conn = sql.create_connection()
-    key = "name" if args.keep_name else "sequence"
-    sql.create_reads_table(conn, key)
-    # TODO create counts table sequence and autoincrement or from read
-    cur = conn.cursor()
-    counts = 0
+    precursors = intervals.index().load(args.gtf, database)
+    key = 0 if args.keep_name else 1
+    seen_positions = set()
     seen = set()
-    for line in bed_fn:
-        fields = _parse_intersect(line, database, bed=True)
-        # TODO add sequence to count table args.quant on/off name=UID or name=UID+chrom+pos
-        if fields:
-            hit = ".".join(fields[:3])
-            if hit not in seen:
-                counts += 1
-                sql.insert_row_in_reads_table(cur, fields)
-                seen.add(hit)
-        # if counts == 1000:
-        #     counts = 0
-    del(seen)
+    counts = 0
+    current = None
+    sequence = None
+    handle = group.open_bam(bam_fn)
+    for line in group.by_name(handle, args.out):
+        if line.reference_id < 0:
+            logger.debug("READ::Sequence not mapped: %s" % line.reference_id)
+            continue
+        if not line.cigarstring:
+            logger.debug("READ::Sequence malformed: %s" % line)
+            continue
+        query_name = line.query_name
+        if (not current or query_name != current) and not line.query_sequence:
+            continue
+        if not current or query_name != current:
+            sequence = line.query_sequence if not line.is_reverse else reverse_complement(line.query_sequence)
+            seen = set()
+        logger.debug(("READ::Read name:{0} and Read sequence:{1}").format(line.query_name, sequence))
+        if line.query_sequence and line.query_sequence.find("N") > -1:
+            continue
+        current = query_name
+        start = line.reference_start
+        end = start + len(sequence) - 1
+        strand = "+" if not line.is_reverse else "-"
+        for record in precursors.overlap(line.reference_name, start, end, strand):
+            row = (query_name, sequence, record[2],
+                   intervals.lift(record, start, end, strand))
+            if row[2] in seen:
+                continue
+            seen.add(row[2])
+            position = (row[key], row[2], row[3])
+            if position in seen_positions:
+                continue
+            seen_positions.add(position)
+            counts += 1
+            yield row
     logger.info("Read %s lines that intersected with miRNAs." % counts)
-    conn.commit()
-    # TODO this'll return conn_reads and conn_counts
-    return conn
 
 
 def _read_original_bam(bam_fn, reads, args, clean):
-    mode = "r" if bam_fn.endswith("sam") else "rb"
-    handle = pysam.Samfile(bam_fn, mode)
+    handle = group.open_bam(bam_fn)
     indels_skip = 0
     precursors = args.precursors
-    for line in handle:
-        reads = _analyze_line(line, reads, precursors, handle, args)
+    pending = []
+    for line in group.by_name(handle, args.out):
+        reads = _analyze_line(line, reads, precursors, handle, args, pending)
+        if len(pending) >= BLOCK_SIZE:
+            _tune_pending(pending)
+    _tune_pending(pending)
     logger.info("Hits: %s" % len(reads))
     logger.info("Hits with indels %s" % indels_skip)
     if clean:
@@ -238,26 +400,132 @@ def _read_original_bam(bam_fn, reads, args, clean):
     return reads
 
 
-def _parse_intersect(line, database, bed=False):
-    "Parse bedtools intersect between bam_bed file and gtf from database"
-    start_idx = 9 if bed else 15
-    end_idx = 10 if bed else 16
-    attr_idx = 14 if bed else 20
-    if str(line).find(get_primary_transcript(database)) < 0: # only working with mirbase
-        return None
-    query_name = line[3]
-    sequence = line[4]
-    chrom = line[attr_idx].strip().split("Name=")[-1]
-    start = line[1]
-    end = line[2]
-    strand = line[5]
-    if not start:
-        return None
-    if strand == "+":
-        start = int(start) - int(line[start_idx]) + 1
-    else:
-        start = int(line[end_idx]) - int(end)
-    return (query_name, sequence, chrom, start)
+def _by_region(bam_fn, args):
+    """
+    Whether only some precursors are read with --precursors, so they
+    are read with *fetch()* from the BAM index instead of grouping all
+    the alignments by name.
+    """
+    names = getattr(args, "precursor_names", None)
+    if not names:
+        return False
+    indexed = False
+    if not bam_fn.endswith("sam"):
+        handle = group.open_bam(bam_fn)
+        indexed = handle.has_index()
+        handle.close()
+    if not indexed:
+        raise ValueError("--precursors needs a BAM file sorted by"
+                         " coordinate and indexed: %s" % bam_fn)
+    return True
+
+
+def _regions(references, names=None):
+    """Precursors matching any of the comma separated patterns in *names*."""
+    if not names:
+        return list(references)
+    patterns = [p.strip() for p in names.split(",") if p.strip()]
+    return [ref for ref in references
+            if any(fnmatchcase(ref, p) for p in patterns)]
+
+
+def _read_region_bam(bam_fn, args, clean, threads=1):
+    """
+    Read the alignments of each precursor from an indexed BAM file.
+
+    Hits of the same read in different precursors are merged before
+    *mirtop.bam.filter.clean_hits()*, and reads are sorted by name,
+    so reading all the precursors gives the same result than
+    *_read_original_bam()*.
+
+    With only some precursors, the hits of a read in the other ones
+    are not read, so a read mapping to several precursors keeps its best
+    hits among the selected ones. It is not the same than reading the
+    whole file and keeping the lines of the selected precursors.
+
+    Args:
+        *bam_fn(str)*: BAM file sorted by coordinate and indexed.
+
+        *args(namedtuple)*: arguments from command line.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+        *clean(boolean)*: remove lower score hits.
+
+        *threads(int)*: number of processes reading precursors.
+
+    Returns:
+        *reads (dict)*:
+             keys are read_id and values are *mirtop.realign.hits*
+    """
+    handle = group.open_bam(bam_fn)
+    refs = _regions(handle.references, getattr(args, "precursor_names", None))
+    logger.info("Reading %s precursors from the BAM index." % len(refs))
+    if len(refs) < len(handle.references):
+        logger.warning("Reads mapping to other precursors than the selected"
+                       " ones only keep the best hits among the selected.")
+    pool = None
+    if threads > 1:
+        pool = multiprocessing.Pool(threads)
+    try:
+        found = _fetch_regions(handle, refs, args, pool, threads * 2)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    handle.close()
+    reads = defaultdict(hits)
+    for name in sorted(found, key=group.name_key):
+        reads[name] = found[name]
+    logger.info("Hits: %s" % len(reads))
+    if clean:
+        reads = filter.clean_hits(reads)
+        logger.info("Hits after clean: %s" % len(reads))
+    return reads
+
+
+def _fetch_regions(handle, refs, args, pool=None, max_queue=1):
+    """
+    Realign the alignments of the precursors in *refs*.
+
+    With a *pool*, blocks of hits are realigned in other processes,
+    with up to *max_queue* blocks waiting, and added to the reads
+    in the same order.
+    """
+    reads = defaultdict(hits)
+    pending = []
+    queue = deque()
+    for ref in refs:
+        for line in handle.fetch(ref):
+            reads = _analyze_line(line, reads, args.precursors, handle, args,
+                                  pending)
+            if len(pending) >= BLOCK_SIZE:
+                pending = _send_pending(pending, pool, queue, max_queue)
+    _send_pending(pending, pool, queue, 0)
+    return reads
+
+
+def _send_pending(pending, pool, queue, max_queue):
+    """Realign *pending* hits or send them to *pool*, adding the
+    results of the first blocks sent while more than *max_queue*
+    are waiting."""
+    if not pool:
+        _tune_pending(pending)
+        return pending
+    queue.append((pending, pool.apply_async(
+        _tune_block, ([item[3] for item in pending],))))
+    while len(queue) > max_queue:
+        pending, result = queue.popleft()
+        results, stats = result.get()
+        filter.add_tune_cache_stats(*stats)
+        _tune_pending(pending, results)
+    return []
+
+
+def _tune_block(items):
+    """*mirtop.bam.filter.tune_many()* in other process, returning
+    the cache stats too."""
+    stats = filter.tune_cache_stats()
+    return filter.tune_many(items), (filter.tune_cache_stats(), stats)
 
 
 def _analyze_lifted_line(line, reads, precursors, database):
@@ -274,7 +542,6 @@ def _analyze_lifted_line(line, reads, precursors, database):
     chrom = line[2]
     start = line[3]
     iso = isomir()
-    iso.align = line
     iso.set_pos(start, len(reads[query_name].sequence))
     logger.debug("READ::From BAM start %s end %s at chrom %s" % (iso.start, iso.end, chrom))
     if len(precursors[chrom]) < start + len(reads[query_name].sequence):
@@ -284,8 +551,8 @@ def _analyze_lifted_line(line, reads, precursors, database):
                                              len(reads[query_name].sequence),
                                              len(precursors[chrom])))
         return reads
-    iso.subs, iso.add, iso.cigar = filter.tune(
-        reads[query_name].sequence, precursors[chrom],
+    iso.subs, iso.add, iso.cigar = filter.tune_cached(
+        reads[query_name].sequence, chrom, precursors[chrom],
         start, None)
     logger.debug("READ::After tune start %s end %s" % (iso.start, iso.end))
     logger.debug("READ::iso add %s iso subs %s" % (iso.add, iso.subs))
@@ -303,38 +570,6 @@ def _read_lifted_lines(lines, precursors, database, clean=True):
     return reads
 
 
-def _read_lifted_bam(handle, reads, args, clean):
-    indels_skip = 0
-    precursors = args.precursors
-    database = guess_database(args)
-    for line in handle:
-        rows = _parse_intersect(line, database, bed=True)
-        reads = _analyze_lifted_line(rows, reads, precursors, database)
-    logger.info("Hits: %s" % len(reads))
-    logger.info("Hits with indels %s" % indels_skip)
-    if clean:
-        reads = filter.clean_hits(reads)
-        logger.info("Hits after clean: %s" % len(reads))
-    return reads
-
-
-def _sam_to_bam(bam_fn):
-    if not bam_fn.endswith("bam"):
-        bam_out = "%s.bam" % os.path.splitext(bam_fn)[0]
-        cmd = "samtools view -Sbh {bam_fn} -o {bam_out}"
-        do.run(cmd.format(bam_fn=quote(bam_fn), bam_out=quote(bam_out)))
-        return bam_out
-    return bam_fn
-
-
-def _bam_sort(bam_fn):
-    bam_sort_by_n = op.splitext(bam_fn)[0] + "_sort.bam"
-    if not file_exists(bam_sort_by_n):
-        do.run(("samtools sort -n -o {bam_sort_by_n} {bam_fn}").format(
-            bam_sort_by_n=quote(bam_sort_by_n), bam_fn=quote(bam_fn)))
-    return bam_sort_by_n
-
-
 def _get_freq(name):
     """
     Check if name read contains counts (_xNumber)
@@ -344,76 +579,3 @@ def _get_freq(name):
     except:
         return 0
     return counts
-
-
-def _bed(bam_fn, bed_fn):
-    mode = "r" if bam_fn.endswith("sam") else "rb"
-    handle = pysam.Samfile(bam_fn, mode)
-    current = None
-    if os.path.exists(bed_fn):
-        return bed_fn
-    with open(bed_fn, 'w') as outh:
-        for line in handle:
-            if line.reference_id < 0:
-                logger.debug("READ::Sequence not mapped: %s" % line.reference_id)
-                continue
-            if not line.cigarstring:
-                logger.debug("READ::Sequence malformed: %s" % line)
-                continue
-            query_name = line.query_name
-            if (not current or query_name!=current) and not line.query_sequence:
-                continue
-            if not current or query_name!=current:
-                sequence = line.query_sequence if not line.is_reverse else reverse_complement(line.query_sequence)
-            logger.debug(("READ::Read name:{0} and Read sequence:{1}").format(line.query_name, sequence))
-            if line.query_sequence and line.query_sequence.find("N") > -1:
-                continue
-            chrom = handle.getrname(line.reference_id)
-            start = line.reference_start
-            end = start + len(sequence) - 1
-            current = query_name
-            strand = "+" if not line.is_reverse else "-"
-            bed_line = "\t".join(list(map(str, [chrom, start, end, query_name, sequence, strand])))
-            outh.write(bed_line + '\n')
-
-
-def intersect(bam, gtf):
-    bampy = pybedtools.BedTool(bam)
-    gtfpy = pybedtools.BedTool(gtf)
-    return bampy.intersect(gtfpy, wo=True, bed=True, s=True)
-
-
-# deprecated from now on
-def _read_quick_lines(lines):
-    reads = defaultdict(hits)
-    for line in lines:
-        _analyze_quick_line(line, reads)
-    return reads
-
-
-def _analyze_quick_line(line, reads):
-    if line.reference_id < 0:
-        logger.debug("READ::Sequence not mapped: %s" % line.reference_id)
-        return reads
-    if not line.cigarstring:
-        logger.debug("READ::Sequence malformed: %s" % line)
-        return reads
-    query_name = line.query_name
-    if query_name not in reads and not line.query_sequence:
-        return reads
-    sequence = line.query_sequence if not line.is_reverse else reverse_complement(line.query_sequence)
-    logger.debug(("READ::Read name:{0} and Read sequence:{1}").format(line.query_name, sequence))
-    if line.query_sequence and line.query_sequence.find("N") > -1:
-        return reads
-    if query_name not in reads:
-        reads[query_name].set_sequence(sequence)
-        reads[query_name].counts = _get_freq(query_name)
-    return reads
-
-
-def _read_quick_bam(bam_fn, reads):
-    mode = "r" if bam_fn.endswith("sam") else "rb"
-    handle = pysam.Samfile(bam_fn, mode)
-    for line in handle:
-        reads = _analyze_quick_line(line, reads)
-    return reads
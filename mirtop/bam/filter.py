@@ -1,9 +1,27 @@
-from collections import defaultdict
-from mirtop.mirna.realign import hits, cigar_correction, make_cigar, align
+from collections import defaultdict, OrderedDict
+
+import numpy as np
+
+from mirtop.mirna.realign import hits, cigar_correction, make_cigar, align, \
+    cigar_from_mismatches
+from mirtop.mirna.nucleotides import mismatches, mismatch_matrix, \
+    count_mismatches, to_array
 import mirtop.libs.logger as mylog
 
 logger = mylog.getLogger(__name__)
 
+# max number of tune() results kept in memory,
+# the cache is shared by all the samples of a run
+CACHE_SIZE = 200000
+
+_tune_cache = OrderedDict()
+_tune_stats = {"hits": 0, "misses": 0}
+
+# min number of reads with the same size to use the numpy version of tune()
+MIN_BATCH = 16
+
+_AT = np.frombuffer(b"AT", dtype=np.uint8)
+
 
 def tune(seq, precursor, start, cigar):
     """
@@ -50,10 +68,7 @@ def tune(seq, precursor, start, cigar):
         logger.debug("TUNE:: %s %s" % (subs, add))
         return subs, "".join(add), make_cigar(seq, mature)
     
-    error = set()
-    for pos in range(0, len(seq)):
-        if seq[pos] != mature[pos]:
-            error.add(pos)
+    error = set(mismatches(seq, mature))
 
     prob = 0
     add_position = []
@@ -90,6 +105,221 @@ def tune(seq, precursor, start, cigar):
     return subs, "".join(add), make_cigar(seq, mature)
 
 
+def tune_cached(seq, chrom, precursor, start, cigar):
+    """
+    Same than *tune()* but remembering the last *CACHE_SIZE* results,
+    so the same sequence at the same position of a precursor is
+    only realigned once.
+
+    Args:
+        *seq (str)*: sequence of the read.
+
+        *chrom (str)*: name of the precursor.
+
+        *precursor (str)*: sequence of the precursor.
+
+        *start (int)*: start position of sequence on the precursor, +1.
+
+        *cigar (list)*: CIGAR as list of (operation, length) or None.
+
+    Returns:
+
+        *list* with subs, add and cigar as in *tune()*.
+    """
+    key = (seq, chrom, start, tuple(cigar) if cigar else None, precursor)
+    if key in _tune_cache:
+        _tune_stats["hits"] += 1
+        _tune_cache.move_to_end(key)
+        subs, add, cigar = _tune_cache[key]
+    else:
+        _tune_stats["misses"] += 1
+        subs, add, cigar = tune(seq, precursor, start, cigar)
+        _tune_cache[key] = (subs, add, cigar)
+        if len(_tune_cache) > CACHE_SIZE:
+            _tune_cache.popitem(last=False)
+    return [list(sub) for sub in subs], add, cigar
+
+
+def tune_many(items):
+    """
+    Same than *tune_cached()* for a list of hits.
+
+    Reads without indels whose alignment doesn't need to be computed
+    are grouped by size and compared with the precursor with numpy,
+    the rest use *tune()*.
+
+    Args:
+        *items(list)*: list of (seq, chrom, precursor, start, cigar) with
+            the arguments of *tune_cached()*.
+
+    Returns:
+
+        *list* with subs, add and cigar for each item as in *tune()*.
+    """
+    results = [None] * len(items)
+    todo = OrderedDict()
+    for idx, (seq, chrom, precursor, start, cigar) in enumerate(items):
+        key = (seq, chrom, start, tuple(cigar) if cigar else None, precursor)
+        cached = _tune_cache.get(key)
+        if cached:
+            _tune_cache.move_to_end(key)
+            results[idx] = cached
+        elif key in todo:
+            todo[key].append(idx)
+        else:
+            todo[key] = [idx]
+    _tune_stats["misses"] += len(todo)
+    _tune_stats["hits"] += len(items) - len(todo)
+    by_size = defaultdict(list)
+    for key in todo:
+        pair = _ungapped(*key)
+        if pair:
+            by_size[len(pair[0])].append((key, pair))
+        else:
+            _add_result(key, tune(key[0], key[4], key[2], key[3]),
+                        todo, results)
+    for size in by_size:
+        block = by_size[size]
+        if len(block) >= MIN_BATCH:
+            n_errors = count_mismatches([pair[0] for key, pair in block],
+                                        [pair[1] for key, pair in block])
+            block = []
+            for (key, pair), n in zip(by_size[size], n_errors):
+                # align() could add gaps to reads without CIGAR
+                # and more than one mismatch
+                if key[3] or n < 2:
+                    block.append((key, pair))
+                else:
+                    _add_result(key, tune(key[0], key[4], key[2], key[3]),
+                                todo, results)
+        if len(block) < MIN_BATCH:
+            for key, pair in block:
+                _add_result(key, tune(key[0], key[4], key[2], key[3]),
+                            todo, results)
+            continue
+        done = _tune_block([_fill_n(key, pair) for key, pair in block])
+        for (key, pair), result in zip(block, done):
+            _add_result(key, result, todo, results)
+    while len(_tune_cache) > CACHE_SIZE:
+        _tune_cache.popitem(last=False)
+    return [([list(sub) for sub in subs] if subs else [], add, cigar)
+            for subs, add, cigar in results]
+
+
+def _add_result(key, result, todo, results):
+    _tune_cache[key] = result
+    for idx in todo[key]:
+        results[idx] = result
+
+
+def _ungapped(seq, chrom, start, cigar, precursor):
+    """
+    Read and reference as *tune()* compares them when there are
+    no gaps: the CIGAR is only a match or there is no CIGAR and
+    the read has one mismatch at most, so *align()* doesn't add gaps
+    (see *mirtop.mirna.aligner*). None if there could be gaps, the
+    number of mismatches is checked later for all the reads with
+    the same size.
+    """
+    size = len(seq)
+    if start < 0 or size < 6:
+        return None
+    mature = precursor[start:start + size]
+    if len(mature) != size:
+        return None
+    if cigar and (len(cigar) != 1 or cigar[0] != (0, size)):
+        return None
+    return seq, mature
+
+
+def _fill_n(key, pair):
+    """N nts of a read without CIGAR are taken from the reference
+    as *align()* does."""
+    seq, mature = pair
+    if not key[3] and "N" in seq:
+        seq = "".join(ref if nt == "N" else nt for nt, ref in zip(seq, mature))
+    return seq, mature
+
+
+def _tune_block(pairs):
+    """
+    *tune()* for a list of (read, reference) pairs with the same size
+    and without gaps.
+    """
+    size = len(pairs[0][0])
+    seqs = to_array([seq for seq, mature in pairs])
+    errors = mismatch_matrix([seq for seq, mature in pairs],
+                             [mature for seq, mature in pairs])
+    # last 5 nts, starting from the 3' end as in tune()
+    tail = errors[:, ::-1][:, :5]
+    is_at = np.isin(seqs[:, ::-1][:, :5], _AT)
+    positions = np.arange(5)
+    has_error = tail.any(axis=1)
+    first = tail.argmax(axis=1)
+    # a matched nt that is not A/T before the first mismatch means no addition
+    blocked = ((positions < first[:, None]) & ~is_at).any(axis=1)
+    # the addition ends at the first match after the first mismatch
+    after = (positions > first[:, None]) & ~tail
+    end = np.where(after.any(axis=1), after.argmax(axis=1), 5)
+    add_size = np.where(has_error & ~blocked, end, 0)
+    perfect = ([], "", make_cigar("M" * size, "M" * size))
+    rows, cols = np.nonzero(errors)
+    ends = np.cumsum(np.bincount(rows, minlength=len(pairs))).tolist()
+    cols = cols.tolist()
+    add_size = add_size.tolist()
+    results = []
+    begin = 0
+    for idx in range(len(pairs)):
+        if begin == ends[idx]:
+            results.append(perfect)
+            continue
+        seq, mature = pairs[idx]
+        error = cols[begin:ends[idx]]
+        begin = ends[idx]
+        added = add_size[idx]
+        add = seq[:size - added - 1:-1] if added else ""
+        subs = []
+        for e in set(error):
+            if e < size - added:
+                subs.append([e, seq[e], mature[e]])
+        results.append((subs, add, cigar_from_mismatches(seq, error)))
+    return results
+
+
+def log_tune_cache():
+    """Log hits and misses of *tune_cached()*, including the ones
+    of other processes added with *add_tune_cache_stats()*."""
+    logger.info("Realignment cache: %s hits, %s misses, %s cached" % (
+        _tune_stats["hits"], _tune_stats["misses"], len(_tune_cache)))
+
+
+def tune_cache_stats():
+    """Hits and misses of *tune_cached()* in this process."""
+    return dict(_tune_stats)
+
+
+def add_tune_cache_stats(stats, before=None):
+    """
+    Add the hits and misses counted by other process to the ones
+    logged by *log_tune_cache()*.
+
+    Args:
+        *stats(dict)*: output of *tune_cache_stats()* in the other process.
+
+        *before(dict)*: output of *tune_cache_stats()* in the other process
+            before the work to add, so only the difference is added.
+    """
+    for key in _tune_stats:
+        _tune_stats[key] += stats[key] - (before[key] if before else 0)
+
+
+def clear_tune_cache():
+    """Remove all the results stored by *tune_cached()*."""
+    _tune_cache.clear()
+    _tune_stats["hits"] = 0
+    _tune_stats["misses"] = 0
+
+
 def clean_hits(reads):
     """
     Select only best matches from a list of hits from the same read.
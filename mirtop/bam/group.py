@@ -0,0 +1,136 @@
+"""Group the alignments of a SAM/BAM file by read name without samtools"""
+from __future__ import print_function
+
+import heapq
+import os
+import re
+import shutil
+import tempfile
+
+import pysam
+
+from mirtop.libs.utils import safe_dirs
+import mirtop.libs.logger as mylog
+
+logger = mylog.getLogger(__name__)
+
+# max number of alignments kept in memory before spilling to disk
+MAX_LINES = 500000
+
+_digits = re.compile(r"(\d+)")
+
+
+def open_bam(bam_fn):
+    """Open a SAM or BAM file with pysam."""
+    mode = "r" if bam_fn.endswith("sam") else "rb"
+    return pysam.AlignmentFile(bam_fn, mode)
+
+
+def is_grouped(header):
+    """
+    Check whether the header declares the file is already
+    grouped by read name (SO:queryname or GO:query).
+
+    Args:
+        *header(pysam.AlignmentHeader)*: header of the file.
+
+    Returns:
+        *(boolean)*.
+    """
+    hd = header.to_dict().get("HD", {})
+    return hd.get("SO") == "queryname" or hd.get("GO") == "query"
+
+
+def name_key(name, flag=0):
+    """
+    Sort key that follows the natural order of `samtools sort -n`,
+    numbers inside the name are compared as integers, read 1
+    goes before read 2 and the primary alignment goes before the
+    secondary and supplementary ones. Ties keep the input order.
+
+    Args:
+        *name(str)*: read name.
+
+        *flag(int)*: SAM flag.
+
+    Returns:
+        *(tuple)* to be used as sort key.
+    """
+    parts = _digits.split(name)
+    for idx in range(1, len(parts), 2):
+        parts[idx] = (int(parts[idx]), parts[idx])
+    return (parts, flag & 0xc0, flag & 0x900)
+
+
+def by_name(handle, tmp_dir=None, max_lines=MAX_LINES):
+    """
+    Iterate over the alignments of a file with all the alignments
+    of each read together.
+
+    If the header says the file is sorted by name, the file is
+    read as it is. Otherwise, alignments are sorted in blocks of
+    *max_lines* that are written to temporary files when the
+    file doesn't fit in one block and merged at the end.
+
+    Args:
+        *handle(pysam.AlignmentFile)*: file opened with *open_bam()*.
+
+        *tmp_dir(str)*: folder for the temporary files.
+
+        *max_lines(int)*: max number of alignments kept in memory.
+
+    Returns:
+        *(generator)* of pysam.AlignedSegment.
+    """
+    if is_grouped(handle.header):
+        logger.debug("GROUP::File sorted by name, no need to sort.")
+        for line in handle:
+            yield line
+        return
+    runs = []
+    block = []
+    tmp = None
+    try:
+        for line in handle:
+            block.append((name_key(line.query_name, line.flag),
+                          len(block), line))
+            if len(block) >= max_lines:
+                if not tmp:
+                    tmp = tempfile.mkdtemp(prefix="mirtop_sort",
+                                           dir=safe_dirs(tmp_dir) if tmp_dir else None)
+                runs.append(_spill(block, tmp, len(runs)))
+                block = []
+        block.sort()
+        if not runs:
+            for row in block:
+                yield row[2]
+            return
+        logger.info("Merging %s blocks of alignments sorted by name." % (len(runs) + 1))
+        runs.append(_spill(block, tmp, len(runs)))
+        del block
+        merged = heapq.merge(*[_read_run(fn, idx)
+                               for idx, fn in enumerate(runs)])
+        for row in merged:
+            yield pysam.AlignedSegment.fromstring(row[3], handle.header)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+def _spill(block, tmp, idx):
+    """Sort *block* and write it to disk, return the file name."""
+    block.sort()
+    fn = os.path.join(tmp, "run%s.sam" % idx)
+    with open(fn, 'w') as outh:
+        for row in block:
+            print(row[2].to_string(), file=outh)
+    return fn
+
+
+def _read_run(fn, idx):
+    """Yield sorted rows from a file written by *_spill()*."""
+    with open(fn) as inh:
+        for n, line in enumerate(inh):
+            line = line.rstrip("\n")
+            name, flag = line.split("\t", 2)[:2]
+            yield (name_key(name, int(flag)), idx, n, line)
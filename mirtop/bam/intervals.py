@@ -0,0 +1,108 @@
+"""Find the precursors overlapping genomic alignments without bedtools"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from mirtop.mirna.mapper import get_primary_transcript
+import mirtop.libs.logger as mylog
+
+logger = mylog.getLogger(__name__)
+
+
+class index:
+    """
+    Precursor positions of a GFF file sorted by start for each
+    chromosome and strand.
+
+    Positions are kept in BED coordinates (0-based, end not
+    included), the same than *bedtools intersect -s* uses.
+    """
+
+    def __init__(self):
+        self.starts = dict()
+        self.records = dict()
+        self.max_size = dict()
+
+    def load(self, gtf, database):
+        """
+        Load the primary transcripts of the file.
+
+        Args:
+            *gtf(str)*: GFF file with miRNA genomic positions.
+
+            *database(str)*: database name, see
+                *mirtop.mirna.mapper.get_primary_transcript()*.
+
+        Returns:
+            *self*.
+        """
+        primary = get_primary_transcript(database)
+        records = defaultdict(list)
+        with open(gtf) as inh:
+            for line in inh:
+                if line.startswith("#") or line.find(primary) < 0:
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 9:
+                    continue
+                name = cols[8].strip().split("Name=")[-1]
+                start, end = int(cols[3]), int(cols[4])
+                records[(cols[0], cols[6])].append((start - 1, end, name))
+        for key in records:
+            self.add(key[0], key[1], records[key])
+        logger.debug("INTERVALS::Precursors loaded: %s" % sum(
+            len(records[key]) for key in records))
+        return self
+
+    def add(self, chrom, strand, records):
+        """Add (start, end, name) records of a chromosome and strand."""
+        records = sorted(self.records.get((chrom, strand), []) + list(records))
+        self.records[(chrom, strand)] = records
+        self.starts[(chrom, strand)] = [r[0] for r in records]
+        self.max_size[(chrom, strand)] = max(r[1] - r[0] for r in records)
+
+    def overlap(self, chrom, start, end, strand):
+        """
+        Precursors overlapping at least one nt with an interval.
+
+        Args:
+            *chrom(str)*: chromosome.
+
+            *start(int)*: 0-based start.
+
+            *end(int)*: end, not included.
+
+            *strand(str)*: + or -.
+
+        Returns:
+            *(list)* of (start, end, name) records.
+        """
+        key = (chrom, strand)
+        if key not in self.starts:
+            return []
+        starts = self.starts[key]
+        first = bisect_right(starts, start - self.max_size[key])
+        last = bisect_left(starts, end)
+        return [r for r in self.records[key][first:last]
+                if r[1] > start and r[0] < end]
+
+
+def lift(record, start, end, strand):
+    """
+    Position of an alignment in the precursor.
+
+    Args:
+        *record(tuple)*: (start, end, name) from *index.overlap()*.
+
+        *start(int)*: 0-based start of the alignment.
+
+        *end(int)*: end of the alignment as written in the BED file
+            used with bedtools, start + size - 1.
+
+        *strand(str)*: + or -.
+
+    Returns:
+        *(int)*: 0-based start in the precursor.
+    """
+    if strand == "+":
+        return start - record[0]
+    return record[1] - end
@@ -14,7 +14,7 @@ from mirtop.gff import validator
 from mirtop.libs import spikeins
 from mirtop.gff import update
 from mirtop.sql import sql 
-from mirtop.mirna import mapper
+from mirtop.mirna import mapper, reference
 import mirtop.libs.logger as mylog
 
 import time
@@ -62,4 +62,7 @@ def main(**kwargs):
     elif "sql" in kwargs:
         logger.info("Run Convert GFF.")
         sql.sql_options(kwargs["args"])
+    elif "reference" in kwargs:
+        logger.info("Run reference compilation.")
+        reference.build(kwargs["args"])
     logger.info('It took %.3f minutes' % ((time.time()-start)/60))
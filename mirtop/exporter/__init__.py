@@ -1,15 +1,29 @@
-from mirtop.exporter import seqbuster, isomirs, fasta, vcf
+from mirtop.exporter import engine, seqbuster, isomirs, fasta, vcf
+
+# writer of each format, see *mirtop.exporter.engine*
+WRITERS = {"seqbuster": seqbuster.writer,
+           "isomir": isomirs.writer,
+           "fasta": fasta.writer,
+           "vcf": vcf.writer}
+
+
+def formats(text):
+    """
+    Formats of the --format option, separated by commas.
+    """
+    names = []
+    for name in text.split(","):
+        name = name.strip()
+        if name not in WRITERS:
+            raise ValueError("Format %s not in %s" % (name, ", ".join(sorted(WRITERS))))
+        if name not in names:
+            names.append(name)
+    return names
 
 
 def export(args):
     """
-    GFF3 to others formats
+    GFF3 to others formats, all the formats in --format
+    are written reading the GFF files once.
     """
-    if args.format == "seqbuster":
-        seqbuster.convert(args)
-    if args.format == "isomir":
-        isomirs.convert(args)
-    elif args.format == "fasta":
-        fasta.convert(args)
-    elif args.format == "vcf":
-        vcf.convert(args)
+    engine.export(args, [WRITERS[name] for name in formats(args.format)])
@@ -0,0 +1,233 @@
+"""Export GFF files into several formats reading them once
+
+Each line of a GFF file is decoded in one *record* and given to the
+writer of each format. The values that need the reference (sequence,
+5p/3p/add nts, substitutions...) are computed the first time a writer
+uses them and shared with the others.
+
+A writer is a class with:
+
+* *reference*: True if it needs the precursors and miRNA positions.
+* *__init__(fn, out_dir, ref, files)*: GFF file, output folder,
+  *mirtop.mirna.reference.bundle* and *handles* to write files.
+* *add(rec)*: for each *record* of the GFF file.
+* *close()*: after the last line.
+
+The files with one line for each sample (seqbuster) are written with
+*handles*, that keep the lines in memory and only MAX_OPEN files open
+at the same time.
+"""
+from collections import OrderedDict
+
+import mirtop.libs.logger as mylog
+from mirtop.mirna import reference
+from mirtop.gff.classgff import read_features
+from mirtop.gff.body import variant_nt
+from mirtop.mirna.realign import get_mature_sequence, align_from_variants
+from mirtop.mirna.realign import read_id, variant_to_5p, \
+                                 variant_to_3p, variant_to_add
+
+logger = mylog.getLogger(__name__)
+
+# files open at the same time
+MAX_OPEN = 256
+
+# lines kept for each file before writing them
+BUFFER_LINES = 1000
+
+# lines kept for all the files before writing them
+MAX_BUFFERED = 1000000
+
+
+class handles:
+    """
+    Buffered writers of many files, keeping at most *max_open*
+    files open. The least used file is closed when other is needed,
+    and opened to append the next lines.
+    """
+
+    def __init__(self, max_open=MAX_OPEN, buffer_lines=BUFFER_LINES):
+        self.max_open = max_open
+        self.buffer_lines = buffer_lines
+        self._open = OrderedDict()
+        self._buffers = dict()
+        self._started = set()
+        self._buffered = 0
+
+    def start(self, fn):
+        """Create *fn* empty, or truncate it if it was written before."""
+        self._buffered -= len(self._buffers.pop(fn, []))
+        if fn in self._open:
+            self._open.pop(fn).close()
+        self._started.discard(fn)
+        self._buffers[fn] = []
+
+    def write(self, fn, line):
+        """Add *line* (with the new line character) to *fn*."""
+        lines = self._buffers.setdefault(fn, [])
+        lines.append(line)
+        self._buffered += 1
+        if len(lines) >= self.buffer_lines:
+            self._flush(fn)
+        elif self._buffered >= MAX_BUFFERED:
+            self.flush()
+
+    def _handle(self, fn):
+        if fn in self._open:
+            self._open.move_to_end(fn)
+            return self._open[fn]
+        if len(self._open) >= self.max_open:
+            self._open.popitem(last=False)[1].close()
+        outh = open(fn, 'a' if fn in self._started else 'w')
+        self._started.add(fn)
+        self._open[fn] = outh
+        return outh
+
+    def _flush(self, fn):
+        lines = self._buffers.pop(fn, [])
+        self._buffered -= len(lines)
+        if lines or fn not in self._started:
+            self._handle(fn).write("".join(lines))
+
+    def flush(self):
+        """Write the lines of all the files."""
+        for fn in list(self._buffers):
+            self._flush(fn)
+
+    def close(self, fn=None):
+        """Write the lines and close *fn*, or all the files if None."""
+        if fn is not None:
+            self._flush(fn)
+            if fn in self._open:
+                self._open.pop(fn).close()
+            return
+        self.flush()
+        for outh in self._open.values():
+            outh.close()
+        self._open = OrderedDict()
+
+
+def _lazy(function):
+    """Property computed the first time is used."""
+    name = function.__name__
+
+    def get(self):
+        if name not in self._values:
+            self._values[name] = function(self)
+        return self._values[name]
+    return property(get, doc=function.__doc__)
+
+
+class record:
+    """GFF line decoded for all the writers."""
+
+    def __init__(self, gff, ref=None):
+        self.gff = gff
+        self.columns = gff.columns
+        self.attributes = gff.attributes
+        self.uid = self.attributes["UID"]
+        self.parent = self.attributes["Parent"]
+        self.name = self.attributes["Name"]
+        self.variant = self.attributes.get("Variant", "")
+        self.ref = ref
+        self._values = dict()
+
+    @_lazy
+    def read(self):
+        """Sequence of the UID, None if it is not valid."""
+        try:
+            return read_id(self.uid)
+        except KeyError:
+            return None
+
+    @_lazy
+    def expression(self):
+        """Counts of each sample as text."""
+        return self.attributes["Expression"].strip().split(",")
+
+    @property
+    def has_parent(self):
+        return self.parent in self.ref.precursors
+
+    @property
+    def has_mirna(self):
+        return self.name in self.ref.matures[self.parent]
+
+    @property
+    def precursor(self):
+        return self.ref.precursors[self.parent]
+
+    @property
+    def mature(self):
+        return self.ref.matures[self.parent][self.name]
+
+    @_lazy
+    def t5(self):
+        return variant_to_5p(self.precursor, self.mature, self.variant)
+
+    @_lazy
+    def t3(self):
+        return variant_to_3p(self.precursor, self.mature, self.variant)
+
+    @_lazy
+    def add(self):
+        return variant_to_add(self.read, self.variant)
+
+    @_lazy
+    def mm(self):
+        """Output of *mirtop.mirna.realign.align_from_variants()*."""
+        mature_sequence = get_mature_sequence(self.precursor, self.mature)
+        return align_from_variants(self.read, mature_sequence, self.variant)
+
+    @_lazy
+    def nt(self):
+        """Output of *mirtop.gff.body.variant_nt()*."""
+        return variant_nt(self.uid, self.parent, self.name, self.variant,
+                          self.ref.precursors, self.ref.matures)
+
+
+def run(files, out_dir, writers, ref=None):
+    """
+    Read each GFF file once and write it with all the writers.
+
+    Args:
+        *files(list)*: GFF files.
+
+        *out_dir(str)*: folder of the output files.
+
+        *writers(list)*: writer classes, see the module description.
+
+        *ref(mirtop.mirna.reference.bundle)*: reference needed by
+            the writers, if any.
+    """
+    pool = handles()
+    try:
+        for fn in files:
+            logger.info("Reading %s" % fn)
+            outputs = [writer(fn, out_dir, ref, pool) for writer in writers]
+            for gff in read_features(fn):
+                rec = record(gff, ref)
+                for output in outputs:
+                    output.add(rec)
+            for output in outputs:
+                output.close()
+    finally:
+        pool.close()
+
+
+def export(args, writers):
+    """
+    Load the reference once if any writer needs it and write
+    *args.files* with all the *writers*.
+
+    Args:
+        *args(namedtuple)*: arguments parsed from command line with
+            *mirtop.libs.parse.add_subparser_export()*.
+
+        *writers(list)*: writer classes, see the module description.
+    """
+    ref = None
+    if any(writer.reference for writer in writers):
+        ref = reference.load(args.hairpin, args.gtf, args.sps,
+                             getattr(args, "database", None))
+    run(args.files, args.out, writers, ref)
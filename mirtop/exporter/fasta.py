@@ -5,8 +5,7 @@ import os
 import sys
 
 import mirtop.libs.logger as mylog
-from mirtop.gff.classgff import feature
-from mirtop.mirna.realign import read_id
+from mirtop.exporter import engine
 
 logger = mylog.getLogger(__name__)
 
@@ -19,21 +18,35 @@ def convert(args):
       *args*: supported options for this sub-command.
         See *mirtop.libs.parse.add_subparser_export()*.
     """
-    for fn in args.files:
-        logger.info("Reading %s" % fn)
-        _process(fn, args.out)
+    engine.export(args, [writer])
 
 
 def _process(fn, out_dir):
-    if out_dir:
-        out_fasta = os.path.join(out_dir, "%s.fasta" %
-                                 os.path.splitext(os.path.basename(fn))[0])
-    outh = sys.stdout if not out_dir else open(out_fasta, 'w')
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            gff = feature(line)
-            attr = gff.attributes
-            read = read_id(attr["UID"])
-            print((">{0}\n{1}").format(attr["UID"], read), file=outh)
+    engine.run([fn], out_dir, [writer])
+
+
+class writer:
+    """One sequence for each line, to stdout if there is no *out_dir*."""
+
+    reference = False
+
+    def __init__(self, fn, out_dir, ref, files):
+        self.files = files
+        self.out_fasta = None
+        if out_dir:
+            self.out_fasta = os.path.join(out_dir, "%s.fasta" %
+                                          os.path.splitext(os.path.basename(fn))[0])
+            files.start(self.out_fasta)
+
+    def add(self, rec):
+        if rec.read is None:
+            return
+        line = (">{0}\n{1}\n").format(rec.uid, rec.read)
+        if self.out_fasta:
+            self.files.write(self.out_fasta, line)
+        else:
+            sys.stdout.write(line)
+
+    def close(self):
+        if self.out_fasta:
+            self.files.close(self.out_fasta)
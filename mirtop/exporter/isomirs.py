@@ -4,13 +4,7 @@ from __future__ import print_function
 import os
 
 import mirtop.libs.logger as mylog
-from mirtop.mirna import fasta, mapper
-from mirtop.gff.classgff import feature
-from mirtop.gff.header import read_samples
-from mirtop.mirna.realign import get_mature_sequence, align_from_variants
-from mirtop.mirna.realign import read_id, variant_to_5p, \
-                                 variant_to_3p, variant_to_add
-from mirtop.gff.body import variant_with_nt
+from mirtop.exporter import engine
 
 logger = mylog.getLogger(__name__)
 
@@ -23,79 +17,67 @@ def convert(args):
 
     Args:
         *args(namedtuple)*: arguments parsed from command line with
-            *mirtop.libs.parse.add_subparser_counts()*.
+            *mirtop.libs.parse.add_subparser_export()*.
 
     Returns:
         *file (file)*: with columns like:
-            UID miRNA Variant Sample1 Sample2 ... Sample N
+            seq mir mism add t5 t3 Sample1 Sample2 ... Sample N
     """
     logger.info("INFO Writing TSV file to directory %s", args.out)
-    for gff in args.files:
-        logger.info("INFO Reading GFF file %s", gff)
-        _convert_file(gff, args)
-
-
-def _convert_file(gff, args):
-    sep = "\t"
-    precursors = fasta.read_precursor(args.hairpin, args.sps)
-    matures = mapper.read_gtf_to_precursor(args.gtf, args.database)
-    variant_header = sep.join(['mism', 'add', 't5', 't3'])
-
-    gff_file = open(gff, 'r')
-    out_file = os.path.join(args.out, "%s_rawData.tsv" % os.path.splitext(os.path.basename(gff))[0])
-    missing_parent = 0
-    missing_mirna = 0
-    unvalid_uid = 0
-    with open(out_file, 'w') as outh:
-
-        for samples_line in gff_file:
-            if samples_line.startswith("## COLDATA:"):
-                samples = sep.join(samples_line.strip().split("COLDATA:")[1].strip().split(","))
-                header = sep.join(['seq', 'mir',
-                                   variant_header, samples])
-                print(header, file=outh)
-                break
-
-        for mirna_line in gff_file:
-            gff = feature(mirna_line)
-            attr = gff.attributes
-            UID = attr["UID"]
-            Read = attr["Read"]
-            mirna = attr["Name"]
-            parent = attr["Parent"]
-            # Handle missing 'Variant' key safely
-            variant = attr.get("Variant", "")  # Default to an empty string if missing
-            try:
-                Read = read_id(UID)
-            except KeyError:
-                unvalid_uid += 1
-                continue
-
-            expression = sep.join(attr["Expression"].strip().split(","))
-            cols_variants = sep.join(_expand(variant))
-            logger.debug("COUNTS::Read:%s" % Read)
-            logger.debug("COUNTS::EXTRA:%s" % variant)
-            if parent not in precursors:
-                missing_parent += 1
-                continue
-            if mirna not in matures[parent]:
-                missing_mirna += 1
-                continue
-            extra = variant_with_nt(mirna_line, precursors, matures)
-            if extra == "Invalid":
-                continue
-            logger.debug("COUNTS::EXTRA:%s" % extra)
-            cols_variants = sep.join(_expand(extra, True))
-            summary = sep.join([Read,  mirna,
-                                cols_variants, expression])
-            logger.debug(summary)
-            print(summary, file=outh)
-
-    gff_file.close()
-    logger.info("Missing Parents in hairpin file: %s" % missing_parent)
-    logger.info("Missing MiRNAs in GFF file: %s" % missing_mirna)
-    logger.info("Non valid UID: %s" % unvalid_uid)
-    logger.info("Output file is at %s" % out_file)
+    engine.export(args, [writer])
+
+
+class writer:
+    """*_rawData.tsv* file with the nts changes and the counts."""
+
+    reference = True
+
+    def __init__(self, fn, out_dir, ref, files):
+        self.sep = "\t"
+        self.files = files
+        self.out_file = os.path.join(out_dir, "%s_rawData.tsv" % os.path.splitext(os.path.basename(fn))[0])
+        self.missing_parent = 0
+        self.missing_mirna = 0
+        self.unvalid_uid = 0
+        files.start(self.out_file)
+        variant_header = self.sep.join(['mism', 'add', 't5', 't3'])
+        with open(fn) as inh:
+            for samples_line in inh:
+                if samples_line.startswith("## COLDATA:"):
+                    samples = self.sep.join(samples_line.strip().split("COLDATA:")[1].strip().split(","))
+                    header = self.sep.join(['seq', 'mir',
+                                            variant_header, samples])
+                    files.write(self.out_file, header + "\n")
+                    break
+
+    def add(self, rec):
+        if rec.read is None:
+            self.unvalid_uid += 1
+            return
+        logger.debug("COUNTS::Read:%s" % rec.read)
+        logger.debug("COUNTS::EXTRA:%s" % rec.variant)
+        if not rec.has_parent:
+            self.missing_parent += 1
+            return
+        if not rec.has_mirna:
+            self.missing_mirna += 1
+            return
+        extra = rec.nt
+        if extra == "Invalid":
+            return
+        logger.debug("COUNTS::EXTRA:%s" % extra)
+        cols_variants = self.sep.join(_expand(extra, True))
+        summary = self.sep.join([rec.read, rec.name, cols_variants,
+                                 self.sep.join(rec.expression)])
+        logger.debug(summary)
+        self.files.write(self.out_file, summary + "\n")
+
+    def close(self):
+        self.files.close(self.out_file)
+        logger.info("Missing Parents in hairpin file: %s" % self.missing_parent)
+        logger.info("Missing MiRNAs in GFF file: %s" % self.missing_mirna)
+        logger.info("Non valid UID: %s" % self.unvalid_uid)
+        logger.info("Output file is at %s" % self.out_file)
 
 
 def _expand(variant, nts=False):
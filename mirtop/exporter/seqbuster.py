@@ -1,80 +1,72 @@
-""" Read GFF files and output isomiRs compatible format"""
+""" Read GFF files and output seqbuster format"""
 from __future__ import print_function
 
 import os
 
 import mirtop.libs.logger as mylog
-from mirtop.mirna import fasta, mapper
-from mirtop.gff.classgff import feature
+from mirtop.exporter import engine
 from mirtop.gff.header import read_samples
-from mirtop.mirna.realign import get_mature_sequence, align_from_variants
-from mirtop.mirna.realign import read_id, variant_to_5p, \
-                                 variant_to_3p, variant_to_add
 
 logger = mylog.getLogger(__name__)
 
 
+HEADER = ["seq", "name", "freq", "mir", "start", "end",
+          "mism", "add", "t5", "t3", "s5", "s3", "DB",
+          "precursor", "ambiguity"]
+
+
 def convert(args):
     """
-    Main function to convert from GFF3 to isomiRs Bioc Package.
+    Main function to convert from GFF3 to seqbuster format.
 
     Args:
       *args*: supported options for this sub-command.
         See *mirtop.libs.parse.add_subparser_export()*.
     """
-    precursors = fasta.read_precursor(args.hairpin, args.sps)
-    matures = mapper.read_gtf_to_precursor(args.gtf)
-    for fn in args.files:
-        logger.info("Reading %s" % fn)
-        _read_file(fn, precursors, matures, args.out)
+    engine.export(args, [writer])
+
+
+class writer:
+    """One *.mirna* file for each sample with all the lines."""
+
+    reference = True
+
+    def __init__(self, fn, out_dir, ref, files):
+        self.files = files
+        self.outputs = [os.path.join(out_dir, "%s.mirna" % sample)
+                        for sample in read_samples(fn)]
+        self.missing = 0
+        for out_file in self.outputs:
+            files.start(out_file)
+            files.write(out_file, "\t".join(HEADER) + "\n")
 
+    def add(self, rec):
+        if rec.read is None or not rec.has_parent or not rec.has_mirna:
+            self.missing += 1
+            return
+        mm = rec.mm
+        if len(mm) > 1:
+            return
+        elif len(mm) == 1:
+            mm = "".join(list(map(str, mm[0])))
+        else:
+            mm = "0"
+        attr = rec.attributes
+        hit = attr["Hits"] if "Hits" in attr else "1"
+        logger.debug("exporter::isomir::decode %s" % [rec.variant,
+                                                      rec.t5, rec.t3,
+                                                      rec.add, mm])
+        line = [rec.read, attr["Read"], "0", rec.name,
+                rec.columns['source'], rec.columns['type'],
+                mm, rec.add, rec.t5, rec.t3, "NA", "NA", "miRNA",
+                rec.parent, hit]
+        for out_file, counts in zip(self.outputs, rec.expression):
+            line[2] = counts
+            self.files.write(out_file, "\t".join(line) + "\n")
 
-def _read_file(fn, precursors, matures, out_dir):
-    samples = read_samples(fn)
-    for sample in samples:
-        with open(os.path.join(out_dir, "%s.mirna" % sample), 'w') as outh:
-            print("\t".join(
-                ["seq", "name", "freq", "mir", "start", "end",
-                 "mism", "add", "t5", "t3", "s5", "s3", "DB",
-                 "precursor", "ambiguity"]), file=outh)
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            gff = feature(line)
-            cols = gff.columns
-            attr = gff.attributes
-            read = read_id(attr["UID"])
-            t5 = variant_to_5p(precursors[attr["Parent"]],
-                               matures[attr["Parent"]][attr["Name"]],
-                               attr["Variant"])
-            t3 = variant_to_3p(precursors[attr["Parent"]],
-                               matures[attr["Parent"]][attr["Name"]],
-                               attr["Variant"])
-            add = variant_to_add(read,
-                                 attr["Variant"])
-            mature_sequence = get_mature_sequence(
-                precursors[attr["Parent"]],
-                matures[attr["Parent"]][attr["Name"]])
-            mm = align_from_variants(read,
-                                     mature_sequence,
-                                     attr["Variant"])
-            if len(mm) > 1:
-                continue
-            elif len(mm) == 1:
-                mm = "".join(list(map(str, mm[0])))
-            else:
-                mm = "0"
-            hit = attr["Hits"] if "Hits" in attr else "1"
-            logger.debug("exporter::isomir::decode %s" % [attr["Variant"],
-                                                          t5, t3, add, mm])
-            # Error if attr["Read"] doesn't exist
-            # print(cols)
-            line = [read, attr["Read"], "0", attr["Name"],
-                    cols['source'], cols['type'],
-                    mm, add, t5, t3, "NA", "NA", "miRNA", attr["Parent"], hit]
-            for sample, counts in zip(samples, attr["Expression"].split(",")):
-                with open(os.path.join(out_dir, "%s.mirna" % sample),
-                          'a') as outh:
-                    line[2] = counts
-                    print("\t".join(line), file=outh)
+    def close(self):
+        if self.missing:
+            logger.info("Lines with UID, Parent or Name not in the "
+                        "reference: %s" % self.missing)
+        for out_file in self.outputs:
+            self.files.close(out_file)
@@ -1,14 +1,15 @@
 """mirGFF3 proxy converter"""
 from __future__ import print_function
 
+import copy
+import multiprocessing
 import os.path as op
 
-from mirtop.mirna import fasta, mapper
-from mirtop.bam.bam import read_bam
+from mirtop.mirna import mapper, reference
+from mirtop.bam import bam, filter
 from mirtop.importer import seqbuster, srnabench, prost, isomirsea, manatee, optimir
 from mirtop.mirna.annotate import annotate
 from mirtop.gff import body, header, merge, read
-from mirtop.mirna.mapper import read_gtf_to_mirna
 import mirtop.libs.logger as mylog
 logger = mylog.getLogger(__name__)
 
@@ -26,75 +27,147 @@ def reader(args):
     else:
         database = args.database
     args.database = database
-    precursors = fasta.read_precursor(args.hairpin, args.sps)
-    args.precursors = precursors
-    matures = mapper.read_gtf_to_precursor(args.gtf,database)
-    args.matures = matures
+    ref = reference.load(args.hairpin, args.gtf, args.sps, database)
+    args.precursors = ref.precursors
+    args.matures = ref.matures
     # TODO check numbers of miRNA and precursors read
     # TODO print message if numbers mismatch
-    out_dts = dict()
     if args.keep_name and len(args.files) > 1:
         logger.warning("--keep-name when running multiple samples\n"
                        "can generate wrong results if the\n"
                        "name read is different across sample\n"
                        "for the same sequence.")
-    for fn in args.files:
-        fn = op.normpath(fn)
-        if args.format != "gff":
-            sample = op.splitext(op.basename(fn))[0]
-            samples.append(sample)
-            fn_out = op.join(args.out, sample + ".%s" % args.out_format)
-        if args.format == "BAM":
-            reads = _read_bam(fn, args)
-        elif args.format == "seqbuster":
-            reads = seqbuster.read_file(fn, args)
-        elif args.format == "srnabench":
-            out_dts[fn] = srnabench.read_file(fn, args)
-        elif args.format == "prost":
-            reads = prost.read_file(fn, precursors, database, args.gtf)
-        elif args.format == "isomirsea":
-            out_dts[fn] = isomirsea.read_file(fn, args)
-        elif args.format == "manatee":
-            out_dts[fn] = manatee.read_file(fn, database, args)
-        elif args.format == "optimir":
-            out_dts[fn] = optimir.read_file(fn, args)
-        elif args.format == "gff":
-            samples.extend(header.read_samples(fn))
-            out_dts[fn] = body.read(fn, args)
-            continue
-        if args.format not in ["isomirsea", "srnabench", "manatee", 'optimir']:
-            ann = annotate(reads, matures, precursors)
-            out_dts[fn] = body.create(ann, database, sample, args)
-        h = header.create([sample], database, header.make_tools(args.format))
-        _write(out_dts[fn], h, fn_out, args)
-    # merge all reads for all samples into one dict
-    if args.low_memory:
-        return None
-    merged = merge.merge(out_dts, samples)
-    fn_merged_out = op.join(args.out, "%s.%s" % (args.prefix, args.out_format))
-    _write(merged, header.create(samples, database, header.make_tools([args.format])), fn_merged_out, args)
+    merged = merge.merger(args.out)
+    try:
+        for file_samples, lines in _process_files(args):
+            samples.extend(file_samples)
+            # only the merged file needs the sample from now on
+            merged.add(lines)
+        if args.format in ["BAM", "seqbuster"]:
+            filter.log_tune_cache()
+        # merge all reads for all samples into one file
+        fn_merged_out = op.join(args.out, "%s.%s" % (args.prefix, args.out_format))
+        _write_hits(merged.merged(samples),
+                    header.create(samples, database, header.make_tools([args.format])),
+                    fn_merged_out, args)
+    finally:
+        merged.close()
+
+
+def _process_files(args):
+    """
+    Process the input files one by one, or *args.jobs* at the same
+    time, in the order they are given.
+
+    The processes are forked after the precursors and matures are
+    loaded, so they share them with this one.
+
+    Returns:
+        *(generator)* of the output of *_process_file()* for each file.
+    """
+    jobs = min(getattr(args, "jobs", 1) or 1, len(args.files))
+    if jobs < 2:
+        for fn in args.files:
+            yield _process_file(fn, args)
+        return
+    if getattr(args, "threads", 1) > 1:
+        logger.warning("--threads is ignored when running with --jobs.")
+    logger.info("Processing %s files with %s jobs" % (len(args.files), jobs))
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(args,))
+    try:
+        for result in pool.imap(_process_worker, args.files):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+_worker = {}
+
+
+def _init_worker(args):
+    args = copy.copy(args)
+    args.threads = 1
+    _worker["args"] = args
+
+
+def _process_worker(fn):
+    return _process_file(fn, _worker["args"])
+
+
+def _process_file(fn, args):
+    """
+    Realign and annotate a file, and write the GFF file of the sample.
+
+    Args:
+        *fn(str)*: input file in *args.format*.
+
+        *args(namedtuple)*: arguments from command line with
+            precursors, matures and database already loaded.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+    Returns:
+        *(tuple)* with the list of samples in the file and the
+            lines as defined in *mirtop.gff.body.read()*.
+    """
+    fn = op.normpath(fn)
+    if args.format == "gff":
+        return header.read_samples(fn), body.read(fn, args)
+    sample = op.splitext(op.basename(fn))[0]
+    fn_out = op.join(args.out, sample + ".%s" % args.out_format)
+    lines = None
+    if args.format == "BAM" and getattr(args, "threads", 1) > 1 \
+            and not args.genomic:
+        logger.info("Reading %s with %s threads" % (fn, args.threads))
+        lines = bam.read_bam_parallel(fn, sample, args)
+    elif args.format == "BAM":
+        reads = _read_bam(fn, args)
+    elif args.format == "seqbuster":
+        reads = seqbuster.read_file(fn, args)
+    elif args.format == "srnabench":
+        lines = srnabench.read_file(fn, args)
+    elif args.format == "prost":
+        reads = prost.read_file(fn, args.precursors, args.database, args.gtf)
+    elif args.format == "isomirsea":
+        lines = isomirsea.read_file(fn, args)
+    elif args.format == "manatee":
+        lines = manatee.read_file(fn, args.database, args)
+    elif args.format == "optimir":
+        lines = optimir.read_file(fn, args)
+    if lines is None:
+        ann = annotate(reads, args.matures, args.precursors)
+        lines = body.create(ann, args.database, sample, args)
+    h = header.create([sample], args.database, header.make_tools(args.format))
+    _write(lines, h, fn_out, args)
+    return [sample], lines
 
 
 def _write(lines, header, fn, args = None):
+    _write_hits((hit for m in lines
+                 for s in sorted(lines[m].keys())
+                 for hit in lines[m][s]), header, fn, args)
+
+
+def _write_hits(hits, header, fn, args = None):
     out_handle = open(fn, 'w')
     print(header, file=out_handle)
-    mapper = read_gtf_to_mirna(args.gtf)
-    for m in lines:
-        for s in sorted(lines[m].keys()):
-            for hit in lines[m][s]:
-                # TODO: convert to genomic if args.out_genomic
-                if args and args.out_genomic:
-                    lifted = body.lift_to_genome(hit[4], mapper)
-                    print(lifted, file=out_handle)
-                else:
-                    print(hit[4], file=out_handle)
+    if args and args.out_genomic:
+        mapper = reference.load(args.hairpin, args.gtf, args.sps,
+                                args.database).genomic
+    for hit in hits:
+        # TODO: convert to genomic if args.out_genomic
+        if args and args.out_genomic:
+            lifted = body.lift_to_genome(hit[4], mapper)
+            print(lifted, file=out_handle)
+        else:
+            print(hit[4], file=out_handle)
     out_handle.close()
 
 
 def _read_bam(bam_fn, precursors):
     if bam_fn.endswith("bam") or bam_fn.endswith("sam"):
         logger.info("Reading %s" % bam_fn)
-        reads = read_bam(bam_fn, precursors)
+        reads = bam.read_bam(bam_fn, precursors)
     else:
         raise ValueError("Format not recognized."
                          " Only working with BAM/SAM files.")
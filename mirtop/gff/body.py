@@ -1,16 +1,24 @@
 """GFF reader and creator helpers"""
 from __future__ import print_function
 
+import multiprocessing
 from collections import defaultdict, OrderedDict
 from mirtop.mirna.realign import get_mature_sequence, align_from_variants, \
     read_id, variant_to_5p, variant_to_3p, variant_to_add, \
     is_sequence, make_id
 from mirtop.gff.header import read_samples
-from mirtop.gff.classgff import feature
+from mirtop.gff.classgff import feature, read_features
+from mirtop.mirna.annotate import annotate
 
 import mirtop.libs.logger as mylog
 logger = mylog.getLogger(__name__)
 
+# results of *variant_nt()* kept in memory
+CACHE_SIZE = 100000
+
+_nt = {"precursors": None, "matures": None}
+_nt_cache = dict()
+
 
 def read(fn, args):
     """Read GTF/GFF file and load into annotate, chrom counts, sample, line"""
@@ -18,51 +26,47 @@ def read(fn, args):
     lines = defaultdict(dict)
     sep = " " if args.out_format == "gtf" else "="
     corrupted_uid = 0
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            line = paste_columns(feature(line), sep=sep)
-            gff = feature(line)
-            cols = gff.columns
-            attr = gff.attributes
-            if attr['UID'] and not read_id(attr['UID']):
-                corrupted_uid += 1
-                continue
-            if 'UID' not in attr:
-                msg = "UID not found."
-                if 'Read' not in attr:
-                    if not is_sequence(attr['Read']):
-                        msg = msg + " Sequence not valid in Read attribute."
-                    else:
-                        attr['UID'] = make_id(attr['Read'])
-                if 'sequence' not in attr:
-                    msg = msg + " Sequence not found in sequence attribute."
-                    if not is_sequence(attr['sequence']):
-                        msg = msg + " Sequence not valid in sequence attribute."
-                    else:
-                        attr['UID'] = make_id(attr['Read'])
-            if 'UID' not in attr:
-                logger.warning("Line is not a valid GFF3 line: %s" %
-                               line.strip())
-                logger.warning(msg)
-
-            if cols['start'] not in lines[cols['chrom']]:
-                lines[cols['chrom']][cols['start']] = []
-
-            # Handle missing 'Variant' key
-            variant_attr = attr.get('Variant', '')  # Default to 'NA' if missing
-            uid = "%s-%s-%s" % (attr['UID'],
-                                variant_attr,
-                                attr['Name'])
-            if args.keep_name:
-                uid = "%s-%s" % (uid, attr['Read'])
-            lines[cols['chrom']][cols['start']].append(
-                [uid,
-                 cols['chrom'],
-                 attr['Expression'].strip().split(","),
-                 samples,
-                 line.strip()])
+    for gff in read_features(fn):
+        line = paste_columns(gff, sep=sep)
+        cols = gff.columns
+        attr = gff.attributes
+        if attr['UID'] and not read_id(attr['UID']):
+            corrupted_uid += 1
+            continue
+        if 'UID' not in attr:
+            msg = "UID not found."
+            if 'Read' not in attr:
+                if not is_sequence(attr['Read']):
+                    msg = msg + " Sequence not valid in Read attribute."
+                else:
+                    attr['UID'] = make_id(attr['Read'])
+            if 'sequence' not in attr:
+                msg = msg + " Sequence not found in sequence attribute."
+                if not is_sequence(attr['sequence']):
+                    msg = msg + " Sequence not valid in sequence attribute."
+                else:
+                    attr['UID'] = make_id(attr['Read'])
+        if 'UID' not in attr:
+            logger.warning("Line is not a valid GFF3 line: %s" %
+                           line.strip())
+            logger.warning(msg)
+
+        if cols['start'] not in lines[cols['chrom']]:
+            lines[cols['chrom']][cols['start']] = []
+
+        # Handle missing 'Variant' key
+        variant_attr = attr.get('Variant', '')  # Default to 'NA' if missing
+        uid = "%s-%s-%s" % (attr['UID'],
+                            variant_attr,
+                            attr['Name'])
+        if args.keep_name:
+            uid = "%s-%s" % (uid, attr['Read'])
+        lines[cols['chrom']][cols['start']].append(
+            [uid,
+             cols['chrom'],
+             attr['Expression'].strip().split(","),
+             samples,
+             line.strip()])
     logger.info("Lines skipped due to corrupted UID: %s" % corrupted_uid)
     return lines
 
@@ -76,15 +80,96 @@ def write_body_on_handle(lines, out_handle):
 
 def create(reads, database, sample, args, quiet=False):
     """Read https://github.com/miRTop/mirtop/issues/9"""
+    stats = defaultdict(int)
+    lines = defaultdict(defaultdict)
+    for r, start, hit in _create_hits(reads, database, sample, args, stats):
+        if start not in lines[hit[1]]:
+            lines[hit[1]][start] = []
+        lines[hit[1]][start].append(hit)
+    if not quiet:
+        logger.info("GFF miRNAs: %s" % len(lines))
+        logger.info("GFF hits %s by %s reads" % (stats["hits"], stats["reads"]))
+        logger.info("Filtered by being duplicated: %s" % stats["seen"])
+        logger.info("Filtered by being outside miRNA positions:"
+                    " %s" % stats["precursor"])
+        logger.info("Filtered by being low score: %s" % stats["score"])
+    return lines
+
+
+def create_by_read(reads, database, sample, args):
+    """
+    Same hits than *create()* in a list sorted by read, in the order
+    of *reads*, and then as *write_body_on_handle()* writes the lines
+    of each read.
+
+    Args:
+        *reads(dict)*: keys are read_id and values are
+            *mirtop.realign.hits*, already annotated.
+
+        *database(str)*: database name.
+
+        *sample(str)*: sample name.
+
+        *args(namedtuple)*: arguments from command line.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+    Returns:
+        *(list)*: hits as in the lists of *create()*.
+    """
+    keys = []
+    current = None
+    n_read = -1
+    for idx, (r, start, hit) in enumerate(
+            _create_hits(reads, database, sample, args, defaultdict(int),
+                         by_read=True)):
+        if r != current:
+            current = r
+            n_read += 1
+            chroms = dict()
+        chrom = chroms.setdefault(hit[1], len(chroms))
+        keys.append(((n_read, chrom, start, idx), hit))
+    keys.sort(key=lambda item: item[0])
+    return [hit for key, hit in keys]
+
+
+def write_chunk(reads, sample, args, out_handle):
+    """
+    Annotate a chunk of reads and write their GFF lines read by read,
+    in the same order than creating and writing the lines of each
+    read by itself.
+
+    Args:
+        *reads(dict)*: keys are read_id and values are
+            *mirtop.realign.hits*.
+
+        *sample(str)*: sample name.
+
+        *args(namedtuple)*: arguments from command line with
+            precursors, matures and database already loaded.
+            See *mirtop.libs.parse.add_subparser_gff()*.
+
+        *out_handle(file)*: handle where the lines are written.
+    """
+    ann = annotate(reads, args.matures, args.precursors, quiet=True)
+    for hit in create_by_read(ann, args.database, sample, args):
+        print(hit[4], file=out_handle)
+
+
+def _create_hits(reads, database, sample, args, stats, by_read=False):
+    """
+    Create the GFF hits of *create()*.
+
+    With *by_read*, the same isomiR from different sequences is only
+    logged when it comes from the same read, as creating each read
+    by itself.
+
+    Returns:
+        *(generator)* of (read_id, start, hit) in the order of *reads*,
+            counting the reads, hits and filtered isomiRs in *stats*.
+    """
     sep = " " if args.out_format == "gtf" else "="
     seen = set()
-    lines = defaultdict(defaultdict)
     seen_ann = {}
-    filter_precursor = 0
-    filter_score = 0
-    n_hits = 0
-    n_reads = 0
-    n_seen = 0
     if args.add_extra:
         precursors = args.precursors
         matures = args.matures
@@ -93,12 +178,14 @@ def create(reads, database, sample, args, quiet=False):
         [hits.add(mature.mirna) for mature in read.precursors.values()
             if mature.mirna]
         hits = len(hits)
+        if by_read:
+            seen_ann = {}
         if len(read.precursors) > 0:
-            n_reads += 1
+            stats["reads"] += 1
         for (ps, iso) in read.precursors.items():
             p = list(ps)[0]
             if not iso.mirna:
-                filter_precursor += 1
+                stats["precursor"] += 1
                 continue
             if (r, iso.mirna) not in seen:
                 seen.add((r, iso.mirna))
@@ -106,7 +193,7 @@ def create(reads, database, sample, args, quiet=False):
                 seq = reads[r].sequence
                 seq_name = seq if not args.keep_name else r
                 if iso.get_score(len(seq)) < 1:
-                    filter_score += 1
+                    stats["score"] += 1
                     continue
                 if iso.subs:
                     iso.subs = [] if "N" in iso.subs[0] else iso.subs
@@ -135,7 +222,8 @@ def create(reads, database, sample, args, quiet=False):
                 line = feature(fields).line
                 logger.debug("GFF::%s" % line)
                 if args.add_extra:
-                    extra = variant_with_nt(line, precursors, matures)
+                    extra = variant_nt(idseq, preName, mirName, Variant,
+                                       precursors, matures)
                     line = "%s Changes %s;" % (line, extra)
 
                 if annotation in seen_ann and seq.find("N") < 0 and (
@@ -146,22 +234,11 @@ def create(reads, database, sample, args, quiet=False):
                                             seen_ann[annotation]))
                 seen_ann[annotation] = line
                 logger.debug("GFF::external %s" % iso.external)
-                if start not in lines[chrom]:
-                    lines[chrom][start] = []
-                lines[chrom][start].append([annotation, chrom,
-                                            counts, sample, line])
                 logger.debug("GFF::%s" % line)
-                n_hits += 1
+                stats["hits"] += 1
+                yield r, start, [annotation, chrom, counts, sample, line]
             else:
-                n_seen += 1
-    if not quiet:
-        logger.info("GFF miRNAs: %s" % len(lines))
-        logger.info("GFF hits %s by %s reads" % (n_hits, n_reads))
-        logger.info("Filtered by being duplicated: %s" % n_seen)
-        logger.info("Filtered by being outside miRNA positions:"
-                    " %s" % filter_precursor)
-        logger.info("Filtered by being low score: %s" % filter_score)
-    return lines
+                stats["seen"] += 1
 
 
 def lift_to_genome(line, mapper):
@@ -252,7 +329,8 @@ def create_line(read, name, database, args):
                 "\t{score}\t{strand}\t.\t{attrb}").format(**locals())
         logger.debug("GFF::%s" % line)
         if args.add_extra:
-            extra = variant_with_nt(line, precursors, matures)
+            extra = variant_nt(idseq, preName, mirName, Variant,
+                               precursors, matures)
             line = "%s Changes %s;" % (line, extra)
 
         line = feature(line).paste_columns(sep)
@@ -338,33 +416,120 @@ def variant_with_nt(line, precursors, matures):
     using Variant attribute, precursor sequences and
     mature position.
     """
-    gff = feature(line)
-    attr = gff.attributes
-    read = read_id(attr["UID"])
-    attr["Parent"] = attr["Parent"].split(",")[0]
-    if attr["Parent"] not in matures:
-        logger.warning("Parent miRNA not found in database %s" % attr["Parent"])
+    attr = feature(line).attributes
+    # Handle missing 'Variant' key safely
+    return variant_nt(attr["UID"], attr["Parent"], attr["Name"],
+                      attr.get("Variant", ""), precursors, matures)
+
+
+def variant_nt(uid, parent, name, variant, precursors, matures):
+    """
+    Same as *variant_with_nt()* from the attributes of the line.
+
+    The result only depends on the attributes, so the last CACHE_SIZE
+    results are kept while *precursors* and *matures* are the same.
+
+    Args:
+        *uid(str)*: UID attribute.
+
+        *parent(str)*: Parent attribute, only the first one is used.
+
+        *name(str)*: Name attribute.
+
+        *variant(str)*: Variant attribute.
+
+        *precursors(dict)*: output of *mirtop.mirna.fasta.read_precursor()*.
+
+        *matures(dict)*: output of *mirtop.mirna.mapper.read_gtf_to_precursor()*.
+
+    Returns:
+        *(str)*: iso_5p:nts,iso_3p:nts,iso_add3p:nts,iso_snv:changes,
+            "Invalid" or "" if the miRNA is not in the database.
+    """
+    if _nt["precursors"] is not precursors or _nt["matures"] is not matures:
+        _nt["precursors"], _nt["matures"] = precursors, matures
+        _nt_cache.clear()
+    key = (uid, parent, name, variant)
+    value = _nt_cache.get(key)
+    if value is None:
+        if len(_nt_cache) >= CACHE_SIZE:
+            _nt_cache.clear()
+        value = _nt_cache[key] = _variant_nt(uid, parent, name, variant,
+                                             precursors, matures)
+    return value
+
+
+def variants_nt(keys, precursors, matures, jobs=1):
+    """
+    Run *variant_nt()* for many lines, in *jobs* processes.
+
+    Args:
+        *keys(list)*: (UID, Parent, Name, Variant) of each line.
+
+        *precursors(dict)*: output of *mirtop.mirna.fasta.read_precursor()*.
+
+        *matures(dict)*: output of *mirtop.mirna.mapper.read_gtf_to_precursor()*.
+
+        *jobs(int)*: number of processes.
+
+    Returns:
+        *(list)*: output of *variant_nt()* for each line.
+    """
+    if jobs > 1:
+        if _nt["precursors"] is not precursors or _nt["matures"] is not matures:
+            _nt["precursors"], _nt["matures"] = precursors, matures
+            _nt_cache.clear()
+        missing = list(OrderedDict.fromkeys(k for k in keys if k not in _nt_cache))
+        if len(missing) > jobs:
+            if len(_nt_cache) + len(missing) > CACHE_SIZE:
+                _nt_cache.clear()
+            pool = multiprocessing.Pool(jobs, initializer=_init_nt_worker,
+                                        initargs=(precursors, matures))
+            try:
+                values = pool.map(_nt_worker, missing,
+                                  chunksize=max(1, len(missing) // (jobs * 4)))
+            finally:
+                pool.close()
+                pool.join()
+            _nt_cache.update(zip(missing, values))
+    return [variant_nt(uid, parent, name, variant, precursors, matures)
+            for uid, parent, name, variant in keys]
+
+
+def _init_nt_worker(precursors, matures):
+    _nt["precursors"], _nt["matures"] = precursors, matures
+    _nt_cache.clear()
+
+
+def _nt_worker(key):
+    return _variant_nt(*(key + (_nt["precursors"], _nt["matures"])))
+
+
+def _variant_nt(uid, parent, name, variant, precursors, matures):
+    read = read_id(uid)
+    parent = parent.split(",")[0]
+    if parent not in matures:
+        logger.warning("Parent miRNA not found in database %s" % parent)
         return ""
-    if attr["Name"] not in matures[attr["Parent"]]:
-        logger.warning("miRNA not found in database %s" % attr["Name"])
+    if name not in matures[parent]:
+        logger.warning("miRNA not found in database %s" % name)
         return ""
 
-    logger.debug("GFF::BODY::precursors %s" % precursors[attr["Parent"]])
-    logger.debug("GFF:BODY::mature %s" % matures[attr["Parent"]][attr["Name"]])
+    logger.debug("GFF::BODY::precursors %s" % precursors[parent])
+    logger.debug("GFF:BODY::mature %s" % matures[parent][name])
 
-    # Handle missing 'Variant' key safely
-    variant = attr.get("Variant", "")  # Default to an empty string if missing
-    t5 = variant_to_5p(precursors[attr["Parent"]],
-                       matures[attr["Parent"]][attr["Name"]],
-                       variant)
-    t3 = variant_to_3p(precursors[attr["Parent"]],
-                       matures[attr["Parent"]][attr["Name"]],
-                       variant)
+    variants = variant.split(",")
+    t5 = variant_to_5p(precursors[parent],
+                       matures[parent][name],
+                       variants)
+    t3 = variant_to_3p(precursors[parent],
+                       matures[parent][name],
+                       variants)
     add = variant_to_add(read,
-                         variant)
+                         variants)
     mature_sequence = get_mature_sequence(
-        precursors[attr["Parent"]],
-        matures[attr["Parent"]][attr["Name"]],
+        precursors[parent],
+        matures[parent][name],
         nt=8)
     logger.debug("GFF::BODY::mature_sequence %s" % mature_sequence)
     mm = align_from_variants(read,
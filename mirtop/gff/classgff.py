@@ -1,19 +1,99 @@
 from mirtop.gff import gff_versions
 from collections import OrderedDict
 
+# columns of a GFF/GTF line, in order
+COLUMNS = ("chrom", "source", "type", "start", "end",
+           "score", "strand", "ext")
+
+# attributes of mirGFF3 lines that *feature.attribute()* gets
+# from the line without reading the rest
+FIXED = ("UID", "Read", "Name", "Parent", "Variant", "Cigar",
+         "Expression", "Filter", "Hits")
+
+
+def _fixed_value(attrb, key, sep):
+    """
+    Value of *key* in the attributes of a line written as mirtop does,
+    the same than *read_attributes()* gives. None when the attributes
+    need to be parsed to know it.
+    """
+    name = key + sep
+    start = attrb.find(name)
+    if start < 0 or attrb.count(name) > 1:
+        return None
+    if start and attrb[start - 1] != ";" and attrb[start - 2:start] != "; ":
+        return None
+    end = attrb.find(";", start)
+    value = attrb[start + len(name):end if end > -1 else len(attrb)].rstrip()
+    if sep == "=":
+        if " =" in attrb or "=" in value:
+            return None
+    elif not value or " " in value:
+        return None
+    return value.strip()
+
 
 class feature:
-    """"Class with alignment information."""
+    """"Class with alignment information.
+
+    The columns are split when the line is read, but the attributes
+    are only parsed the first time they are used."""
+    __slots__ = ("line", "_cols", "_columns", "_attributes")
+
+    reserved_attributes = gff_versions.ATTRv['1.1']
 
     def __init__(self, line, sep="="):
         # if isinstance(line, basestring) # str in python 3
         if isinstance(line, dict):
             line = self.create_line(line, sep)
         self.line = line
-        self.attributes = {}
-        self.columns = {}
+        self._cols = None
+        self._columns = None
+        self._attributes = None
         self.read_gff_line()
-        self.reserved_attributes = gff_versions.ATTRv['1.1']
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = dict(zip(COLUMNS, self._cols)) if self._cols else {}
+        return self._columns
+
+    @columns.setter
+    def columns(self, columns):
+        self._columns = columns
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            if self._cols:
+                self.read_attributes(self._cols[8])
+            else:
+                self._attributes = {}
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes
+
+    def attribute(self, key):
+        """
+        Value of one attribute, the same than *attributes[key]*.
+
+        The attributes in FIXED are sliced from the line while
+        the attributes are not parsed, so reading a few of them
+        doesn't create the dictionary with all of them.
+
+        Args:
+            *key(str)*: name of the attribute.
+
+        Returns:
+            *(str)*: value of the attribute, KeyError if it is missing.
+        """
+        if self._attributes is None and self._cols and key in FIXED:
+            value = _fixed_value(self._cols[8], key, self.guess_format())
+            if value is not None:
+                return value
+        return self.attributes[key]
 
     def guess_format(self):
         return "=" if self.line.find("Name=") > -1 else " "
@@ -53,11 +133,18 @@ class feature:
         """
         sep = self.guess_format()
         gff_dict = OrderedDict()
-        for gff_item in gff_attrb.split(";"):
-            item_pair = gff_item.strip().split(sep)
-            if len(item_pair) > 1:
-                gff_dict[item_pair[0].strip()] = item_pair[1].strip()
-        self.attributes = gff_dict
+        if sep == "=":
+            # mirGFF3 lines: key=value pairs, spaces only around them
+            for gff_item in gff_attrb.split(";"):
+                item_pair = gff_item.split("=")
+                if len(item_pair) > 1:
+                    gff_dict[item_pair[0].strip()] = item_pair[1].strip()
+        else:
+            for gff_item in gff_attrb.split(";"):
+                item_pair = gff_item.strip().split(sep)
+                if len(item_pair) > 1:
+                    gff_dict[item_pair[0].strip()] = item_pair[1].strip()
+        self._attributes = gff_dict
 
     def read_gff_line(self):
         """
@@ -69,13 +156,26 @@ class feature:
         cols = line.strip().split("\t")
         if len(cols) != 9:
             raise ValueError("Line has less than 9 elements: %s" % line)
-        self.read_attributes(cols[8])
-        fields = {'chrom': cols[0],
-                  'source': cols[1],
-                  'type': cols[2],
-                  'start': cols[3],
-                  'end': cols[4],
-                  'score': cols[5],
-                  'strand': cols[6],
-                  'ext': cols[7]}
-        self.columns = fields
+        self._cols = cols
+
+
+def read_features(fn, numbered=False):
+    """
+    Read the lines of a GFF/GTF file one by one.
+
+    Args:
+        *fn(str)*: GFF/GTF file.
+
+        *numbered(boolean)*: give the number of the line in the file
+            with each feature, counting from 1.
+
+    Returns:
+        *(generator)* of *feature* objects, one for each line
+            that is not a header or comment, or (number, *feature*)
+            tuples with *numbered*.
+    """
+    with open(fn) as inh:
+        for num, line in enumerate(inh, 1):
+            if line.startswith("#"):
+                continue
+            yield (num, feature(line)) if numbered else feature(line)
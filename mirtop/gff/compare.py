@@ -4,15 +4,32 @@ Compare multiple GFF files to a reference
 
 from __future__ import print_function
 
+import multiprocessing
 import os
+import shutil
+import tempfile
+from functools import lru_cache
 
-from mirtop.gff.classgff import feature
+from mirtop.gff.classgff import read_features
 from mirtop.mirna.realign import read_id
 import mirtop.libs.logger as mylog
 
 logger = mylog.getLogger(__name__)
 
 
+# isomiR types in the accuracy table, in order,
+# the bit of each one in the Variant masks is its position
+TYPES = ["iso_5p", "iso_3p", "iso_add3p", "iso_snv",
+         "iso_snv_seed", "iso_snv_central",
+         "iso_snv_central_supp", "iso_snv_central_offset"]
+
+# bits of the reference index values: Variant id, Name id, position
+VARIANT_BITS = 32
+NAME_BITS = 32
+
+_worker = dict()
+
+
 def compare(args):
     """
     From a list of GFF files produce comparison with a reference set.
@@ -25,80 +42,165 @@ def compare(args):
     Returns:
         *(out_file)*: comparison of the GFF files with the reference.
     """
-    result = dict()
-    reference = read_reference(args.files[0])
     for fn in args.files[1:]:
         if not os.path.exists(fn):
             raise IOError("%s doesn't exist" % fn)
-        result[os.path.basename(fn)] = _compare_to_reference(fn, reference)
-    if args.out != "tmp_mirtop":
-        fn_out = os.path.join(args.out, "summary.txt")
-        with open(fn_out, 'w') as outh:
-            for fn in result:
-                print("sample\tidu\tseq\ttag\tsame_mirna\t%s" % "\t".join(result[fn][0][3].keys()), file=outh)
-                for line in result[fn]:
-                    read = read_id(line[0])
-                    acc = "\t".join([line[3][v] for v in line[3]])
-                    print("%s\t%s\t%s\t%s\t%s\t%s" % (fn, line[0], read, line[1], line[2], acc), file=outh)
+    reference = read_reference(args.files[0])
+    write = args.out != "tmp_mirtop"
+    tmp_dir = tempfile.mkdtemp(dir=args.out if write else None)
+    parts = [(fn, os.path.join(tmp_dir, "%s.txt" % idx) if write else None)
+             for idx, fn in enumerate(args.files[1:])]
+    jobs = min(getattr(args, "jobs", 1) or 1, len(parts))
+    try:
+        if jobs < 2:
+            _init_worker(reference)
+            done = [_compare_worker(part) for part in parts]
+        else:
+            logger.info("Comparing %s files with %s jobs" % (len(parts), jobs))
+            pool = multiprocessing.Pool(jobs, initializer=_init_worker,
+                                        initargs=(reference,))
+            try:
+                done = pool.map(_compare_worker, parts)
+            finally:
+                pool.close()
+                pool.join()
+        if write:
+            # files with the same name keep the last position,
+            # as the keys of a dict
+            names = dict()
+            for idx, fn in enumerate(done):
+                names[os.path.basename(fn)] = idx
+            fn_out = os.path.join(args.out, "summary.txt")
+            with open(fn_out, 'w') as outh:
+                for name, idx in names.items():
+                    print("sample\tidu\tseq\ttag\tsame_mirna\t%s" % "\t".join(TYPES), file=outh)
+                    with open(parts[idx][1]) as inh:
+                        shutil.copyfileobj(inh, outh)
+    finally:
+        _worker.clear()
+        shutil.rmtree(tmp_dir)
+
+
+def _init_worker(reference):
+    _worker["reference"] = reference
+
+
+def _compare_worker(part):
+    fn, out_fn = part
+    if out_fn:
+        with open(out_fn, 'w') as outh:
+            _compare_to_reference(fn, _worker["reference"], outh)
+    else:
+        _compare_to_reference(fn, _worker["reference"])
+    return fn
+
+
+class index:
+    """
+    Compact reference of a GFF file: for each UID, one integer with
+    the id of the simplified Variant, the id of the Name and the
+    position of the UID. Each Variant keeps its isomiR types mask.
+    """
+
+    def __init__(self):
+        self.uids = dict()
+        self.names = dict()
+        self.variants = dict()
+        self.masks = list()
+
+    def add(self, uid, name, variant):
+        name_id = self.names.setdefault(name, len(self.names))
+        variant_id = self.variants.setdefault(variant, len(self.variants))
+        if variant_id == len(self.masks):
+            self.masks.append(_mask(variant))
+        value = self.uids.get(uid)
+        pos = len(self.uids) if value is None else value >> (VARIANT_BITS + NAME_BITS)
+        self.uids[uid] = ((pos << NAME_BITS | name_id) << VARIANT_BITS) | variant_id
+
+    def get(self, uid):
+        """
+        Returns:
+            *(tuple)*: position, Name id and Variant id of *uid*,
+                or None if it is not in the reference.
+        """
+        value = self.uids.get(uid)
+        if value is None:
+            return None
+        return (value >> (VARIANT_BITS + NAME_BITS),
+                (value >> VARIANT_BITS) & ((1 << NAME_BITS) - 1),
+                value & ((1 << VARIANT_BITS) - 1))
+
+    def __len__(self):
+        return len(self.uids)
+
+    def __iter__(self):
+        """UID and Variant mask in the order the UIDs were read."""
+        for uid, value in self.uids.items():
+            yield uid, self.masks[value & ((1 << VARIANT_BITS) - 1)]
 
 
 def read_reference(fn):
-    """Read GFF into UID:Variant
+    """Read GFF into UID:Name and Variant
 
     Args:
         *fn (str)*: GFF file.
 
     Returns:
-        *srna (dict)*: dict with >>> {'UID': 'iso_snp:-2,...'}
+        *srna (index)*: compact reference with the Name and
+            the isomiR types in Variant of each UID.
     """
-    srna = dict()
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            gff = feature(line)
-            attr = gff.attributes
-            srna[attr['UID']] = [_simplify(attr['Variant']), attr]
+    srna = index()
+    for gff in read_features(fn):
+        srna.add(gff.attribute('UID'), gff.attribute('Name'),
+                 _simplify(gff.attribute('Variant')))
     return srna
 
 
-def _compare_to_reference(fn, reference):
+def _compare_to_reference(fn, reference, outh=None):
     same = 0
-    diff = list()
-    extra = list()
-    miss = list()
-    results = list()
+    diff = 0
+    extra = 0
+    miss = 0
     seen = 0
-    seen_reference = set()
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            gff = feature(line)
-            attr = gff.attributes
-            if attr['UID'] in reference:
-                mirna = "Y" if attr['Name'] == reference[attr['UID']][1]['Name'] else attr['Name']
-                accuracy = _accuracy(_simplify(attr['Variant']), reference[attr['UID']][0])
-                results.append([attr['UID'], "D", mirna, accuracy])
-                if _simplify(attr['Variant']) == reference[attr['UID']][0]:
-                    same += 1
-                else:
-                    diff.append("%s | reference: %s" % (line.strip(), reference[attr['UID']][1]))
-                seen += 1
-                seen_reference.add(attr['UID'])
+    seen_reference = bytearray(len(reference))
+    name = os.path.basename(fn)
+    for gff in read_features(fn):
+        uid = gff.attribute('UID')
+        mirna = gff.attribute('Name')
+        variant = _simplify(gff.attribute('Variant'))
+        mask = _mask(variant)
+        ref = reference.get(uid)
+        if ref is not None:
+            pos, name_id, variant_id = ref
+            mirna = "Y" if reference.names.get(mirna) == name_id else mirna
+            if outh:
+                _write(outh, name, uid, "D", mirna, mask,
+                       reference.masks[variant_id])
+            if reference.variants.get(variant) == variant_id:
+                same += 1
             else:
-                extra.append("%s | extra" % line.strip())
-                results.append([attr['UID'], "E", attr['Name'], _accuracy(_simplify(attr['Variant']), "")])
-    for uid in reference:
-        if uid not in seen_reference:
-            results.append([uid, "M", "N", _accuracy("", reference[uid][0])])
-            miss.append("| miss %s" % reference[uid][1])
+                diff += 1
+            seen += 1
+            seen_reference[pos] = 1
+        else:
+            extra += 1
+            if outh:
+                _write(outh, name, uid, "E", mirna, mask, 0)
+    for pos, (uid, ref_mask) in enumerate(reference):
+        if not seen_reference[pos]:
+            miss += 1
+            if outh:
+                _write(outh, name, uid, "M", "N", 0, ref_mask)
     logger.info("Number of sequences found in reference: %s" % seen)
     logger.info("Number of sequences matches reference: %s" % same)
-    logger.info("Number of sequences different than reference: %s" % len(diff))
-    logger.info("Number of sequences extra sequences: %s" % len(extra))
-    logger.info("Number of sequences missed sequences: %s" % len(miss))
-    return results
+    logger.info("Number of sequences different than reference: %s" % diff)
+    logger.info("Number of sequences extra sequences: %s" % extra)
+    logger.info("Number of sequences missed sequences: %s" % miss)
+
+
+def _write(outh, name, uid, tag, mirna, mask, ref_mask):
+    print("%s\t%s\t%s\t%s\t%s\t%s" % (name, uid, read_id(uid), tag, mirna,
+                                        _accuracy_line(mask, ref_mask)), file=outh)
 
 
 def _simplify(variant):
@@ -114,6 +216,19 @@ def _get_samples(fn):
     raise ValueError("%s doesn't contain COLDATA header." % fn)
 
 
+def _mask(variant):
+    """Bits of the isomiR types found in the simplified Variant."""
+    mask = 0
+    for bit, t in enumerate(TYPES):
+        if t in variant:
+            mask |= 1 << bit
+    return mask
+
+
+# label for each bit of reference and target: 00, 01, 10 and 11
+_LABELS = ("TN", "FP", "FN", "TP")
+
+
 def _accuracy(target, reference):
     """Compare each isomir label in Variant field
        and return a list with values whether:
@@ -122,15 +237,21 @@ def _accuracy(target, reference):
            TP: same values
     """
     logger.debug("COMPARE::ACCURACY::values %s vs %s" % (target, reference))
-    accuracy = dict()
-    types = ["iso_5p", "iso_3p", "iso_add3p", "iso_snv",
-             "iso_snv_seed", "iso_snv_central",
-             "iso_snv_central_supp", "iso_snv_central_offset"]
-    for t in types:
-        if t in reference:
-            accuracy[t] = "TP" if t in target else "FN"
-        else:
-            accuracy[t] = "TN" if t not in target else "FP"
+    target = _mask(target)
+    reference = _mask(reference)
+    accuracy = dict(zip(TYPES, _labels(target, reference)))
     logger.debug("COMPARE::ACCURACY::%s" % accuracy.keys())
     logger.debug("COMPARE::ACCURACY::%s" % accuracy.values())
     return accuracy
+
+
+def _labels(target, reference):
+    """TP, FP, FN or TN for each isomiR type of the masks."""
+    return [_LABELS[(reference >> bit & 1) << 1 | (target >> bit & 1)]
+            for bit in range(len(TYPES))]
+
+
+@lru_cache(maxsize=None)
+def _accuracy_line(target, reference):
+    """Tab separated labels of *_accuracy()* for the masks."""
+    return "\t".join(_labels(target, reference))
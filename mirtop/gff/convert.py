@@ -2,17 +2,22 @@
 
 from __future__ import print_function
 
+import csv
+import hashlib
 import os.path as op
-import pandas as pd
 
-from mirtop.mirna import fasta, mapper
+from mirtop.gff import matrix
+from mirtop.mirna import reference
 from mirtop.mirna.realign import read_id
-from mirtop.gff.classgff import feature
-from mirtop.gff.body import variant_with_nt
+from mirtop.gff.classgff import read_features
+from mirtop.gff.body import variants_nt
 import mirtop.libs.logger as mylog
 
 logger = mylog.getLogger(__name__)
 
+# lines with --add-extra sent together to *mirtop.gff.body.variants_nt()*
+CHUNK_LINES = 100000
+
 
 def convert_gff_counts(args):
     """ Reads a GFF file to produces output file containing Expression counts
@@ -29,73 +34,115 @@ def convert_gff_counts(args):
     variant_header = ['iso_5p', 'iso_3p',
                       'iso_add3p', 'iso_snp']
     if args.add_extra:
-        precursors = fasta.read_precursor(args.hairpin, args.sps)
-        matures = mapper.read_gtf_to_precursor(args.gtf, args.database)
+        ref = reference.load(args.hairpin, args.gtf, args.sps, args.database)
+        precursors = ref.precursors
+        matures = ref.matures
         variant_header = variant_header + ['iso_5p_nt', 'iso_3p_nt', 'iso_add3p_nt', 'iso_snp_nt']
 
     logger.info("INFO Reading GFF file %s", args.gff)
     logger.info("INFO Writing TSV file to directory %s", args.out)
 
-    gff_file = open(args.gff, 'r')
-    out_file = op.join(args.out, "%s.tsv" % op.splitext(op.basename(args.gff))[0])
-    all_lines = []
+    prefix = op.join(args.out, op.splitext(op.basename(args.gff))[0])
+    out_file = "%s.tsv" % prefix
     missing_parent = 0
     missing_mirna = 0
     unvalid_uid = 0
-    #with open(out_file, 'w') as outh:
-    
-    for samples_line in gff_file:
-        if samples_line.startswith("## COLDATA:"):
-            samples = [sep.join(samples_line.strip().split("COLDATA:")[1].strip().split(","))]
-            #header = sep.join(['UID', 'Read', 'miRNA', 'Variant',
-            #                   variant_header, samples])
-            #print(header, file=outh)
-            break
-    
-    for mirna_line in gff_file:
-        gff = feature(mirna_line)
-        attr = gff.attributes
-        UID = attr["UID"]
-        Read = attr["Read"]
-        mirna = attr["Name"]
-        parent = attr["Parent"]
-        # Handle missing 'Variant' key safely
-        variant = attr.get("Variant", "")  # Default to an empty string if missing
-        try:
-            read_id(UID)
-        except KeyError:
-            unvalid_uid += 1
-            continue
-    
-        expression = [sep.join(attr["Expression"].strip().split(","))]
-        cols_variants = _expand(variant)
-        logger.debug("COUNTS::Read:%s" % Read)
-        logger.debug("COUNTS::EXTRA:%s" % variant)
-        if args.add_extra:
-            if parent not in precursors:
-                missing_parent += 1
-                continue
-            if mirna not in matures[parent]:
-                missing_mirna += 1
+    duplicated = 0
+    seen = set()
+
+    jobs = getattr(args, "jobs", 1) or 1
+    samples = _get_samples(args.gff)
+    columns = ['UID', 'Read', 'miRNA', 'Variant'] + variant_header
+    matrices = [matrix.writer(fmt, prefix, columns, samples)
+                for fmt in matrix.formats(getattr(args, "matrix", None))]
+    with open(out_file, 'w') as outh:
+        writer = csv.writer(outh, delimiter=sep, lineterminator="\n")
+        writer.writerow(columns + samples)
+        pending = []
+        for gff in read_features(args.gff):
+            attr = gff.attributes
+            UID = attr["UID"]
+            Read = attr["Read"]
+            mirna = attr["Name"]
+            parent = attr["Parent"]
+            # Handle missing 'Variant' key safely
+            variant = attr.get("Variant", "")  # Default to an empty string if missing
+            try:
+                read_id(UID)
+            except KeyError:
+                unvalid_uid += 1
                 continue
-            extra = variant_with_nt(mirna_line, precursors, matures)
-            if extra == "Invalid":
+
+            expression = attr["Expression"].strip().split(",")
+            cols_variants = _expand(variant)
+            logger.debug("COUNTS::Read:%s" % Read)
+            logger.debug("COUNTS::EXTRA:%s" % variant)
+            if args.add_extra:
+                if parent not in precursors:
+                    missing_parent += 1
+                    continue
+                if mirna not in matures[parent]:
+                    missing_mirna += 1
+                    continue
+                # the nts changes are added in chunks of lines
+                pending.append(([UID, Read, mirna, variant] + cols_variants,
+                                expression, (UID, parent, mirna, variant)))
+                if len(pending) >= CHUNK_LINES:
+                    duplicated += _write_extra(pending, precursors, matures, jobs,
+                                               writer, matrices, seen)
+                    pending = []
                 continue
-            logger.debug("COUNTS::EXTRA:%s" % extra)
-            cols_variants = cols_variants + _expand(extra, True)
-        summary = [UID, Read,  mirna, variant] + cols_variants + expression
-        logger.debug(summary)
-        all_lines.append(summary)
-    #import pdb; pdb.set_trace()   
-    df = pd.DataFrame(all_lines, columns = ['UID', 'Read', 'miRNA', 'Variant'] + variant_header + samples)
-    df = df.drop_duplicates()
-    df.to_csv(out_file, sep="\t", index=False)
+            summary = [UID, Read,  mirna, variant] + cols_variants + expression
+            duplicated += _write_row(summary, expression, writer, matrices, seen)
+        if pending:
+            duplicated += _write_extra(pending, precursors, matures, jobs,
+                                       writer, matrices, seen)
+    for m in matrices:
+        m.close()
     logger.info("Missing Parents in hairpin file: %s" % missing_parent)
     logger.info("Missing MiRNAs in GFF file: %s" % missing_mirna)
     logger.info("Non valid UID: %s" % unvalid_uid)
+    logger.info("Duplicated lines: %s" % duplicated)
     logger.info("Output file is at %s" % out_file)
 
 
+def _write_extra(pending, precursors, matures, jobs, writer, matrices, seen):
+    """Add the nts changes to the rows and write them."""
+    duplicated = 0
+    extras = variants_nt([p[2] for p in pending], precursors, matures, jobs)
+    for (row, expression, key), extra in zip(pending, extras):
+        if extra == "Invalid":
+            continue
+        logger.debug("COUNTS::EXTRA:%s" % extra)
+        summary = row + _expand(extra, True) + expression
+        duplicated += _write_row(summary, expression, writer, matrices, seen)
+    return duplicated
+
+
+def _write_row(summary, expression, writer, matrices, seen):
+    """Write the row if it wasn't written before, return 1 if it was."""
+    logger.debug(summary)
+    # same rows are only written once, keeping the hash of each row
+    key = hashlib.md5("\t".join(summary).encode()).digest()
+    if key in seen:
+        return 1
+    seen.add(key)
+    writer.writerow(summary)
+    if matrices:
+        counts = matrix.counts(expression)
+        for m in matrices:
+            m.add(summary[:len(summary) - len(expression)], counts)
+    return 0
+
+
+def _get_samples(fn):
+    with open(fn) as inh:
+        for line in inh:
+            if line.startswith("## COLDATA:"):
+                return line.strip().split("COLDATA:")[1].strip().split(",")
+    raise ValueError("%s doesn't contain COLDATA header." % fn)
+
+
 def _expand(variant, nts=False):
     """Expand Variant field into list for iso_5p, iso_3p, iso_add3p, iso_snv"""
     list_variant = []
@@ -0,0 +1,220 @@
+"""Write count matrices in binary and sparse formats
+
+*mirtop counts --matrix* writes the counts of the TSV file in these
+formats as well, one row at a time. Each row has its metadata (UID,
+Read, miRNA, Variant...) and the integer counts of the samples.
+
+* mtx: Matrix Market coordinate file with the counts > 0, plus
+  *.rows.tsv* with the metadata and *.cols.tsv* with the samples.
+* parquet: one table with the metadata and one int64 column for each
+  sample (needs *pyarrow*).
+* hdf5: *counts* int64 dataset (rows x samples), *samples* and one
+  dataset for each metadata column under *rows* (needs *h5py*).
+"""
+import os
+import shutil
+
+import mirtop.libs.logger as mylog
+
+logger = mylog.getLogger(__name__)
+
+FORMATS = ("mtx", "parquet", "hdf5")
+
+# rows kept in memory before writing them to parquet or hdf5 files
+CHUNK_SIZE = 10000
+
+
+def formats(names):
+    """
+    Formats of the --matrix option, each one only once.
+
+    Args:
+        *names(list)*: formats given, None for no matrix.
+
+    Returns:
+        *(list)*: formats in the order they are given.
+    """
+    unique = []
+    for name in names or []:
+        if name not in FORMATS:
+            raise ValueError("Matrix format %s not in %s" % (name, ", ".join(FORMATS)))
+        if name not in unique:
+            unique.append(name)
+    return unique
+
+
+def counts(expression):
+    """
+    Integer counts of the Expression attribute.
+
+    Counts written as float numbers, like 2.0, are read as integers.
+
+    Args:
+        *expression(list)*: counts of each sample as text.
+
+    Returns:
+        *(list)*: integer counts.
+
+    Raises:
+        *ValueError* if a count is not a whole number.
+    """
+    values = []
+    for value in expression:
+        try:
+            values.append(int(value))
+        except ValueError:
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError("Matrix files need integer counts,"
+                                 " %s found in Expression." % value)
+            values.append(int(number))
+    return values
+
+
+def writer(fmt, prefix, columns, samples):
+    """
+    Open the writer of a matrix format.
+
+    Args:
+        *fmt(str)*: one of *FORMATS*.
+
+        *prefix(str)*: output file name without extension.
+
+        *columns(list)*: names of the metadata columns.
+
+        *samples(list)*: names of the samples.
+
+    Returns:
+        *(object)*: with *add(row, counts)* and *close()*.
+    """
+    if fmt == "mtx":
+        return mtx(prefix, columns, samples)
+    if fmt == "parquet":
+        return parquet(prefix, columns, samples)
+    if fmt == "hdf5":
+        return hdf5(prefix, columns, samples)
+    raise ValueError("Matrix format %s not in %s" % (fmt, ", ".join(FORMATS)))
+
+
+class mtx:
+    """Matrix Market coordinate file, 1-based rows and columns."""
+
+    def __init__(self, prefix, columns, samples):
+        self.fn = "%s.mtx" % prefix
+        self.samples = samples
+        self.nrows = 0
+        self.nnz = 0
+        self._entries = open("%s.tmp" % self.fn, 'w')
+        self._rows = open("%s.rows.tsv" % prefix, 'w')
+        self._rows.write("\t".join(columns) + "\n")
+        with open("%s.cols.tsv" % prefix, 'w') as outh:
+            outh.write("sample\n")
+            for sample in samples:
+                outh.write("%s\n" % sample)
+
+    def add(self, row, counts):
+        self.nrows += 1
+        self._rows.write("\t".join(row) + "\n")
+        for col, count in enumerate(counts, 1):
+            if count:
+                self._entries.write("%s %s %s\n" % (self.nrows, col, count))
+                self.nnz += 1
+
+    def close(self):
+        self._rows.close()
+        self._entries.close()
+        with open(self.fn, 'w') as outh:
+            outh.write("%%MatrixMarket matrix coordinate integer general\n")
+            outh.write("%s %s %s\n" % (self.nrows, len(self.samples), self.nnz))
+            with open("%s.tmp" % self.fn) as inh:
+                shutil.copyfileobj(inh, outh)
+        os.remove("%s.tmp" % self.fn)
+        logger.info("Matrix Market file is at %s" % self.fn)
+
+
+class _chunked:
+    """Keep CHUNK_SIZE rows and write them together."""
+
+    def __init__(self, prefix, columns, samples):
+        self.columns = columns
+        self.samples = samples
+        self._rows = []
+        self._counts = []
+
+    def add(self, row, counts):
+        self._rows.append(row)
+        self._counts.append(counts)
+        if len(self._rows) >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._write(self._rows, self._counts)
+        self._rows, self._counts = [], []
+
+    def close(self):
+        self._flush()
+        self._close()
+        logger.info("Matrix file is at %s" % self.fn)
+
+
+class parquet(_chunked):
+    """Parquet file with one row group for each chunk."""
+
+    def __init__(self, prefix, columns, samples):
+        _chunked.__init__(self, prefix, columns, samples)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("--matrix parquet needs pyarrow installed.")
+        self._pa = pyarrow
+        self.fn = "%s.parquet" % prefix
+        self.schema = pyarrow.schema(
+            [(name, pyarrow.string()) for name in columns] +
+            [(name, pyarrow.int64()) for name in samples],
+            metadata={"samples": ",".join(samples)})
+        self._writer = pyarrow.parquet.ParquetWriter(self.fn, self.schema)
+
+    def _write(self, rows, counts):
+        arrays = [self._pa.array([row[idx] for row in rows], self._pa.string())
+                  for idx in range(len(self.columns))]
+        arrays += [self._pa.array([c[idx] for c in counts], self._pa.int64())
+                   for idx in range(len(self.samples))]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def _close(self):
+        self._writer.close()
+
+
+class hdf5(_chunked):
+    """HDF5 file with datasets growing one chunk at a time."""
+
+    def __init__(self, prefix, columns, samples):
+        _chunked.__init__(self, prefix, columns, samples)
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("--matrix hdf5 needs h5py installed.")
+        self.fn = "%s.h5" % prefix
+        self._h5 = h5py.File(self.fn, 'w')
+        text = h5py.string_dtype()
+        self._h5.create_dataset("samples", data=samples, dtype=text)
+        self._counts_ds = self._h5.create_dataset(
+            "counts", shape=(0, len(samples)), maxshape=(None, len(samples)),
+            dtype="int64", chunks=True, compression="gzip")
+        self._columns_ds = [self._h5.create_dataset(
+            "rows/%s" % name, shape=(0,), maxshape=(None,), dtype=text,
+            chunks=True, compression="gzip") for name in columns]
+
+    def _write(self, rows, counts):
+        start = self._counts_ds.shape[0]
+        end = start + len(rows)
+        self._counts_ds.resize((end, len(self.samples)))
+        self._counts_ds[start:end] = counts
+        for idx, ds in enumerate(self._columns_ds):
+            ds.resize((end,))
+            ds[start:end] = [row[idx] for row in rows]
+
+    def _close(self):
+        self._h5.close()
@@ -1,4 +1,10 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
 from collections import defaultdict
+from itertools import groupby, islice
 
 from mirtop.gff.body import paste_columns, guess_format
 import mirtop.libs.logger as mylog
@@ -6,6 +12,13 @@ from mirtop.gff.classgff import feature
 
 logger = mylog.getLogger(__name__)
 
+# max number of sample files read at the same time by *merger*,
+# more files are merged in steps
+MAX_OPEN_FILES = 256
+
+# max number of merged lines sorted in memory by *merger*
+MAX_LINES = 1000000
+
 
 def merge(dts, samples):
     """
@@ -46,6 +59,166 @@ def merge(dts, samples):
     return merged_lines
 
 
+class merger:
+    """
+    Same than *merge()* but keeping the samples in sorted files on disk,
+    so the memory doesn't grow with the number of isomiRs.
+
+    Each sample is written sorted by the id of the lines (*hit[0]*),
+    and the samples are merged by id to add the expression of all
+    the lines with the same id, as *merge()* does, keeping the last
+    line. The merged lines are then sorted on disk in the order
+    *merge()* output is written: by precursor, in the order they are
+    seen, start, and the first time the id is seen.
+    """
+
+    def __init__(self, tmp_dir=None):
+        self.tmp_dir = tempfile.mkdtemp(prefix="mirtop_merge_", dir=tmp_dir)
+        self.files = []
+
+    def add(self, lines):
+        """
+        Write the lines of a sample.
+
+        Args:
+            *lines(nested dicts)*: gff_list has the format as defined in
+                *mirtop.gff.body.read()*.
+        """
+        idx = len(self.files)
+        records = []
+        for m in lines:
+            for s in lines[m]:
+                for hit in lines[m][s]:
+                    records.append((hit[0], idx, len(records), hit))
+        records.sort(key=lambda r: r[:3])
+        fn = os.path.join(self.tmp_dir, "sample%s.txt" % idx)
+        with open(fn, 'w') as outh:
+            for idu, idx, pos, hit in records:
+                outh.write("%s\t%s\t%s\t%s\t%s\n" % (
+                    idu, idx, pos, json.dumps([hit[3], hit[2]]), hit[4]))
+        self.files.append(fn)
+        logger.debug("MERGE::SAMPLES::%s lines written to %s" % (len(records), fn))
+
+    def merged(self, samples):
+        """
+        Merge the samples added.
+
+        Args:
+            *samples(list)*: character list with sample names.
+
+        Returns:
+            *(generator)* of gff_list as defined in *mirtop.gff.body.read()*,
+                in the same order that *merge()* output is written.
+        """
+        logger.debug("MERGE::SAMPLES::given %s" % samples)
+        fn_merged = os.path.join(self.tmp_dir, "merged.txt")
+        ranks = dict()
+        with open(fn_merged, 'w') as outh:
+            for idu, first, line in self._by_id(samples):
+                chrom = _chrom(line)
+                if chrom not in ranks or first < ranks[chrom]:
+                    ranks[chrom] = first
+                outh.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (
+                    chrom, _start(line), first[0], first[1], idu, line))
+        files = self._sort(fn_merged, ranks)
+        handles = [open(fn) for fn in files]
+        try:
+            key = _merged_key(ranks)
+            for line in heapq.merge(*handles, key=key):
+                record = line.rstrip("\n").split("\t", 5)
+                yield [record[4], "", "", "", record[5]]
+        finally:
+            for inh in handles:
+                inh.close()
+
+    def _by_id(self, samples):
+        """
+        Merge the lines with the same id of all the samples.
+
+        Returns:
+            *(generator)* of (id, (sample, position) of the first line
+                with the id, last line with the expression of all samples).
+        """
+        files = self._reduce(self.files, _sample_key, "step")
+        handles = [open(fn) for fn in files]
+        try:
+            records = heapq.merge(*[map(_read_record, inh) for inh in handles],
+                                  key=_record_key)
+            for idu, group in groupby(records, key=lambda r: r[0]):
+                counts = dict()
+                first = None
+                for record in group:
+                    if first is None:
+                        first = record[1:3]
+                    counts.update(_format_samples_counts(*json.loads(record[3])))
+                    line = record[4]
+                yield idu, first, _fix(line, _convert_to_string(counts, samples))
+        finally:
+            for inh in handles:
+                inh.close()
+
+    def _sort(self, fn, ranks):
+        """Sort the merged lines in files of MAX_LINES lines."""
+        key = _merged_key(ranks)
+        files = []
+        with open(fn) as inh:
+            while True:
+                lines = list(islice(inh, MAX_LINES))
+                if not lines:
+                    break
+                lines.sort(key=key)
+                chunk = os.path.join(self.tmp_dir, "sorted%s.txt" % len(files))
+                with open(chunk, 'w') as outh:
+                    outh.writelines(lines)
+                files.append(chunk)
+        os.remove(fn)
+        return self._reduce(files, key, "sorted_step")
+
+    def _reduce(self, files, key, name):
+        """Merge files in steps until they can be open together."""
+        step = 0
+        while len(files) > MAX_OPEN_FILES:
+            reduced = []
+            for first in range(0, len(files), MAX_OPEN_FILES):
+                fn = os.path.join(self.tmp_dir, "%s%s_%s.txt" % (name, step, first))
+                handles = [open(batch) for batch in files[first:first + MAX_OPEN_FILES]]
+                with open(fn, 'w') as outh:
+                    outh.writelines(heapq.merge(*handles, key=key))
+                for inh in handles:
+                    inh.close()
+                reduced.append(fn)
+            files = reduced
+            step += 1
+        return files
+
+    def close(self):
+        """Remove the files of the samples."""
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _read_record(line):
+    record = line.rstrip("\n").split("\t", 4)
+    return (record[0], int(record[1]), int(record[2]), record[3], record[4])
+
+
+def _record_key(record):
+    return record[:3]
+
+
+def _sample_key(line):
+    return _record_key(_read_record(line))
+
+
+def _merged_key(ranks):
+    """Key to sort the merged lines: the rank of the precursor,
+    start (as text, as *merge()* output is sorted) and first time
+    the id was seen."""
+    def _key(line):
+        record = line.split("\t", 4)
+        return (ranks[record[0]], record[1], int(record[2]), int(record[3]))
+    return _key
+
+
 def _format_samples_counts(samples, expression):
     """Return a dictionary of samples counts"""
     if isinstance(samples, list):
@@ -3,8 +3,8 @@ from __future__ import print_function
 
 import os.path as op
 
-from mirtop.mirna import fasta, mapper
-from mirtop.bam.bam import low_memory_bam, low_memory_genomic_bam
+from mirtop.mirna import mapper, reference
+from mirtop.bam import bam, filter
 from mirtop.importer import seqbuster
 from mirtop.gff import header
 import mirtop.libs.logger as mylog
@@ -18,10 +18,9 @@ def reader(args):
     samples = []
     database = mapper.guess_database(args)
     args.database = database
-    precursors = fasta.read_precursor(args.hairpin, args.sps)
-    args.precursors = precursors
-    matures = mapper.read_gtf_to_precursor(args.gtf, args.database)
-    args.matures = matures
+    ref = reference.load(args.hairpin, args.gtf, args.sps, args.database)
+    args.precursors = ref.precursors
+    args.matures = ref.matures
     # TODO check numbers of miRNA and precursors read
     # TODO print message if numbers mismatch
     if args.keep_name and len(args.files) > 1:
@@ -40,11 +39,12 @@ def reader(args):
         print(h, file=out_handle)
         if args.format == "BAM":
             if args.genomic:
-                low_memory_genomic_bam(fn, sample, out_handle, args)
+                bam.low_memory_genomic_bam(fn, sample, out_handle, args)
             else:
-                low_memory_bam(fn, sample, out_handle, args)
+                bam.low_memory_bam(fn, sample, out_handle, args)
         elif args.format == "seqbuster":
             seqbuster.read_file_low_memory(fn, sample, args, out_handle)
         else:
             raise ValueError("%s not supported for low memory" % args.format)
         out_handle.close()
+    filter.log_tune_cache()
@@ -5,12 +5,14 @@ Produce stats from GFF3 format
 from __future__ import print_function
 
 import os
+import numpy as np
 import pandas as pd
 import json
+import multiprocessing
 import re
 from collections import defaultdict
 
-from mirtop.gff.classgff import feature
+from mirtop.gff.classgff import read_features
 from mirtop import version
 
 import mirtop.libs.logger as mylog
@@ -30,12 +32,20 @@ def stats(args):
     """
     v = version.__version__
     message_info = ("# mirtop stats version {v}").format(**locals())
-    out = list()
     for fn in args.files:
         if not os.path.exists(fn):
             raise IOError("%s doesn't exist" % fn)
-        logger.info("Reading: %s" % fn)
-        out.append(_calc_stats(fn))
+    jobs = min(getattr(args, "jobs", 1) or 1, len(args.files))
+    if jobs < 2:
+        out = [_read_stats(fn) for fn in args.files]
+    else:
+        logger.info("Reading %s files with %s jobs" % (len(args.files), jobs))
+        pool = multiprocessing.Pool(jobs)
+        try:
+            out = pool.map(_read_stats, args.files)
+        finally:
+            pool.close()
+            pool.join()
     df_final = pd.concat(out)
     _dump_log(df_final, version, os.path.join(args.out, "mirtop_stats.log"))
     outfn = os.path.join(args.out, "mirtop_stats.txt")
@@ -57,56 +67,110 @@ def _get_samples(fn):
     raise ValueError("%s doesn't contain COLDATA header." % fn)
 
 
+def _read_stats(fn):
+    logger.info("Reading: %s" % fn)
+    return _calc_stats(fn)
+
+
 def _calc_stats(fn):
     """
     Read files and parse into categories
     """
     samples = _get_samples(fn)
-    lines = []
+    acc = accumulator(samples)
     seen = set()
     ok = re.compile('pass', re.IGNORECASE)
-    with open(fn) as inh:
-        for line in inh:
-            if line.startswith("#"):
-                continue
-            gff = feature(line)
-            cols = gff.columns
-            attr = gff.attributes
-            logger.debug("## STATS: attribute %s" % attr)
-            if not ok.match(attr['Filter']):
-                continue
-
-            # Handle missing 'Variant' key
-            variant_attr = attr.get('Variant', '')  # Default to 'NA' if missing
-
-            if "-".join([attr['UID'], variant_attr, attr['Name']]) in seen:
-                continue
-            seen.add("-".join([attr['UID'], variant_attr, attr['Name']]))
-            lines.extend(_classify(cols['type'], attr, samples))
-    df = _summary(lines)
+    for gff in read_features(fn):
+        attr = gff.attributes
+        logger.debug("## STATS: attribute %s" % attr)
+        if not ok.match(attr['Filter']):
+            continue
+
+        # Handle missing 'Variant' key
+        variant_attr = attr.get('Variant', '')  # Default to 'NA' if missing
+
+        if "-".join([attr['UID'], variant_attr, attr['Name']]) in seen:
+            continue
+        seen.add("-".join([attr['UID'], variant_attr, attr['Name']]))
+        acc.add(_classify(gff.columns['type'], attr), attr['Expression'])
+    df = _summary(acc)
     return df
 
 
-def _classify(srna_type, attr, samples):
+def _classify(srna_type, attr):
     """
-    Parse the line and return one
-    line for each category and sample.
+    Parse the line and return the categories
+    the counts of the line go to.
     """
     # iso_5p, iso_3p, iso_add ...
     # FILTER :: exact/isomiR_type
-    lines = []
-    counts = dict(zip(samples, attr['Expression'].split(",")))
-    for s in counts:
-        # Handle missing 'Variant' key
-        variant_attr = attr.get('Variant', '')
-        if int(counts[s]) > 0:
-            lines.append([srna_type, s, counts[s]])
-        if variant_attr.find("iso") == -1:
-            continue
-        for v in variant_attr.split(","):
-            if int(counts[s]) > 0:
-                lines.append([v.split(":")[0], s, counts[s]])
-    return lines
+    categories = [srna_type]
+    # Handle missing 'Variant' key
+    variant_attr = attr.get('Variant', '')
+    if variant_attr.find("iso") > -1:
+        categories.extend(v.split(":")[0] for v in variant_attr.split(","))
+    return categories
+
+
+class accumulator:
+    """
+    Sum and number of counts > 0 for each category and sample,
+    in arrays with one row for each category and one column
+    for each sample.
+    """
+
+    def __init__(self, samples):
+        last = dict((s, idx) for idx, s in enumerate(samples))
+        self.samples = list(dict.fromkeys(samples))
+        self.size = len(samples)
+        self.columns = None
+        if len(self.samples) != self.size:
+            self.columns = np.array([last[s] for s in self.samples])
+        self.categories = dict()
+        self.sums = np.zeros((16, len(self.samples)), dtype=np.int64)
+        self.counts = np.zeros((16, len(self.samples)), dtype=np.int64)
+
+    def _category(self, name):
+        if name not in self.categories:
+            if len(self.categories) == len(self.sums):
+                self.sums = np.vstack([self.sums, np.zeros_like(self.sums)])
+                self.counts = np.vstack([self.counts, np.zeros_like(self.counts)])
+            self.categories[name] = len(self.categories)
+        return self.categories[name]
+
+    def add(self, categories, expression):
+        """
+        Add the counts of a line to each category.
+
+        Args:
+            *categories(list)*: categories of the line.
+
+            *expression(str)*: comma separated counts of the samples.
+        """
+        values = expression.split(",")[:self.size]
+        values.extend(["0"] * (self.size - len(values)))
+        counts = np.fromiter(map(int, values), dtype=np.int64, count=self.size)
+        if self.columns is not None:
+            counts = counts[self.columns]
+        detected = counts > 0
+        counts = np.where(detected, counts, 0)
+        for name in categories:
+            idx = self._category(name)
+            self.sums[idx] += counts
+            self.counts[idx] += detected
+
+    def rows(self):
+        """
+        Category, sample, sum, count and mean of each category and
+        sample with counts, sorted by category and sample.
+        """
+        samples = sorted(range(len(self.samples)), key=lambda s: self.samples[s])
+        for name in sorted(self.categories):
+            idx = self.categories[name]
+            for s in samples:
+                if self.counts[idx, s]:
+                    yield (name, self.samples[s], self.sums[idx, s], self.counts[idx, s],
+                           self.sums[idx, s] / float(self.counts[idx, s]))
 
 
 def _add_missing(df):
@@ -123,24 +187,19 @@ def _add_missing(df):
     
     return df
 
-def _summary(lines):
+def _summary(acc):
     """
-    Summarize long table according to thresholds
+    Summarize the accumulated counts in a long table
     """
-    # summarize  > 0, > 5, >10, >50, >100 and bind rows
+    rows = list(acc.rows())
     labels = ["category", "sample", "counts"]
-    df = pd.DataFrame.from_records(lines, columns=labels)
-    df.counts = df.counts.astype(int)
-    df_sum = df.groupby(['category', 'sample'], as_index=False).sum()
-    df_sum['category'] = ["%s_sum" % r for r in df_sum['category']]
-    df_sum = _add_missing(df_sum)
-    df_count = df.groupby(['category', 'sample'], as_index=False).count()
-    df_count['category'] = ["%s_count" % r for r in df_count['category']]
-    df_count = _add_missing(df_count)
-    df_mean = df.groupby(['category', 'sample'], as_index=False).mean()
-    df_mean['category'] = ["%s_mean" % r for r in df_mean['category']]
-    df_mean = _add_missing(df_mean)
-    df = pd.concat([df_sum, df_count, df_mean])
+    out = []
+    for suffix, column in [("sum", 2), ("count", 3), ("mean", 4)]:
+        df = pd.DataFrame.from_records(
+            [("%s_%s" % (r[0], suffix), r[1], r[column]) for r in rows],
+            columns=labels)
+        out.append(_add_missing(df))
+    df = pd.concat(out)
     return df
 
 
@@ -3,7 +3,7 @@ from __future__ import print_function
 import sys
 import os
 
-from mirtop.gff.classgff import feature
+from mirtop.gff.classgff import read_features
 from mirtop.gff.header import read_version, get_gff_version
 from mirtop.mirna.keys import *
 from mirtop.mirna.realign import make_id
@@ -42,10 +42,15 @@ def read_uid_10(idu):
     return seq
 
 
-def to10to11(gff_line):
-    gff_line = gff_line.replace("_snp", "_snv")
-    gff_line = gff_line.replace("_add", "_add3p")
-    features = feature(gff_line)
+def _to11(text):
+    return text.replace("_snp", "_snv").replace("_add", "_add3p")
+
+
+def to10to11(features):
+    for col in features.columns:
+        features.columns[col] = _to11(features.columns[col])
+    for key in features.attributes:
+        features.attributes[key] = _to11(features.attributes[key])
     if "iso_5p" in features.attributes["Variant"]:
         variants = features.attributes["Variant"].split(",")
         iso_5p = [v.split(":") for v in variants if v.startswith("iso_5p")]
@@ -69,11 +74,12 @@ def update_file(gff_file, new_gff_file):
     outh = sys.stdout if not new_gff_file else open(new_gff_file, 'w')
     with open(gff_file) as inh:
         for line in inh:
+            if not line.startswith("#"):
+                break
             if line.find("VERSION") > -1:
                 print(get_gff_version(), file=outh)
-                continue
-            if line.startswith("##"):
+            elif line.startswith("##"):
                 print(line.strip(), file=outh)
-                continue
-            for updates in range(init, len(functions)):
-                print(functions[updates](line), file=outh)
+    for features in read_features(gff_file):
+        for updates in range(init, len(functions)):
+            print(functions[updates](features), file=outh)
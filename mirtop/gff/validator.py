@@ -1,4 +1,4 @@
-from mirtop.gff.classgff import feature
+from mirtop.gff.classgff import read_features
 import mirtop.libs.logger as mylog
 from mirtop.gff import gff_versions as version
 from mirtop.mirna.realign import read_id
@@ -27,10 +27,9 @@ def _check_header(header):
     return [all_present, num_samples]
 
 
-def _check_line(line, num, num_samples):
+def _check_line(gff, num, num_samples):
     """ Check file for minimum
     """
-    gff = feature(line)
     fields = gff.columns
     attr = gff.attributes
     errors = 0
@@ -129,12 +128,8 @@ def _check_file(file):
         errors += 1
     logger.info("HEADER CHECKED")
     # Check lines
-    with open(file) as ch:
-        for num, line in enumerate(ch, 1):
-            if line.startswith("##"):
-                next
-            else:
-                errors += _check_line(line, num, num_samples)
+    for num, gff in read_features(file, numbered=True):
+        errors += _check_line(gff, num, num_samples)
     return errors
 
 
@@ -5,9 +5,8 @@ from collections import defaultdict
 import os
 
 import mirtop.libs.logger as mylog
-from mirtop.bam.bam import intersect
-from mirtop.bam import filter
-from mirtop.mirna.mapper import get_primary_transcript, guess_database
+from mirtop.bam import filter, intervals
+from mirtop.mirna.mapper import guess_database
 from mirtop.mirna.realign import isomir, reverse_complement, make_id, hits
 from mirtop.gff.body import paste_columns, variant_with_nt
 # from mirtop.mirna import mapper
@@ -38,55 +37,40 @@ def read_file(fn, database, args):
     reads = defaultdict(dict)
     sample = os.path.splitext(os.path.basename(fn))[0]
     precursors = args.precursors
-    bed_fn = os.path.join(args.out, os.path.basename(fn) + ".bed")
     sep = " " if args.out_format == "gtf" else "="
     seen = set()
+    index = intervals.index().load(args.gtf, guess_database(args))
     with open(fn, 'r') as handle:
-        if not os.path.exists(bed_fn):
-            _bed(handle, bed_fn)
-    intersect_fn = intersect(bed_fn, args.gtf)
-    for line in intersect_fn:
-        data = _analyze_line(line, precursors, database, sample, sep, args)
-        if data:
-            start = data["start"]
-            chrom = data["chrom"]
-            key = "%s:%s" % (data['mirna'], data["name"])
-            if start not in reads[chrom]:
-                reads[chrom][start] = []
-            if key not in seen:
-                seen.add(key)
-                reads[chrom][start].append(data["line"])
+        for aln in _alignments(handle):
+            for record in index.overlap(aln[0], aln[1], aln[2], aln[5]):
+                data = _analyze_line(aln, record, precursors, database,
+                                     sample, sep, args)
+                if data:
+                    start = data["start"]
+                    chrom = data["chrom"]
+                    key = "%s:%s" % (data['mirna'], data["name"])
+                    if start not in reads[chrom]:
+                        reads[chrom][start] = []
+                    if key not in seen:
+                        seen.add(key)
+                        reads[chrom][start].append(data["line"])
     return reads
 
 
-def _analyze_line(line, precursors, database, sample, sep, args):
-    start_idx = 10
-    end_idx = 11
-    attr_idx = 15
+def _analyze_line(line, record, precursors, database, sample, sep, args):
     query_name = line[3]
     sequence = line[4]
-    if str(line).find(get_primary_transcript(guess_database(args))) < 0: # only working with mirbase
-        return None
-
     logger.debug(("READ::line name:{0}").format(line))
     if sequence and sequence.find("N") > -1:
         return None
 
-    chrom = line[attr_idx].strip().split("Name=")[-1]
-    start = line[1]
-    end = line[2]
+    chrom = record[2]
     strand = line[5]
     counts = float(line[6])
     Filter = "Pass"
     reads = dict()
-    if not start:
-        return None
-    if strand == "+":
-        start = int(start) - int(line[start_idx]) + 1
-    else:
-        start = int(line[end_idx]) - int(end)
+    start = intervals.lift(record, line[1], line[2], strand)
     iso = isomir()
-    iso.align = line
     iso.set_pos(start, len(sequence))
     logger.debug("READ::From BAM start %s end %s at chrom %s" % (iso.start, iso.end, chrom))
     if len(precursors[chrom]) < start + len(sequence):
@@ -126,29 +110,31 @@ def _analyze_line(line, precursors, database, sample, sep, args):
             'line': [idu, chrom, counts, sample, line]}
 
 
-def _bed(handle, bed_fn):
-    with open(bed_fn, 'w') as outh:
-        for line in handle:
-            if line.startswith("@"):
-                continue
-            cols = line.strip().split()
-            if cols[2]=="*":
-                logger.debug("READ::Sequence not mapped: %s" % cols[0])
-                continue
-            query_name = cols[0]
-            query_sequence = cols[9]
-            counts = cols[14]
-            start = int(cols[3])
-            strand = "-" if cols[1] == "16" else "+"
-            chrom = cols[2]
-            # if there no hits
-            # if the sequence always matching the read, assuming YES now
-            # if not current or query_name!=current:
-            query_sequence = query_sequence if not strand=="-" else reverse_complement(query_sequence)
-            # logger.debug(("READ::Read name:{0} and Read sequence:{1}").format(line.query_name, sequence))
-            if query_sequence and query_sequence.find("N") > -1:
-                continue
-            end = start + len(query_sequence) - 1
-            bed_line = "\t".join(list(map(str, [chrom, start, end, query_name,
-                                                query_sequence, strand, counts])))
-            outh.write(bed_line + '\n')
+def _alignments(handle):
+    """
+    Alignments of a Manatee file as (chrom, start, end, name, sequence,
+    strand, counts) tuples, *start* and *end* being the interval
+    compared with the precursors by *mirtop.bam.intervals.index*.
+    """
+    for line in handle:
+        if line.startswith("@"):
+            continue
+        cols = line.strip().split()
+        if cols[2]=="*":
+            logger.debug("READ::Sequence not mapped: %s" % cols[0])
+            continue
+        query_name = cols[0]
+        query_sequence = cols[9]
+        counts = cols[14]
+        start = int(cols[3])
+        strand = "-" if cols[1] == "16" else "+"
+        chrom = cols[2]
+        # if there no hits
+        # if the sequence always matching the read, assuming YES now
+        # if not current or query_name!=current:
+        query_sequence = query_sequence if not strand=="-" else reverse_complement(query_sequence)
+        # logger.debug(("READ::Read name:{0} and Read sequence:{1}").format(line.query_name, sequence))
+        if query_sequence and query_sequence.find("N") > -1:
+            continue
+        end = start + len(query_sequence) - 1
+        yield (chrom, start, end, query_name, query_sequence, strand, counts)
@@ -78,7 +78,6 @@ def read_file(fn, hairpins, database, mirna_gtf):
                              "  reference_start: {reference_start}\n"
                              "  mirna: {miRNA}".format(**locals()))
                 iso = isomir()
-                iso.align = line
                 iso.set_pos(reference_start, len(reads[query_name].sequence))
                 logger.debug("PROST!:: start %s end %s" % (iso.start, iso.end))
                 if len(hairpins[preName]) < reference_start + len(reads[query_name].sequence):
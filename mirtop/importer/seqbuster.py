@@ -6,10 +6,13 @@ import mirtop.libs.logger as mylog
 from mirtop.mirna.realign import isomir, hits
 from mirtop.bam import filter
 from mirtop.gff import body
-from mirtop.mirna.annotate import annotate
 
 logger = mylog.getLogger(__name__)
 
+# number of lines realigned together, and annotated together
+# with --low-memory
+BLOCK_SIZE = 10000
+
 
 def header():
     """
@@ -41,44 +44,82 @@ def read_file(fn, args):
     """
     precursors = args.precursors
     reads = defaultdict(hits)
-    col_fix = 0
     with open(fn) as handle:
-        header = handle.readline()
-        if header.find("freq") < 0:
-            col_fix = 1
-        for line in handle:
-            reads.update(_read_line(line, col_fix, precursors))
+        # the hit of the last line of each read is kept
+        for query_name, hit in _read_hits(handle, precursors):
+            reads[query_name] = hit
     logger.info("Hits: %s" % len(reads))
     return reads
 
 
 def read_file_low_memory(fn, sample, args, out_handle):
+    """
+    Realign, annotate and write the GFF lines of a seqbuster file
+    by chunks of BLOCK_SIZE lines.
+
+    The output is the same than processing each line by itself:
+    lines are written in the order of the file.
+    """
     precursors = args.precursors
-    reads = defaultdict(hits)
-    col_fix = 0
+    reads = dict()
     with open(fn) as handle:
-        header = handle.readline()
-        if header.find("freq") < 0:
-            col_fix = 1
-        for line in handle:
-            reads = _read_line(line, col_fix, precursors)
-            ann = annotate(reads, args.matures, args.precursors, quiet=True)
-            gff_lines = body.create(ann, args.database, sample, args, quiet=True)
-            body.write_body_on_handle(gff_lines, out_handle)
+        for query_name, hit in _read_hits(handle, precursors):
+            # a repeated read starts a new chunk to write both lines
+            if query_name in reads or len(reads) >= BLOCK_SIZE:
+                body.write_chunk(reads, sample, args, out_handle)
+                reads = dict()
+            reads[query_name] = hit
+    body.write_chunk(reads, sample, args, out_handle)
 
 
-def _read_line(line, col_fix, precursors):
-    reads = defaultdict(hits)
+def _read_hits(handle, precursors):
+    """
+    Read the lines after the header and realign them
+    in blocks of BLOCK_SIZE lines.
+
+    Returns:
+        *(generator)* of (read name, *mirtop.realign.hits*) for
+            each valid line, in the order of the file.
+    """
+    col_fix = 0
+    header = handle.readline()
+    if header.find("freq") < 0:
+        col_fix = 1
+    block = []
+    pending = []
+    for line in handle:
+        read = _read_line(line, col_fix, precursors, pending)
+        if read:
+            block.append(read)
+        if len(block) >= BLOCK_SIZE:
+            _tune_pending(pending)
+            for read in block:
+                yield read
+            block = []
+    _tune_pending(pending)
+    for read in block:
+        yield read
+
+
+def _read_line(line, col_fix, precursors, pending=None):
+    """
+    Read a line of a seqbuster file.
+
+    Returns:
+        *(tuple)*: read name and a new *mirtop.realign.hits*,
+            or None if the sequence has Ns. If *pending* is given,
+            the hit is added to it to be realigned later.
+    """
     cols = line.strip().split("\t")
     query_name = cols[1]
     query_sequence = cols[0]
     reference_start = int(cols[4-col_fix]) - 1
     seqbuster_iso = ":".join(cols[6-col_fix:10-col_fix])
     if query_sequence and query_sequence.find("N") > -1:
-        return reads
-    if query_name not in reads:
-        reads[query_name].set_sequence(query_sequence)
-        reads[query_name].counts = _get_freq(query_name)
+        return None
+    read = hits()
+    read.set_sequence(query_sequence)
+    read.counts = _get_freq(query_name)
     chrom = cols[13-col_fix]
     logger.debug("\nSEQBUSTER::NEW::query: {query_sequence}\n"
                  "  precursor: {chrom}\n"
@@ -87,20 +128,36 @@ def _read_line(line, col_fix, precursors):
                  "  iso: {seqbuster_iso}".format(**locals()))
     # logger.debug("SEQBUSTER:: cigar {cigar}".format(**locals()))
     iso = isomir()
-    iso.align = line
-    iso.set_pos(reference_start, len(reads[query_name].sequence))
+    iso.set_pos(reference_start, len(read.sequence))
     logger.debug("\nSEQBUSTER:: start %s end %s" % (iso.start, iso.end))
-    if len(precursors[chrom]) < reference_start + len(reads[query_name].sequence):
-        logger.debug("\nSEQBUSTER::len precursor" % len(precursors[chrom]))
-        return reads
-    iso.subs, iso.add, iso.cigar = filter.tune(reads[query_name].sequence,
-                                               precursors[chrom],
-                                               reference_start, None)
+    if len(precursors[chrom]) < reference_start + len(read.sequence):
+        logger.debug("\nSEQBUSTER::len precursor %s" % len(precursors[chrom]))
+        return query_name, read
+    if pending is not None:
+        pending.append((read, chrom, iso,
+                        (read.sequence, chrom, precursors[chrom],
+                         reference_start, None)))
+        return query_name, read
+    iso.subs, iso.add, iso.cigar = filter.tune_cached(
+        read.sequence, chrom, precursors[chrom],
+        reference_start, None)
     logger.debug("\nSEQBUSTER::After tune start %s end %s" % (iso.start, iso.end))
     if len(iso.subs) < 6:
         logger.debug("\nSEQBUSTER::iso.subs %s - length %s" % (iso.subs, len(iso.subs)))
-        reads[query_name].set_precursor(chrom, iso)
-    return reads
+        read.set_precursor(chrom, iso)
+    return query_name, read
+
+
+def _tune_pending(pending):
+    """Realign the hits saved by *_read_line()* and add them to the reads."""
+    if not pending:
+        return
+    results = filter.tune_many([item[3] for item in pending])
+    for (hit, chrom, iso, _), (subs, add, cigar) in zip(pending, results):
+        iso.subs, iso.add, iso.cigar = subs, add, cigar
+        if len(iso.subs) < 6:
+            hit.set_precursor(chrom, iso)
+    del pending[:]
 
 
 def _get_freq(name):
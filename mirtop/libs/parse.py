@@ -18,7 +18,8 @@ def parse_cl(in_args):
                 "validate": _add_subparser_validator,
                 "spikein": _add_subparser_spikein,
                 "update": _add_subparser_update,
-		"sql": _add_subparser_sql
+		"sql": _add_subparser_sql,
+                "reference": _add_subparser_reference
                 }
     parser = argparse.ArgumentParser(description="small RNA analysis")
     parser.add_argument("--version", action="store_true",help="show version.")
@@ -63,6 +64,8 @@ def _add_subparser_stats(subparsers):
     parser.add_argument("files", nargs="*", help="GFF/GTF files.")
     parser.add_argument("-o", "--out", dest="out", default="tmp_mirtop",
                         help="folder of output files")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of files processed at the same time.")
     parser = _add_debug_option(parser)
     return parser
 
@@ -73,6 +76,8 @@ def _add_subparser_compare(subparsers):
                                                  "First will be used as reference.")
     parser.add_argument("-o", "--out", dest="out", default="tmp_mirtop",
                         help="folder of output files")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of files compared at the same time.")
     parser = _add_debug_option(parser)
     return parser
 
@@ -108,6 +113,23 @@ def _add_subparser_gff(subparsers):
                         help="output in genomic coordinates.")
     parser.add_argument("--low-memory", action="store_true", default=False,
                         help="Read File by chunks. Only supported for BAM files.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Number of processes used to realign BAM files.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of files processed at the same time.")
+    parser.add_argument("--precursors", dest="precursor_names", default=None,
+                        help="Comma separated list of precursors (or patterns"
+                             " like hsa-let-7*) to read from BAM files sorted"
+                             " by coordinate and indexed. Hits to other"
+                             " precursors are not read, so reads mapping to"
+                             " several ones can be annotated differently"
+                             " than in a run with all of them.")
+    parser.add_argument("--chunk-reads", type=int, default=50000,
+                        help="Number of reads processed together with"
+                             " --low-memory.")
+    parser.add_argument("--chunk-bytes", type=int, default=100000000,
+                        help="Approximate bytes of the alignments processed"
+                             " together with --low-memory.")
     parser = _add_debug_option(parser)
     return parser
 
@@ -121,8 +143,9 @@ def _add_subparser_export(subparsers):
                         help="species")
     parser.add_argument("--hairpin", help="hairpin.fa")
     parser.add_argument("--gtf", help="gtf file with precursor and mature position to genome.")
-    parser.add_argument("--format", help="Output format",
-                        choices=['seqbuster', 'fasta', 'vcf', 'isomir'], default="isomir")
+    parser.add_argument("--format", help="Output formats separated by comma: "
+                        "seqbuster, fasta, vcf, isomir. The GFF files are "
+                        "read once for all of them.", default="isomir")
     parser = _add_debug_option(parser)
     return parser
 
@@ -167,6 +190,12 @@ def _add_subparser_counts(subparsers):
     parser.add_argument("--gtf", help="gtf/gff file with precursor and mature position to genome.")
     parser.add_argument("--sps",
                         help="species")
+    parser.add_argument("--matrix", action="append", choices=["mtx", "parquet", "hdf5"],
+                        help="Write the counts as well as Matrix Market, parquet"
+                             " or hdf5 files. It can be used more than once.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of processes used to add the nts changes"
+                             " with --add-extra.")
     parser = _add_debug_option(parser)
     return parser
 
@@ -200,6 +229,28 @@ def _add_subparser_update(subparsers):
     return parser
 
 
+def _add_subparser_reference(subparsers):
+    from mirtop.mirna.reference import cache_dir, CACHE_ENV
+    parser = subparsers.add_parser("reference",
+                                   help="compile hairpin and miRNA files"
+                                        " to load them faster.")
+    parser.add_argument("action", choices=["build"],
+                        help="build: save the compiled reference.")
+    parser.add_argument("--hairpin", required=1, help="hairpin.fa")
+    parser.add_argument("--gtf", required=1,
+                        help="GFF file with precursor and mature position to genome.")
+    parser.add_argument("--sps",
+                        help="species")
+    parser.add_argument("--database", help="Custom database name",
+                        default=None)
+    parser.add_argument("-o", "--out", dest="out", default=cache_dir(),
+                        help="folder of the compiled reference. Commands look"
+                             " for it in $%s (default: %s)." % (CACHE_ENV,
+                                                                cache_dir()))
+    parser = _add_debug_option(parser)
+    return parser
+
+
 def _add_subparser_sql(subparsers):
     parser = subparsers.add_parser("sql", help="SQL create or query from GFF.", formatter_class=argparse.RawTextHelpFormatter, )
     #parser.add_argument("--gff", help="GFF file with precursor and mature position to genome.")
@@ -212,6 +263,11 @@ def _add_subparser_sql(subparsers):
     group1 = parser.add_argument_group('SQL create usage mode')
     group1.add_argument("--gff", metavar='', help="GFF file with precursor and mature position to genome")
     group1.add_argument("-o", "--out", metavar='', dest="out", default="tmp_mirtop", help="Directory of output files")
+    group1.add_argument("--schema", metavar='', choices=["wide", "long"], default="wide",
+                        help="""Layout of the counts (Default: wide)
+        wide                     - one column for each sample in data_sets
+        long                     - isomirs and samples tables, and one row for each
+                                   isomiR and sample with counts in expression""")
 
     group2 = parser.add_argument_group('SQL query usage mode') 
     group2.add_argument("-t", "--table", metavar='', help="Specify table name to use")
@@ -246,6 +302,7 @@ def _add_subparser_sql(subparsers):
        show-columns             - Displays available columns in the table
        describe-gff             - Prints out the header information from the GFF file
        isomirs-per-mirna        - Displays the count of isomiRs for miRNA (requires -miR)
+       isomirs-per-sample       - Displays the count of isomiRs and reads for each sample
        select                   - Allows specific query construction. 
                                   Example: mirtop sql --db tmp_mirtop/SRR333680_revised2.db -qe select -var iso_5p,iso_3p -miR hsa-let-7a-5p,hsa-let-7d-5p -l 30
                                   The above expression evaluates to selecting miRNAs in -miR with variants in -var and prints out first 30 rows in --limit 
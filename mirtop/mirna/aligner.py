@@ -0,0 +1,356 @@
+"""Banded global aligner for small RNA sequences
+
+Scores are the ones used by *mirtop.mirna.realign.align()*: match 1,
+mismatch -1, gap open -1 and gap extension -0.5, penalizing gaps at the
+ends. The fill and traceback follow Bio.pairwise2.align.globalms, so the
+alignment returned is the first one pairwise2 reports, but only the
+cells close to the diagonal are computed. Scores are kept multiplied
+by 2 to work with integers.
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+MATCH = 2
+MISMATCH = -2
+GAP_OPEN = -2
+GAP_EXTEND = -1
+
+# diagonals computed at each side of the ones joining both corners
+BAND = 4
+
+# min number of pairs with the same sizes to fill the matrices with numpy
+MIN_BATCH = 32
+
+_NEG = -(1 << 30)
+
+
+class _OutOfBand(Exception):
+    pass
+
+
+def _gap(length):
+    """Penalty of a gap of *length* nts."""
+    if length <= 0:
+        return 0
+    return GAP_OPEN + GAP_EXTEND * (length - 1)
+
+
+def global_align(x, y, band=BAND):
+    """
+    Global alignment of two short sequences.
+
+    Args:
+        *x(str)*: short sequence.
+
+        *y(str)*: long sequence.
+
+        *band(int)*: extra diagonals to compute at each side. The
+            full matrix is used when the best alignment could be
+            outside the band.
+
+    Returns:
+        *(tuple)*: aligned x, aligned y, score, begin and end, as
+            *Bio.pairwise2.align.globalms(x, y, 1, -1, -1, -0.5)[0]*.
+    """
+    return _global_align(x, y, band)
+
+
+@lru_cache(maxsize=100000)
+def _global_align(x, y, band):
+    n, m = len(x), len(y)
+    if not n or not m:
+        size = max(n, m)
+        return (x + "-" * (size - n), y + "-" * (size - m),
+                _gap(size) / 2.0, 0, size)
+    ungapped = _ungapped(x, y)
+    if ungapped:
+        return ungapped
+    if band < max(n, m):
+        score, trace = _fill(x, y, band)
+        found = _from_matrices(x, y, score, trace, band)
+        if found:
+            return found
+    score, trace = _fill(x, y, max(n, m))
+    return _from_matrices(x, y, score, trace, max(n, m))
+
+
+def _ungapped(x, y):
+    """Alignment without gaps when it is for sure the only best one.
+
+    Any alignment with gaps of two sequences with the same size
+    scores n - 3 at most, so with up to one mismatch the alignment
+    without gaps is the best one."""
+    if len(x) != len(y):
+        return None
+    mismatches = 0
+    for a, b in zip(x, y):
+        if a != b:
+            mismatches += 1
+            if mismatches > 1:
+                return None
+    return x, y, float(len(x) - 2 * mismatches), 0, len(x)
+
+
+def _from_matrices(x, y, score, trace, band):
+    """Traceback of filled matrices, None if the band is too narrow."""
+    n, m = len(x), len(y)
+    if band < max(n, m):
+        # best score of any path that leaves the band
+        gaps = abs(m - n) + 2 * (band + 1)
+        if score[n][m] <= n + m - 2 * gaps - 2:
+            return None
+    try:
+        ali_x, ali_y = _recover(x, y, score, trace)
+    except _OutOfBand:
+        return None
+    return ali_x, ali_y, score[n][m] / 2.0, 0, len(ali_x)
+
+
+def align_many(pairs, band=BAND):
+    """
+    Align a list of (read, reference) pairs.
+
+    Pairs with the same sizes are filled together with numpy,
+    the traceback is done for each pair.
+
+    Args:
+        *pairs(list)*: list of (x, y) sequences.
+
+        *band(int)*: see *global_align()*.
+
+    Returns:
+        *(list)* with the output of *global_align()* for each pair.
+    """
+    aligned = dict()
+    by_size = defaultdict(list)
+    for pair in pairs:
+        if pair in aligned:
+            continue
+        x, y = pair
+        aligned[pair] = _ungapped(x, y) if x and y else None
+        if not aligned[pair]:
+            by_size[(len(x), len(y))].append(pair)
+    for (n, m), todo in by_size.items():
+        if len(todo) < MIN_BATCH or not n or not m or band >= max(n, m):
+            for x, y in todo:
+                aligned[(x, y)] = _global_align(x, y, band)
+            continue
+        scores, traces = _fill_many(todo, band)
+        for idx, (x, y) in enumerate(todo):
+            found = _from_matrices(x, y, scores[idx].tolist(),
+                                   traces[idx].tolist(), band)
+            aligned[(x, y)] = found if found else _global_align(x, y, band)
+    return [aligned[pair] for pair in pairs]
+
+
+def _fill_many(pairs, band):
+    """Same than *_fill()* for many pairs with the same sizes."""
+    size = len(pairs)
+    n, m = len(pairs[0][0]), len(pairs[0][1])
+    lo = min(0, m - n) - band
+    hi = max(0, m - n) + band
+    xs = np.frombuffer("".join(x for x, y in pairs).encode(), dtype=np.uint8)
+    ys = np.frombuffer("".join(y for x, y in pairs).encode(), dtype=np.uint8)
+    nts = np.where(xs.reshape(size, n)[:, :, None] == ys.reshape(size, m)[:, None, :],
+                   MATCH, MISMATCH).astype(np.int32)
+    score = np.full((size, n + 1, m + 1), _NEG, dtype=np.int32)
+    trace = np.full((size, n + 1, m + 1), -1, dtype=np.int8)
+    score[:, :, 0] = [_gap(row) for row in range(n + 1)]
+    score[:, 0, :] = [_gap(col) for col in range(m + 1)]
+    trace[:, :, 0] = 0
+    trace[:, 0, :] = 0
+    col_score = np.empty((size, m + 1), dtype=np.int32)
+    col_score[:] = [0] + [_gap(col) + GAP_OPEN for col in range(1, m + 1)]
+    for row in range(1, n + 1):
+        first = max(1, row + lo)
+        last = min(m, row + hi)
+        row_score = np.full(size, _gap(row) + GAP_OPEN if first == 1 else _NEG,
+                            dtype=np.int32)
+        for col in range(first, last + 1):
+            if row > 1 and col - row + 1 > hi:
+                col_score[:, col] = _NEG
+            nogap = score[:, row - 1, col - 1] + nts[:, row - 1, col - 1]
+            row_open = score[:, row, col - 1] + GAP_OPEN
+            row_extend = row_score + GAP_EXTEND
+            row_score = np.maximum(row_open, row_extend)
+            col_open = score[:, row - 1, col] + GAP_OPEN
+            col_extend = col_score[:, col] + GAP_EXTEND
+            gap = np.maximum(col_open, col_extend)
+            col_score[:, col] = gap
+            best = np.maximum(np.maximum(nogap, gap), row_score)
+            score[:, row, col] = best
+            in_row = row_score == best
+            in_col = gap == best
+            trace[:, row, col] = (2 * (nogap == best) +
+                                  in_row * (row_open == best) +
+                                  8 * (in_row & (row_extend == best)) +
+                                  4 * (in_col & (col_open == best)) +
+                                  16 * (in_col & (col_extend == best)))
+    return score, trace
+
+
+def _fill(x, y, band):
+    """Score and traceback matrices as in pairwise2 (Gotoh).
+
+    Trace bits: 1 open gap in x, 2 match/mismatch, 4 open gap in y,
+    8 extend gap in x and 16 extend gap in y. Cells outside the
+    band have trace -1."""
+    n, m = len(x), len(y)
+    lo = min(0, m - n) - band
+    hi = max(0, m - n) + band
+    score = [[_NEG] * (m + 1) for _ in range(n + 1)]
+    trace = [[-1] * (m + 1) for _ in range(n + 1)]
+    for row in range(n + 1):
+        score[row][0] = _gap(row)
+        trace[row][0] = 0
+    for col in range(m + 1):
+        score[0][col] = _gap(col)
+        trace[0][col] = 0
+    col_score = [0] + [_gap(col) + GAP_OPEN for col in range(1, m + 1)]
+    for row in range(1, n + 1):
+        first = max(1, row + lo)
+        last = min(m, row + hi)
+        if first == 1:
+            row_score = _gap(row) + GAP_OPEN
+        else:
+            row_score = _NEG
+        prev = score[row - 1]
+        current = score[row]
+        trace_row = trace[row]
+        nt = x[row - 1]
+        for col in range(first, last + 1):
+            if row > 1 and col - row + 1 > hi:
+                col_score[col] = _NEG
+            nogap = prev[col - 1] + (MATCH if nt == y[col - 1] else MISMATCH)
+            row_open = current[col - 1] + GAP_OPEN
+            row_extend = row_score + GAP_EXTEND
+            row_score = row_open if row_open > row_extend else row_extend
+            col_open = prev[col] + GAP_OPEN
+            col_extend = col_score[col] + GAP_EXTEND
+            gap = col_open if col_open > col_extend else col_extend
+            col_score[col] = gap
+            best = nogap
+            if gap > best:
+                best = gap
+            if row_score > best:
+                best = row_score
+            current[col] = best
+            bits = 2 if nogap == best else 0
+            if row_score == best:
+                if row_open == best:
+                    bits += 1
+                if row_extend == best:
+                    bits += 8
+            if gap == best:
+                if col_open == best:
+                    bits += 4
+                if col_extend == best:
+                    bits += 16
+            trace_row[col] = bits
+    return score, trace
+
+
+def _recover(x, y, score, trace):
+    """First alignment of the pairwise2 traceback."""
+    n, m = len(x), len(y)
+    found = _traceback(x, y, score, trace)
+    if found:
+        return found
+    # same fallback than pairwise2: traceback on the transposed matrices
+    swap = {1: 4, 4: 1, 8: 16, 16: 8, 2: 2}
+    tscore = [[score[row][col] for row in range(n + 1)] for col in range(m + 1)]
+    ttrace = [[sum(swap[bit] for bit in swap if bit & trace[row][col])
+               if trace[row][col] > 0 else trace[row][col]
+               for row in range(n + 1)] for col in range(m + 1)]
+    found = _traceback(y, x, tscore, ttrace)
+    if found:
+        return found[1], found[0]
+    return "", ""
+
+
+def _traceback(x, y, score, trace):
+    stack = [("", "", len(x), len(y), False, trace[len(x)][len(y)])]
+    while stack:
+        dead_end = False
+        ali_x, ali_y, row, col, col_gap, bits = stack.pop()
+        while (row > 0 or col > 0) and not dead_end:
+            cache = (ali_x, ali_y, row, col, col_gap)
+            if bits < 0:
+                raise _OutOfBand()
+            if not bits:
+                if col and col_gap:
+                    dead_end = True
+                else:
+                    ali_x += x[row - 1::-1] if row else ""
+                    ali_y += y[col - 1::-1] if col else ""
+                    ali_x += "-" * (len(ali_y) - len(ali_x))
+                    ali_y += "-" * (len(ali_x) - len(ali_y))
+                break
+            elif bits % 2 == 1:
+                bits -= 1
+                if col_gap:
+                    dead_end = True
+                else:
+                    col -= 1
+                    ali_x += "-"
+                    ali_y += y[col]
+            elif bits % 4 == 2:
+                bits -= 2
+                row -= 1
+                col -= 1
+                ali_x += x[row]
+                ali_y += y[col]
+                col_gap = False
+            elif bits % 8 == 4:
+                bits -= 4
+                row -= 1
+                ali_x += x[row]
+                ali_y += "-"
+                col_gap = True
+            elif bits in (8, 24):
+                bits -= 8
+                if col_gap:
+                    dead_end = True
+                else:
+                    ali_x, ali_y, row, col, dead_end = _gap_open(
+                        x, y, ali_x, ali_y, row, col, col_gap,
+                        score, trace, stack, "col")
+            elif bits == 16:
+                bits -= 16
+                col_gap = True
+                ali_x, ali_y, row, col, dead_end = _gap_open(
+                    x, y, ali_x, ali_y, row, col, col_gap,
+                    score, trace, stack, "row")
+            if bits:
+                stack.append(cache + (bits,))
+            bits = trace[row][col]
+        if not dead_end:
+            return ali_x[::-1], ali_y[::-1]
+    return None
+
+
+def _gap_open(x, y, ali_x, ali_y, row, col, col_gap, score, trace,
+              stack, direction):
+    """Walk back an extended gap saving the places where it could open."""
+    dead_end = False
+    target_score = score[row][col]
+    for size in range(col if direction == "col" else row):
+        if direction == "col":
+            col -= 1
+            ali_x += "-"
+            ali_y += y[col]
+        else:
+            row -= 1
+            ali_x += x[row]
+            ali_y += "-"
+        if score[row][col] + _gap(size + 1) == target_score and size > 0:
+            if not trace[row][col]:
+                break
+            else:
+                stack.append((ali_x, ali_y, row, col, col_gap,
+                              trace[row][col]))
+        if not trace[row][col]:
+            dead_end = True
+    return ali_x, ali_y, row, col, dead_end
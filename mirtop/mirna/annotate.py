@@ -1,5 +1,5 @@
 """ Read bam files"""
-import copy
+from bisect import bisect_left, bisect_right
 
 import mirtop.libs.logger as mylog
 
@@ -55,6 +55,59 @@ def _coord(sequence, start, mirna, precursor, iso):
     return True
 
 
+def mature_index(mature_ref):
+    """
+    Index the mature positions of each precursor, sorted by start,
+    with the windows where a read can start (+/-6 nts) and end
+    (+/-7 nts) to be annotated as an isomiR of the mature.
+
+    The index of the last *mature_ref* used is kept in memory and
+    reused while the same dict is given, so *mature_ref* must not be
+    changed after it is used: create a new dict to use other matures.
+
+    Args:
+        *mature_ref (dict of mirna positions)*:
+            dict object that comes from *mirtop.mirna.mapper.read_gtf_to_precursor()*
+
+    Return:
+        *index (dict)*:
+            keys are precursors and values a tuple with the sorted
+            list of the first start allowed for each mature and
+            the list of (start_min, start_max, end_min, end_max,
+            order, mature name, mature positions).
+    """
+    if _index["ref"] is mature_ref:
+        return _index["index"]
+    index = dict()
+    for precursor in mature_ref:
+        windows = []
+        for order, mature in enumerate(mature_ref[precursor]):
+            mi = mature_ref[precursor][mature]
+            windows.append((mi[0] - 6, mi[0] + 6, mi[1] - 7, mi[1] + 7,
+                            order, mature, mi))
+        windows.sort()
+        index[precursor] = ([w[0] for w in windows], windows)
+    _index["ref"] = mature_ref
+    _index["index"] = index
+    return index
+
+
+_index = {"ref": None, "index": None}
+
+
+def _matches(index, precursor, start, end):
+    """Matures of the precursor whose windows contain start and end,
+    in the same order than in the reference."""
+    if precursor not in index:
+        return []
+    starts, windows = index[precursor]
+    first = bisect_left(starts, start - 12)
+    last = bisect_right(starts, start)
+    found = [w for w in windows[first:last]
+             if w[1] >= start and w[2] <= end <= w[3]]
+    return sorted(found, key=lambda w: w[4])
+
+
 def annotate(reads, mature_ref, precursors, quiet=False):
     """
     Using coordinates, mismatches and realign to annotate isomiRs
@@ -77,35 +130,27 @@ def annotate(reads, mature_ref, precursors, quiet=False):
     """
     n_iso = 0
     n_skip_precursor = 0
+    index = mature_index(mature_ref)
     for r in reads:
         logger.debug(("\nANN::READ::read {r}").format(**locals()))
         for ps in reads[r].precursors:
-            p = list(ps)[0]
-            start = reads[r].precursors[ps].start
-            end = reads[r].precursors[ps].end
-            logger.debug(("\nANN::READ::precursor {start} {end}").format(**locals()))
-            for mature in mature_ref[p]:
-                mi = mature_ref[p][mature]
-                logger.debug(("\nANN::NEW::read:{s}\n pre:{p} start:{start} end: {end} "
-                              "cigar: {cigar} "
-                              "\n mir:{mature} mir_pos:{mi}\n mir_seqs:{mature_s}"
-                              ).format(s=reads[r].sequence,
-                                       mature_s = precursors[ps][mi[0]:mi[1] + 1],
-                                       cigar = reads[r].precursors[ps].cigar,
-                                       **locals()))
-                iso_copy = copy.deepcopy(reads[r].precursors[ps])
-                if not precursors[ps[0]]:
-                    n_skip_precursor += 1
-                    continue
-                is_iso = _coord(reads[r].sequence, start, mi, precursors[ps[0]], iso_copy)
-                logger.debug(("ANN::is_iso:{is_iso}").format(**locals()))
-                logger.debug("ANN::annotation:%s iso:%s" % (r, reads[r].precursors[ps].format()))
-                logger.debug("ANN::annotation:%s Variant:%s" % (r, reads[r].precursors[ps].formatGFF()))
-                if is_iso:
-                    n_iso += 1
-                    reads[r].precursors[ps] = iso_copy
-                    reads[r].precursors[ps].mirna = mature
-                    # break
+            p = ps[0]
+            iso = reads[r].precursors[ps]
+            logger.debug("\nANN::READ::precursor %s %s" % (iso.start, iso.end))
+            if not precursors.get(p):
+                n_skip_precursor += len(mature_ref.get(p, []))
+                continue
+            # when several matures are valid, the last one is kept
+            found = _matches(index, p, iso.start, iso.end)
+            if not found:
+                continue
+            n_iso += len(found)
+            mature, mi = found[-1][5], found[-1][6]
+            logger.debug("\nANN::NEW::read:%s pre:%s mir:%s mir_pos:%s" % (
+                reads[r].sequence, p, mature, mi))
+            if _coord(reads[r].sequence, iso.start, mi, precursors[p], iso):
+                iso.mirna = mature
+            logger.debug("ANN::annotation:%s Variant:%s" % (r, iso.formatGFF()))
     if not quiet:
         logger.info("Valid hits (+/- reference miRNA): %s" % n_iso)
         logger.info("Skipped due to not precursor sequence: %s" % n_skip_precursor)
@@ -21,21 +21,24 @@ def read_precursor(precursor, sps=None):
         *hairpin(dict)*: keys are precursor names and
             values are precursor sequences.
     """
-    hairpin = defaultdict(str)
+    sequences = defaultdict(list)
     name = None
     with open(precursor) as in_handle:
         for line in in_handle:
             if line.startswith(">"):
-                if name in hairpin:
-                    hairpin[name] = hairpin[name] + "NNNNNNNNNNNN"
+                if name in sequences:
+                    sequences[name].append("NNNNNNNNNNNN")
                 if not sps or line.find(sps) > -1:
                     name = line.strip().replace(">", " ").split()[0]
                 else:
                     name = None
                 logger.debug("PRECURSOR::name %s" % name)
             elif name:
-                hairpin[name] += line.strip().replace("U", "T")
-                logger.debug("PRECURSOR::sequence %s" % hairpin[name])
+                sequences[name].append(line.strip().replace("U", "T"))
+                logger.debug("PRECURSOR::sequence %s" % sequences[name][-1])
         if name:
-            hairpin[name] = hairpin[name] + "NNNNNNNNNNNN"
+            sequences[name].append("NNNNNNNNNNNN")
+    hairpin = defaultdict(str)
+    for name in sequences:
+        hairpin[name] = "".join(sequences[name])
     return hairpin
@@ -0,0 +1,105 @@
+"""Nucleotide operations shared by the readers and the realignment
+
+Sequences are kept as *str* along mirtop, since they are written as
+they are to the output files, and converted to NumPy arrays only to
+work with many sequences at the same time.
+"""
+import numpy as np
+
+# complement of the IUPAC codes, the same than Bio.Seq.reverse_complement()
+_COMPLEMENT = str.maketrans("ACGTUMRWSYKVHDBNXacgtumrwsykvhdbnx",
+                            "TGCAAKYWSRMBDHVNXtgcaakywsrmbdhvnx")
+
+_NTS = "ACGTacgt"
+
+
+def reverse_complement(seq):
+    """
+    Get reverse complement of a sequence.
+
+    Args:
+        *seq(str)*: sequence.
+
+    Returns:
+        *(str)*: reverse complement sequence.
+    """
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def is_valid(seq):
+    """
+    Whether a sequence only has A, C, G or T, in lower or upper case.
+
+    Args:
+        *seq(str)*: sequence.
+
+    Returns:
+        *(bool)*: True for valid sequences, including empty ones.
+    """
+    return not seq.strip(_NTS)
+
+
+def to_array(seqs):
+    """
+    Matrix with the ASCII codes of sequences with the same size.
+
+    Args:
+        *seqs(list)*: sequences with the same size.
+
+    Returns:
+        *(numpy.ndarray)*: uint8 matrix, one row for each sequence.
+    """
+    size = len(seqs[0]) if seqs else 0
+    return np.frombuffer("".join(seqs).encode(),
+                         dtype=np.uint8).reshape(len(seqs), size)
+
+
+def mismatches(seq, reference):
+    """
+    Positions where two sequences have different nts.
+
+    Args:
+        *seq(str)*: sequence.
+
+        *reference(str)*: sequence to compare with, only the
+            first *len(seq)* nts are used.
+
+    Returns:
+        *(list)* of 0-based positions.
+    """
+    size = min(len(seq), len(reference))
+    return np.flatnonzero(
+        np.frombuffer(seq[:size].encode(), dtype=np.uint8) !=
+        np.frombuffer(reference[:size].encode(), dtype=np.uint8)).tolist()
+
+
+def mismatch_matrix(seqs, references):
+    """
+    *mismatches()* for many sequences with the same size.
+
+    Args:
+        *seqs(list)*: sequences with the same size.
+
+        *references(list)*: sequences to compare with, one for each
+            sequence and with the same size.
+
+    Returns:
+        *(numpy.ndarray)*: boolean matrix, True where the nts are different.
+    """
+    return to_array(seqs) != to_array(references)
+
+
+def count_mismatches(seqs, references):
+    """
+    Number of mismatches of many sequences with the same size.
+
+    Args:
+        *seqs(list)*: sequences with the same size.
+
+        *references(list)*: sequences to compare with, one for each
+            sequence and with the same size.
+
+    Returns:
+        *(list)* with the number of mismatches of each sequence.
+    """
+    return mismatch_matrix(seqs, references).sum(axis=1).tolist()
@@ -1,31 +1,42 @@
-import re
-from Bio import pairwise2
-from Bio.Seq import Seq
+from sys import intern
 from collections import defaultdict
 
-from mirtop.mirna.mintplates import convert
+from mirtop.mirna import uid, nucleotides
+from mirtop.mirna.aligner import global_align
 import mirtop.libs.logger as mylog
 
 logger = mylog.getLogger(__name__)
 
 
 class hits:
-    """"Class with alignment information."""
+    """"Class with alignment information.
+
+    Sequences and precursor names are interned, so they are shared
+    among reads, and the UID is computed the first time is used."""
+    __slots__ = ("sequence", "_idseq", "precursors", "counts")
 
     def __init__(self):
         self.sequence = ""
-        self.idseq = ""
+        self._idseq = None
         self.precursors = defaultdict(isomir)
-        self.score = []
-        self.best_hits = []  # maybe sam object?
         self.counts = 0
 
+    @property
+    def idseq(self):
+        if self._idseq is None:
+            self._idseq = make_id(self.sequence) if self.sequence else ""
+        return self._idseq
+
+    @idseq.setter
+    def idseq(self, value):
+        self._idseq = value
+
     def set_sequence(self, seq):
-        self.sequence = seq
-        self.idseq = make_id(seq)
+        self.sequence = intern(seq)
+        self._idseq = None
 
     def set_precursor(self, precursor, isomir):
-        self.precursors[(precursor, isomir.start)] = isomir
+        self.precursors[(intern(precursor), isomir.start)] = isomir
 
     def remove_precursor(self, precursor):
         del self.precursors[precursor]
@@ -35,6 +46,8 @@ class isomir:
     """
     Class to represent isomiRs information.
     """
+    __slots__ = ("t5", "t3", "add", "subs", "external", "cigar",
+                 "filter", "map_score", "end", "start", "mirna", "strand")
 
     def __init__(self):
         self.t5 = []
@@ -42,7 +55,6 @@ class isomir:
         self.add = []
         self.subs = []
         self.external = ""
-        self.align = None
         self.cigar = None
         self.filter = "Pass"
         self.map_score = 0
@@ -142,7 +154,7 @@ def read_id(idu):
     convert it to the nucleotides,
     replacing an unique code for 5 nts.
 
-    It uses the code from *mirtop.mirna.keys()*.
+    It uses the code from *mirtop.mirna.uid.decode()*.
 
     Inspired by MINTplate: https://cm.jefferson.edu/MINTbase
     https://github.com/TJU-CMC-Org/MINTmap/tree/master/MINTplates
@@ -154,7 +166,7 @@ def read_id(idu):
         *seq(str)*: nucleotides sequences.
     """
     try:
-        seq = convert(idu, False, 'iso')
+        seq = uid.decode(idu)
     except KeyError:
         logger.error("UID is not valid " + idu)
         return False
@@ -167,7 +179,7 @@ def make_id(seq):
     Create a unique identifier for the sequence from the nucleotides,
     replacing 5 nts for a unique sequence.
 
-    It uses the code from *mirtop.mirna.keys()*.
+    It uses the code from *mirtop.mirna.uid.encode()*.
 
     Inspired by MINTplate: https://cm.jefferson.edu/MINTbase
     https://github.com/TJU-CMC-Org/MINTmap/tree/master/MINTplates
@@ -179,13 +191,11 @@ def make_id(seq):
         *idName(str)*: unique identifier for the sequence.
     """
     try:
-        idu = convert(seq, True, 'iso')
+        idu = uid.encode(seq)
     except KeyError as error:
         logger.error("Sequence is not valid " + seq)
         raise
 
-    # If you wanted to add "iso-" into the license plate as the prefix
-    # idu = convert(seq, True, "iso")
     return idu
 
 
@@ -199,8 +209,10 @@ def is_sequence(seq):
     Returns:
         *boolean*: whether is or not a valid nucleotide sequence.
     """
-    alphabet = re.compile('^[ACTG]*$', re.IGNORECASE)
-    return alphabet.match(seq)
+    # a new line at the end is allowed, as with the ^[ACTG]*$ regex
+    if seq.endswith("\n"):
+        seq = seq[:-1]
+    return nucleotides.is_valid(seq)
 
 
 def align(x, y, local=False):
@@ -208,6 +220,9 @@ def align(x, y, local=False):
     Pairwise alignments between two sequenes.
     https://medium.com/towards-data-science/pairwise-sequence-alignment-using-biopython-d1a9d0ba861f
 
+    Global alignments use *mirtop.mirna.aligner.global_align()*, that
+    gives the same result than pairwise2.align.globalms(x, y, 1, -1, -1, -0.5).
+
     Args:
         *x(str)*: short sequence.
 
@@ -219,9 +234,10 @@ def align(x, y, local=False):
         *aligned_x(hit)*: alignment information, socre and positions.
     """
     if local:
+        from Bio import pairwise2
         aligned_x = pairwise2.align.localxx(x, y)[0]
     else:
-        aligned_x = pairwise2.align.globalms(x, y, 1, -1, -1, -0.5)[0]
+        aligned_x = global_align(x, y)
     aligned_x = list(aligned_x)
     n_x = aligned_x[0]
     if "N" in n_x:
@@ -255,6 +271,8 @@ def make_cigar(seq, mature):
     Return:
         *short(str)*: CIGAR string.
     """
+    if len(mature) >= len(seq) and "-" not in seq and "-" not in mature:
+        return cigar_from_mismatches(seq, nucleotides.mismatches(seq, mature))
     cigar = ""
     for pos in range(0, len(seq)):
         if seq[pos] == mature[pos]:
@@ -285,6 +303,31 @@ def make_cigar(seq, mature):
     return short
 
 
+def cigar_from_mismatches(seq, error):
+    """
+    Same than *make_cigar()* for a read without gaps.
+
+    Args:
+        *seq(str)*: read sequence.
+
+        *error(list)*: sorted positions with mismatches,
+            as *mirtop.mirna.nucleotides.mismatches()*.
+
+    Return:
+        *short(str)*: CIGAR string.
+    """
+    short = ""
+    matches = 0
+    for pos in error + [len(seq)]:
+        run = pos - matches
+        if run:
+            short += _add_cigar_char(run, "M")
+        if pos < len(seq):
+            short += seq[pos]
+        matches = pos + 1
+    return short
+
+
 def cigar_correction(cigarLine, query, target):
     """
     Read from CIGAR in BAM file to define mismatches.
@@ -402,7 +445,7 @@ def reverse_complement(seq):
 
         >>> ATGC
     """
-    return str(Seq(seq).reverse_complement())
+    return nucleotides.reverse_complement(seq)
 
 
 def get_mature_sequence(precursor, mature, exact=False, nt = 5):
@@ -450,13 +493,14 @@ def align_from_variants(sequence, mature, variants):
     """
     init_log = "iso:%s -> %s\nref:%s" % (sequence, variants, mature)
     snps = []
-    k = [v.split(":")[0] for v in variants.split(",") if v.find(":") > -1]
-    v = [int(v.split(":")[1]) for v in variants.split(",") if v.find(":") > -1]
+    items = variants.split(",")
+    k = [v.split(":")[0] for v in items if v.find(":") > -1]
+    v = [int(v.split(":")[1]) for v in items if v.find(":") > -1]
     var_dict = dict(zip(k, v))
     logger.debug("realign::align_from_variants::sequence %s" % sequence)
     logger.debug("realign::align_from_variants::mature %s" % mature)
     logger.debug("realign::align_from_variants::variants %s" % variants)
-    snp = ["iso_snv" for v in variants.split(",") if v.find("snv") > -1]
+    snp = ["iso_snv" for v in items if v.find("snv") > -1]
     fix_5p = 7
     if "iso_5p" in k:
         fix_5p = 7 + var_dict["iso_5p"]
@@ -495,6 +539,10 @@ def align_from_variants(sequence, mature, variants):
     return snps
 
 
+def _variants(variant):
+    return variant.split(",") if isinstance(variant, str) else variant
+
+
 def variant_to_5p(hairpin, pos, variant):
     """
     From a sequence and a start position get the nts
@@ -506,14 +554,14 @@ def variant_to_5p(hairpin, pos, variant):
 
        *position(int)*: >>> 3
 
-       *variant(int)*: number of nts involved in the variant:
-            >>> -1
+       *variant(str)*: Variant attribute, or the list of its
+            comma separated values.
     Returns:
        *(str)*: nucleotide involved in the variant:
             >>> T
     """
     pos = pos[0]
-    iso_t5 = [v for v in variant.split(",") if v.startswith("iso_5p")]
+    iso_t5 = [v for v in _variants(variant) if v.startswith("iso_5p")]
     if iso_t5:
         t5 = int(iso_t5[0].split(":")[-1][-1])
         direction_t5 = int(iso_t5[0].split(":")[-1]) * -1
@@ -535,14 +583,14 @@ def variant_to_3p(hairpin, pos, variant):
 
        *position(int)*: >>> 3
 
-       *variant(int)*: number of nts involved in the variant:
-            >>> -1
+       *variant(str)*: Variant attribute, or the list of its
+            comma separated values.
     Returns:
        *(str)*: nucleotide involved in the variant:
             >>> A
     """
     pos = pos[1]
-    iso_t3 = [v for v in variant.split(",") if v.startswith("iso_3p")]
+    iso_t3 = [v for v in _variants(variant) if v.startswith("iso_3p")]
     if iso_t3:
         t3 = int(iso_t3[0].split(":")[-1][-1])
         direction_t3 = int(iso_t3[0].split(":")[-1])
@@ -564,13 +612,13 @@ def variant_to_add(read, variant):
 
        *position(int)*: >>> 3
 
-       *variant(int)*: number of nts involved in the variant:
-            >>> 2
+       *variant(str)*: Variant attribute, or the list of its
+            comma separated values.
     Returns:
        *(str)*: nucleotide involved in the variant:
             >>> TT
     """
-    add = [v for v in variant.split(",") if v.startswith("iso_add")]
+    add = [v for v in _variants(variant) if v.startswith("iso_add")]
     if add:
         add = int(add[0].split(":")[-1][-1]) * -1
         return read[add:]
@@ -0,0 +1,181 @@
+"""Compiled reference with precursor sequences and miRNA positions
+
+*mirtop reference build* reads the hairpin FASTA and the miRNA GFF
+files once and saves the precursor sequences and the mature positions
+in the precursor, genomic and chromosome layouts in one file. The file
+is named with a hash of the content of the input files and options,
+so the commands only use it while the files are the same.
+"""
+import hashlib
+import os
+import pickle
+
+from mirtop.mirna import fasta, mapper
+import mirtop.libs.logger as mylog
+
+logger = mylog.getLogger(__name__)
+
+# version of the content of the files, files from other versions
+# are not used
+VERSION = 1
+
+# environment variable with the folder of the compiled references
+CACHE_ENV = "MIRTOP_CACHE"
+
+LAYOUTS = ("precursors", "matures", "genomic", "chrom")
+
+
+def cache_dir():
+    """Folder where the compiled references are saved and looked for."""
+    return os.environ.get(CACHE_ENV, os.path.join(os.path.expanduser("~"),
+                                                  ".cache", "mirtop"))
+
+
+class bundle:
+    """
+    Reference of a hairpin FASTA and miRNA GFF files.
+
+    Each layout is read from the files the first time it is used,
+    unless it was loaded from a compiled reference with *load()*.
+    """
+
+    def __init__(self, hairpin, gtf, sps=None, database=None):
+        self.hairpin = hairpin
+        self.gtf = gtf
+        self.sps = sps
+        self._database = database
+        self._key = None
+        self.layouts = dict()
+
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = mapper._guess_database_file(self.gtf)
+        return self._database
+
+    @property
+    def key(self):
+        """Hash of the input files content and options."""
+        if self._key is None:
+            digest = hashlib.sha1()
+            digest.update(("%s\t%s\t%s\n" % (VERSION, self.sps,
+                                              self.database)).encode())
+            for fn in (self.hairpin, self.gtf):
+                if fn:
+                    with open(fn, 'rb') as inh:
+                        for block in iter(lambda: inh.read(1 << 20), b""):
+                            digest.update(block)
+                digest.update(b"\0")
+            self._key = digest.hexdigest()
+        return self._key
+
+    def path(self, out_dir=None):
+        """File of the compiled reference in *out_dir* or *cache_dir()*."""
+        return os.path.join(out_dir or cache_dir(), "%s.mirtop" % self.key)
+
+    def _layout(self, name):
+        if name not in self.layouts:
+            if name == "precursors":
+                self.layouts[name] = fasta.read_precursor(self.hairpin, self.sps)
+            elif name == "matures":
+                self.layouts[name] = mapper.read_gtf_to_precursor(self.gtf,
+                                                                  self.database)
+            elif name == "genomic":
+                self.layouts[name] = mapper.read_gtf_to_mirna(self.gtf)
+            elif name == "chrom":
+                self.layouts[name] = mapper.read_gtf_chr2mirna(self.gtf)
+        return self.layouts[name]
+
+    @property
+    def precursors(self):
+        """Output of *mirtop.mirna.fasta.read_precursor()*."""
+        return self._layout("precursors")
+
+    @property
+    def matures(self):
+        """Output of *mirtop.mirna.mapper.read_gtf_to_precursor()*."""
+        return self._layout("matures")
+
+    @property
+    def genomic(self):
+        """Output of *mirtop.mirna.mapper.read_gtf_to_mirna()*."""
+        return self._layout("genomic")
+
+    @property
+    def chrom(self):
+        """Output of *mirtop.mirna.mapper.read_gtf_chr2mirna()*."""
+        return self._layout("chrom")
+
+    def save(self, out_dir=None):
+        """
+        Compile all the layouts into one file.
+
+        Args:
+            *out_dir(str)*: folder of the file, *cache_dir()* by default.
+
+        Returns:
+            *(str)*: file name.
+        """
+        fn = self.path(out_dir)
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        content = {"version": VERSION, "key": self.key,
+                   "hairpin": self.hairpin, "gtf": self.gtf,
+                   "sps": self.sps, "database": self.database,
+                   "layouts": dict((name, self._layout(name))
+                                   for name in LAYOUTS)}
+        tmp_fn = "%s.tmp%s" % (fn, os.getpid())
+        with open(tmp_fn, 'wb') as outh:
+            pickle.dump(content, outh, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fn, fn)
+        return fn
+
+
+def load(hairpin, gtf, sps=None, database=None):
+    """
+    Get the reference of the files, from the compiled reference
+    in *cache_dir()* if there is one for the same files and options.
+
+    Args:
+        *hairpin(str)*: hairpin FASTA file.
+
+        *gtf(str)*: GFF file with miRNA positions.
+
+        *sps(str)*: if any, species of the precursors to keep.
+
+        *database(str)*: database name, guessed from *gtf* if None.
+
+    Returns:
+        *(bundle)*.
+    """
+    ref = bundle(hairpin, gtf, sps, database)
+    fn = ref.path()
+    if not os.path.exists(fn):
+        return ref
+    try:
+        with open(fn, 'rb') as inh:
+            content = pickle.load(inh)
+    except Exception as e:
+        logger.warning("Compiled reference %s not used: %s" % (fn, e))
+        return ref
+    if content.get("version") == VERSION and content.get("key") == ref.key:
+        ref.layouts.update(content["layouts"])
+        logger.info("Using compiled reference %s" % fn)
+    return ref
+
+
+def build(args):
+    """
+    Compile the reference of *args.hairpin* and *args.gtf*.
+
+    Args:
+        *args(namedtuple)*: arguments parsed from command line with
+            *mirtop.libs.parse.add_subparser_reference()*.
+    """
+    ref = bundle(args.hairpin, args.gtf, args.sps, args.database)
+    fn = ref.save(args.out)
+    logger.info("%s precursors and %s miRNAs saved at %s" % (
+        len(ref.precursors), sum(len(m) for m in ref.matures.values()), fn))
+    if os.path.abspath(args.out) != os.path.abspath(cache_dir()):
+        logger.info("Set %s=%s to use it." % (CACHE_ENV, args.out))
+    return fn
@@ -0,0 +1,120 @@
+"""Encode and decode the unique identifiers (UID) of sequences
+
+Same license plates than *mirtop.mirna.mintplates.convert()*, using
+translation tables built once from the MINTplates hashes and a memory
+of the last identifiers seen, since the same sequences are encoded and
+decoded many times along the GFF files.
+"""
+from collections import OrderedDict
+
+from mirtop.mirna.mintplates import encode_hash, decode_hash
+
+# prefix of the license plates
+PREFIX = "iso"
+
+# number of sequences and identifiers kept in memory
+CACHE_SIZE = 100000
+
+# code of each piece of up to 5 nts
+_ENCODE = dict(encode_hash)
+
+# nts of each code by the number of nts left in the sequence (1 to 5)
+_DECODE = dict((size, dict()) for size in range(1, 6))
+for _key, _value in decode_hash.items():
+    _code, _size = _key.rsplit("-", 1)
+    _DECODE[int(_size)][_code] = _value
+
+_NTS = "ACGT"
+
+_encoded = OrderedDict()
+_decoded = OrderedDict()
+
+
+def encode(seq):
+    """
+    Create the license plate of a sequence.
+
+    Args:
+        *seq(str)*: nucleotides sequence, U are read as T.
+
+    Returns:
+        *(str)*: license plate, None for empty sequences.
+
+    Raises:
+        *KeyError* if the sequence has other characters than nucleotides.
+    """
+    if not seq:
+        return None
+    plate = _encoded.get(seq)
+    if plate is None:
+        return _remember(_encoded, seq, _encode(seq))
+    _encoded.move_to_end(seq)
+    return plate
+
+
+def _encode(seq):
+    cleaned = seq.upper().replace("U", "T")
+    if cleaned.strip(_NTS):
+        raise KeyError('Error, exiting: Illegal characters in line "' + seq + '"')
+    size = len(cleaned)
+    code = "".join([_ENCODE[cleaned[idx:idx + 5]] for idx in range(0, size, 5)])
+    return "%s-%s-%s" % (PREFIX, size, code)
+
+
+def decode(plate):
+    """
+    Get the sequence of a license plate.
+
+    Args:
+        *plate(str)*: license plate with or without prefix.
+
+    Returns:
+        *(str)*: nucleotides sequence, None for empty plates.
+
+    Raises:
+        *KeyError* if the license plate is not valid.
+    """
+    if not plate:
+        return None
+    seq = _decoded.get(plate)
+    if seq is None:
+        return _remember(_decoded, plate, _decode(plate))
+    _decoded.move_to_end(plate)
+    return seq
+
+
+def _decode(plate):
+    cleaned = plate.upper()
+    fields = cleaned.split("-")
+    if len(fields) == 3:
+        fields = fields[1:]
+    if len(fields) != 2 or not fields[0].isdigit():
+        raise KeyError("Error, exiting: Provided license plate '" + cleaned +
+                       "' is not in a valid format.")
+    length = int(fields[0])
+    code = fields[1]
+    pieces = []
+    left = length
+    while code and left > 0:
+        pieces.append(_DECODE[5 if left > 5 else left][code[:2]])
+        left -= 5
+        code = code[2:]
+    seq = "".join(pieces)
+    if len(seq) != length or code:
+        raise KeyError("Error, exiting: Invalid license plate '" + cleaned + "'.")
+    return seq
+
+
+def _remember(cache, key, value):
+    """Save *value*, forgetting the least recently used one when
+    the cache is full."""
+    cache[key] = value
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def clear_cache():
+    """Forget the identifiers encoded and decoded."""
+    _encoded.clear()
+    _decoded.clear()
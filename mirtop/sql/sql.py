@@ -1,11 +1,35 @@
 # import os
 import argparse
 import sqlite3
-import re
 from datetime import datetime
 import time
 import os.path as op
 
+import mirtop.libs.logger as mylog
+
+logger = mylog.getLogger(__name__)
+
+# rows inserted together when loading a GFF file
+BATCH_SIZE = 50000
+
+# memory used by SQLite to cache pages while loading a GFF file
+CACHE_KB = 200000
+
+# columns indexed after loading a GFF file
+INDEXED_COLUMNS = ["seqID", "UID", "Name", "Variant", "filter"]
+
+# rows read from the database at once when printing a query
+PAGE_SIZE = 10000
+
+# sample columns added up in one query to summarize the samples
+SUMMARY_COLUMNS = 500
+
+DATA_COLUMNS = ['seqID text', 'source_file text', 'type text', 'start real',
+    'end real', 'score text', 'strand text', 'phase text', 'UID text', 'Read text', 'Name text', 'Parent text', 'Variant text',
+    'iso_5p real', 'iso_3p real', 'iso_add3p real', 'iso_add5p real', 'iso_snv real', 'iso_snv_seed real', 'iso_snv_central real', 'iso_snv_central_offset real',
+    'iso_snv_central_supp real', 'source text', 'cigar text', 'hits real', 'alias text', 'genomic_pos text', 'filter text',
+    'seed_fam text']
+
 now = datetime.now()
 # dd/mm/YY H:M:S
 d2 = now.strftime("%B %d, %Y %H:%M:%S")
@@ -13,12 +37,7 @@ d2 = now.strftime("%B %d, %Y %H:%M:%S")
 
 def create_table(conn, sample_names):
     c = conn.cursor()
-    data_columns = ['seqID text', 'source_file text', 'type text', 'start real',
-    'end real', 'score text', 'strand text', 'phase text', 'UID text', 'Read text', 'Name text', 'Parent text', 'Variant text',
-    'iso_5p real', 'iso_3p real', 'iso_add3p real', 'iso_add5p real', 'iso_snv real', 'iso_snv_seed real', 'iso_snv_central real', 'iso_snv_central_offset real',
-    'iso_snv_central_supp real', 'source text', 'cigar text', 'hits real', 'alias text', 'genomic_pos text', 'filter text',
-    'seed_fam text']
-    complete_headers = data_columns + sample_names
+    complete_headers = DATA_COLUMNS + sample_names
     q = "CREATE TABLE IF NOT EXISTS data_sets(%s)" % ", ".join(complete_headers)
     c.execute(q)
     conn.commit()
@@ -36,6 +55,162 @@ def gff_insert_values(conn, complete_list):
         exit()
 
 
+def create_long_tables(conn, sample_names):
+    """
+    Create the tables of the long format: one row for each isomiR in
+    *isomirs* and one row for each isomiR and sample with counts in
+    *expression*. *data_sets* is a view of *isomirs* without counts.
+
+    Args:
+        *conn(sqlite3.Connection)*: database.
+
+        *sample_names(list)*: names of the samples in the GFF file.
+
+    Returns:
+        *(list)*: id of each sample in *samples*.
+    """
+    c = conn.cursor()
+    c.execute("CREATE TABLE IF NOT EXISTS isomirs(isomir_id integer PRIMARY KEY, %s)" % ", ".join(DATA_COLUMNS))
+    c.execute("CREATE TABLE IF NOT EXISTS samples(sample_id integer PRIMARY KEY, name text UNIQUE)")
+    c.execute("CREATE TABLE IF NOT EXISTS expression(isomir_id integer, sample_id integer, count integer, "
+              "PRIMARY KEY (isomir_id, sample_id)) WITHOUT ROWID")
+    c.execute("CREATE VIEW IF NOT EXISTS data_sets AS SELECT %s FROM isomirs" % ", ".join(
+        column.split(' ')[0] for column in DATA_COLUMNS))
+    c.executemany("INSERT OR IGNORE INTO samples(name) VALUES(?)", [(name,) for name in sample_names])
+    ids = dict(c.execute("SELECT name, sample_id FROM samples"))
+    conn.commit()
+    return [ids[name] for name in sample_names]
+
+
+def gff_insert_many(conn, rows, table="data_sets"):
+    """Insert rows with the same number of values in one statement."""
+    if not rows:
+        return
+    try:
+        conn.executemany('INSERT INTO ' + table + ' VALUES(' + ','.join("?" * len(rows[0])) + ')', rows)
+    except sqlite3.OperationalError as e:
+        print()
+        print("ERROR:")
+        print("sqlite3.OperationalError: {0}".format(e))
+        print("Help: Make sure to delete any existing database with tables of different schema")
+        exit()
+
+
+def _start_bulk_load(conn):
+    """Pragmas to write many rows: WAL and no sync until the end."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-%s" % CACHE_KB)
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _end_bulk_load(conn, table):
+    """Create the indexes and go back to the default journal."""
+    for column in INDEXED_COLUMNS:
+        conn.execute("CREATE INDEX IF NOT EXISTS %s_%s ON %s(%s)" % (table, column, table, column))
+    if table == "isomirs":
+        conn.execute("CREATE INDEX IF NOT EXISTS expression_sample ON expression(sample_id, isomir_id, count)")
+    create_summaries(conn)
+    conn.commit()
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,)).fetchone() is not None
+
+
+def create_summaries(conn):
+    """
+    Count the isomiRs of each miRNA and the isomiRs and reads of each
+    sample into *mirna_summary* and *sample_summary*, so the queries
+    with counts do not go through all the rows.
+
+    Args:
+        *conn(sqlite3.Connection)*: database with *data_sets*.
+    """
+    c = conn.cursor()
+    c.execute("DROP TABLE IF EXISTS mirna_summary")
+    c.execute("CREATE TABLE mirna_summary AS SELECT seqID, type, filter, COUNT(*) AS isomirs "
+              "FROM data_sets GROUP BY seqID, type, filter")
+    c.execute("CREATE INDEX mirna_summary_seqID ON mirna_summary(seqID)")
+    c.execute("DROP TABLE IF EXISTS sample_summary")
+    c.execute("CREATE TABLE sample_summary(sample text, isomirs integer, reads real)")
+    if _has_table(conn, "expression"):
+        c.execute("INSERT INTO sample_summary SELECT name, COUNT(count), COALESCE(SUM(count), 0) "
+                  "FROM samples LEFT JOIN expression USING (sample_id) GROUP BY sample_id ORDER BY sample_id")
+        return
+    samples = [row[1] for row in c.execute("PRAGMA table_info(data_sets)")][len(DATA_COLUMNS):]
+    for idx in range(0, len(samples), SUMMARY_COLUMNS):
+        names = samples[idx:idx + SUMMARY_COLUMNS]
+        totals = c.execute("SELECT %s FROM data_sets" % ", ".join(
+            'COALESCE(SUM("%s" + 0 > 0), 0), COALESCE(SUM("%s" + 0), 0)' % (name, name)
+            for name in names)).fetchone()
+        c.executemany("INSERT INTO sample_summary VALUES(?, ?, ?)",
+                      [(name, totals[2 * i], totals[2 * i + 1]) for i, name in enumerate(names)])
+
+
+def _count(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _gff_values(text, source):
+    """Values of the data_sets table for a GFF line."""
+    lines = text.strip().split('\t')
+    if '=' in lines[-1]:
+        lines_info_array = lines[-1].replace("=", " ")
+    else:
+        lines_info_array = lines[-1]
+
+    info = lines_info_array.split('; ')
+    info_dict = dict()
+    for elements in info:
+        (k, v) = elements.split(' ')
+        info_dict.update([(k, v)])
+        if 'Variant' in k and ":" in v:
+            value_list = v.split(',')
+            for iso_vars in value_list:
+                if ":" in iso_vars:
+                    (sub_k, sub_v) = iso_vars.split(':')
+                    info_dict.update([(str(sub_k), str(sub_v))])
+                else:
+                    ### Exception for miRge format START 
+                    if iso_vars == "iso_snp":
+                        iso_vars = "iso_snv"
+                    elif iso_vars == "iso_add": 
+                        iso_vars = "iso_add3p"
+                    ### Exception for miRge format END
+                    info_dict['iso_snv'] = "1" if iso_vars == 'iso_snv' else 0
+                    info_dict['iso_snv_seed'] = "1" if iso_vars == 'iso_snv_seed' else 0
+                    info_dict['iso_snv_central'] = "1" if iso_vars == 'iso_snv_central' else 0
+                    info_dict['iso_snv_central_offset'] = "1" if iso_vars == 'iso_snv_central_offset' else 0
+                    info_dict['iso_snv_central_supp'] = "1" if iso_vars == 'iso_snv_central_supp' else 0
+                     
+    prefix_list = [lines[0], lines[1], lines[2], lines[3], lines[4], lines[5], lines[6], lines[7],
+                   info_dict.get('UID'), info_dict.get('Read'), info_dict.get('Name'),
+                   info_dict.get('Parent'),
+                   info_dict.get('Variant'), 
+                   str(info_dict.setdefault('iso_5p', None)),
+                   str(info_dict.setdefault('iso_3p', None)), 
+                   str(info_dict.setdefault('iso_add3p', None)),
+                   str(info_dict.setdefault('iso_add5p', None)),
+                   str(info_dict.setdefault('iso_snv', "0")), 
+                   str(info_dict.setdefault('iso_snv_seed', "0")), 
+                   str(info_dict.setdefault('iso_snv_central', "0")), 
+                   str(info_dict.setdefault('iso_snv_central_offset', "0")), 
+                   str(info_dict.setdefault('iso_snv_central_supp', "0")), 
+                   source,
+                   info_dict.setdefault('Cigar', None),
+                   info_dict.setdefault('Hits', None), info_dict.setdefault('Alias', None),
+                   info_dict.setdefault('Genomic', None),
+                   info_dict.setdefault('Filter', None), info_dict.setdefault('Seed_fam', None)]
+    expression_list = info_dict.get('Expression').split(',')
+    return prefix_list + expression_list
+
+
 # print("date and time =", d2)
 
 def insert_sql(args):
@@ -47,86 +222,70 @@ def insert_sql(args):
         out_file = op.join(args.out, "mirtop.db")
         conn = sqlite3.connect(out_file)
         c = conn.cursor()
+    schema = getattr(args, "schema", None) or "wide"
+    _start_bulk_load(conn)
+    start_time = time.time()
 
     with open(args.gff, 'r') as f:
         version = source = data_sets = tools = commands_exec = filter_tags = citation = num_records = ""
         cnt = 0
+        rows = []
+        expression = []
+        sample_ids = []
+        isomir_id = 0
         for text in f:
             # HEADER INFORMATION
-            if re.search("^## .* VERSION", text):  # (R)
+            if not text.startswith("#"):
+                # BODY - INFORMATION
+                cnt += 1
+                complete_list = _gff_values(text, source)
+                if schema == "long":
+                    isomir_id += 1
+                    counts = complete_list[len(DATA_COLUMNS):]
+                    if len(counts) != len(sample_ids):
+                        raise ValueError("Line has %s counts but there are %s samples: %s" % (
+                            len(counts), len(sample_ids), text))
+                    rows.append([isomir_id] + complete_list[:len(DATA_COLUMNS)])
+                    expression.extend((isomir_id, sample_id, count) for sample_id, count in
+                                      zip(sample_ids, map(_count, counts)) if count)
+                    if len(rows) >= BATCH_SIZE:
+                        gff_insert_many(conn, rows, "isomirs")
+                        gff_insert_many(conn, expression, "expression")
+                        rows, expression = [], []
+                    continue
+                if rows and (len(rows) >= BATCH_SIZE or len(rows[0]) != len(complete_list)):
+                    gff_insert_many(conn, rows)
+                    rows = []
+                rows.append(complete_list)
+            elif text.startswith("## ") and text.find(" VERSION", 3) > -1:  # (R)
                 version = (text.strip().split(' ')[-1])
-            elif re.search("^## source-ontology", text):  # (R)
+            elif text.startswith("## source-ontology"):  # (R)
                 source = (text.strip().split(' ')[-1])
-            elif re.search("^## COLDATA", text):  # (R)
+            elif text.startswith("## COLDATA"):  # (R)
                 data_sets = (
                     text.strip().split(' ')[-1])  # Might contain more than one data set
                 sample_names = data_sets.split(',')
                 sample_names = [w.replace('-', '_') for w in sample_names]
                 string_text = "text"
                 output_sample_names = ["{} {}".format(i, string_text) for i in sample_names]
-                create_table(conn, output_sample_names)
-            elif re.search("^## TOOLS", text):  # (R)
+                if schema == "long":
+                    sample_ids = create_long_tables(conn, sample_names)
+                    isomir_id = c.execute("SELECT COALESCE(MAX(isomir_id), 0) FROM isomirs").fetchone()[0]
+                else:
+                    create_table(conn, output_sample_names)
+            elif text.startswith("## TOOLS"):  # (R)
                 tools = (text.strip().split(' ')[-1])
-            elif re.search("^## CMD", text):  # (O)
+            elif text.startswith("## CMD"):  # (O)
                 commands_exec = (text.strip().split(' ')[-1])
-            elif re.search("^## FILTER", text):  # (O)
+            elif text.startswith("## FILTER"):  # (O)
                 filter_tags = (text.strip().split(' ')[-1])
-            elif re.search("^## REFERENCE", text):  # (O)
+            elif text.startswith("## REFERENCE"):  # (O)
                 citation = (text.strip().split(' ')[-1])
-            # BODY - INFORMATION
-            elif not re.search("^#", text):
-                cnt += 1
-                lines = text.strip().split('\t')
-                if '=' in lines[-1]:
-                    lines_info_array = lines[-1].replace("=", " ")
-                else:
-                    lines_info_array = lines[-1]
-
-                info = lines_info_array.split('; ')
-                info_dict = dict()
-                for elements in info:
-                    (k, v) = elements.split(' ')
-                    info_dict.update([(k, v)])
-                    if 'Variant' in k and ":" in v:
-                        value_list = v.split(',')
-                        for iso_vars in value_list:
-                            if ":" in iso_vars:
-                                (sub_k, sub_v) = iso_vars.split(':')
-                                info_dict.update([(str(sub_k), str(sub_v))])
-                            else:
-                                ### Exception for miRge format START 
-                                if iso_vars == "iso_snp":
-                                    iso_vars = "iso_snv"
-                                elif iso_vars == "iso_add": 
-                                    iso_vars = "iso_add3p"
-                                ### Exception for miRge format END
-                                info_dict['iso_snv'] = "1" if iso_vars == 'iso_snv' else 0
-                                info_dict['iso_snv_seed'] = "1" if iso_vars == 'iso_snv_seed' else 0
-                                info_dict['iso_snv_central'] = "1" if iso_vars == 'iso_snv_central' else 0
-                                info_dict['iso_snv_central_offset'] = "1" if iso_vars == 'iso_snv_central_offset' else 0
-                                info_dict['iso_snv_central_supp'] = "1" if iso_vars == 'iso_snv_central_supp' else 0
-                                 
-                prefix_list = [lines[0], lines[1], lines[2], lines[3], lines[4], lines[5], lines[6], lines[7],
-                               info_dict.get('UID'), info_dict.get('Read'), info_dict.get('Name'),
-                               info_dict.get('Parent'),
-                               info_dict.get('Variant'), 
-                               str(info_dict.setdefault('iso_5p', None)),
-                               str(info_dict.setdefault('iso_3p', None)), 
-                               str(info_dict.setdefault('iso_add3p', None)),
-                               str(info_dict.setdefault('iso_add5p', None)),
-                               str(info_dict.setdefault('iso_snv', "0")), 
-                               str(info_dict.setdefault('iso_snv_seed', "0")), 
-                               str(info_dict.setdefault('iso_snv_central', "0")), 
-                               str(info_dict.setdefault('iso_snv_central_offset', "0")), 
-                               str(info_dict.setdefault('iso_snv_central_supp', "0")), 
-                               source,
-                               info_dict.setdefault('Cigar', None),
-                               info_dict.setdefault('Hits', None), info_dict.setdefault('Alias', None),
-                               info_dict.setdefault('Genomic', None),
-                               info_dict.setdefault('Filter', None), info_dict.setdefault('Seed_fam', None)]
-                expression_list = info_dict.get('Expression').split(',')
-                complete_list = prefix_list + expression_list
-                gff_insert_values(conn, complete_list)
+        if schema == "long":
+            gff_insert_many(conn, rows, "isomirs")
+            gff_insert_many(conn, expression, "expression")
+        else:
+            gff_insert_many(conn, rows)
 
         c.execute('''CREATE TABLE IF NOT EXISTS summary(version text, source text, data_sets text, tools text,
          commands_exec text, filter_tags text, citation text, records real, date_stamp text)''')
@@ -137,6 +296,11 @@ def insert_sql(args):
         # info_dict.setdefault('Sex', None)
 
         conn.commit()
+    _end_bulk_load(conn, "isomirs" if schema == "long" else "data_sets")
+    conn.close()
+    elapsed = time.time() - start_time
+    logger.info("%s rows loaded into %s in %.1fs (%.0f rows/s)" % (
+        cnt, out_file, elapsed, cnt / elapsed if elapsed else 0))
 
 
 def query_sql(args):
@@ -166,6 +330,8 @@ def query_sql(args):
         show_columns(conn, args)
     if args.expr == "describe-gff":
         describe_gff_info(conn, args)
+    if args.expr == "isomirs-per-sample":
+        stats_per_sample(conn, args)
     if args.expr == "isomirs-per-mirna":
         if args.miRNA:
             stats_isomiR_per_miRNA(conn, args.miRNA, args)
@@ -263,7 +429,10 @@ def stats_isomiR_per_miRNA(connection, miRNA_name, args):
     cur = connection.cursor()
     miR_array = add_mirnas(args)
     #cur.execute('SELECT * FROM data_sets WHERE seqID=?', (miRNA_name,))
-    query="SELECT COUNT(*) FROM data_sets WHERE seqID=? AND type='isomiR' "
+    if _has_table(connection, "mirna_summary"):
+        query = "SELECT COALESCE(SUM(isomirs), 0) FROM mirna_summary WHERE seqID=? AND type='isomiR' "
+    else:
+        query = "SELECT COUNT(*) FROM data_sets WHERE seqID=? AND type='isomiR' "
     query = add_filter(query, args)
     print()
     stat_counts=0
@@ -294,6 +463,15 @@ def stats_isomiR_per_miRNA(connection, miRNA_name, args):
     pass
 
 
+def stats_per_sample(connection, args):
+    if not _has_table(connection, "sample_summary"):
+        print("Error: The database has no sample_summary table, create it again with mirtop sql --create")
+        exit()
+    # the rows are printed as they are, not as the count of a query
+    options = argparse.Namespace(**dict(vars(args), count=None, miRNA=None))
+    perform_execution(connection, "SELECT sample, isomirs, reads FROM sample_summary", options)
+
+
 def WHERE_CLAUSE(query, args):
     if "WHERE" in query: 
         query = query + " AND "
@@ -372,15 +550,27 @@ def perform_execution(conn, query, args):
     cur = conn.cursor()
     #print("QUERY: \n"+ query + "\n")
     cur.execute(query)
-    rows = cur.fetchall()
+    rows = fetch_rows(cur)
     col_name_list = [tuple[0] for tuple in cur.description]
     if args.miRNA:
         return(col_name_list, rows)
     else:
         format_results(col_name_list, rows, args)
 
+def fetch_rows(cur):
+    """Rows of the query in *cur*, read PAGE_SIZE rows at a time."""
+    while True:
+        rows = cur.fetchmany(PAGE_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
 def format_results(header, output, args):
     header = '\t'.join(str(col) for col in header)
+    if args.count:
+        output = list(output)
     if args.txtout:
         outList = open(args.txtout, 'w')
         print("\nWriting data to file: "+ args.txtout + "\n")
@@ -423,7 +613,10 @@ def select_query(connection, args):
         else:
             query = "SELECT " + args.columns + " FROM data_sets "
     elif args.count:
-        query = "SELECT COUNT(*) FROM data_sets "
+        if not args.variant and _has_table(connection, "mirna_summary"):
+            query = 'SELECT COALESCE(SUM(isomirs), 0) AS "COUNT(*)" FROM mirna_summary '
+        else:
+            query = "SELECT COUNT(*) FROM data_sets "
     else:
         query = "SELECT * FROM data_sets "
     query = add_filter(query, args)
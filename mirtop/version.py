@@ -0,0 +1,2 @@
+__version__ = "0.4.29"
+__url__ = "http://github.com/mirtop/mirtop"
\ No newline at end of file
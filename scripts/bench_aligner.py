@@ -0,0 +1,73 @@
+"""Compare mirtop.mirna.aligner with Bio.pairwise2 on simulated isomiRs"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+import warnings
+
+from mirtop.mirna import fasta
+from mirtop.mirna.aligner import align_many, global_align, _global_align
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa",
+                    help="Fasta file with precursors.")
+parser.add_argument("--sps", default="hsa", help="Species.")
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of sequences to align.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _mutate(seq, changes):
+    seq = list(seq)
+    for _ in range(changes):
+        pos = random.randrange(len(seq))
+        op = random.choice("sid")
+        if op == "s":
+            seq[pos] = random.choice("ACGT")
+        elif op == "i":
+            seq.insert(pos, random.choice("ACGT"))
+        elif len(seq) > 15:
+            del seq[pos]
+    return "".join(seq)
+
+
+precursors = [seq for seq in fasta.read_precursor(args.hairpin, args.sps).values()
+              if len(seq) > 40]
+pairs = []
+for _ in range(args.n):
+    precursor = random.choice(precursors)
+    size = random.randint(18, 26)
+    start = random.randint(0, len(precursor) - size)
+    read = _mutate(precursor[start:start + size], random.choice([0, 1, 1, 2, 3]))
+    pairs.append((read, precursor[start:start + len(read)]))
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    from Bio import pairwise2
+    t = time.time()
+    expected = [tuple(pairwise2.align.globalms(x, y, 1, -1, -1, -0.5)[0])
+                for x, y in pairs]
+    t_pairwise2 = time.time() - t
+
+_global_align.cache_clear()
+t = time.time()
+single = [global_align(x, y) for x, y in pairs]
+t_single = time.time() - t
+
+_global_align.cache_clear()
+t = time.time()
+batch = align_many(pairs)
+t_batch = time.time() - t
+
+print("pairs: %s" % len(pairs))
+print("pairwise2: %.2fs" % t_pairwise2)
+print("global_align: %.2fs (%.1fx), different alignments: %s" % (
+    t_single, t_pairwise2 / t_single,
+    sum(1 for e, o in zip(expected, single) if e != o)))
+print("align_many: %.2fs (%.1fx), different alignments: %s" % (
+    t_batch, t_pairwise2 / t_batch,
+    sum(1 for e, o in zip(expected, batch) if e != o)))
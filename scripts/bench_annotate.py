@@ -0,0 +1,76 @@
+"""Compare mirtop.mirna.annotate with the version copying each isomiR"""
+from __future__ import print_function
+
+import argparse
+import copy
+import time
+
+from mirtop.bam import bam
+from mirtop.mirna import annotate, fasta, mapper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--sam", default="data/examples/annotate/sim_isomir.sam",
+                    help="SAM/BAM file with reads mapped to precursors.")
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa",
+                    help="Fasta file with precursors.")
+parser.add_argument("--gtf", default="data/examples/annotate/hsa.gff3",
+                    help="GFF file with mature positions.")
+parser.add_argument("--sps", default="hsa", help="Species.")
+parser.add_argument("-n", type=int, default=20,
+                    help="Number of times the reads are annotated.")
+args = parser.parse_args()
+args.genomic = False
+args.database = None
+args.keep_name = False
+args.out = "."
+
+
+def _copy_annotate(reads, mature_ref, precursors):
+    """Annotation trying a copy of the isomiR with each mature."""
+    for r in reads:
+        for ps in reads[r].precursors:
+            p = ps[0]
+            for mature in mature_ref[p]:
+                mi = mature_ref[p][mature]
+                iso_copy = copy.deepcopy(reads[r].precursors[ps])
+                if not precursors[p]:
+                    continue
+                if annotate._coord(reads[r].sequence, reads[r].precursors[ps].start,
+                                   mi, precursors[p], iso_copy):
+                    reads[r].precursors[ps] = iso_copy
+                    reads[r].precursors[ps].mirna = mature
+    return reads
+
+
+def _summary(reads):
+    return [(r, ps, iso.mirna, iso.t5, iso.t3, iso.add, iso.subs)
+            for r in reads for ps, iso in reads[r].precursors.items()]
+
+
+precursors = fasta.read_precursor(args.hairpin, args.sps)
+matures = mapper.read_gtf_to_precursor(args.gtf, args.database)
+args.precursors = precursors
+args.matures = matures
+reads = bam.read_bam(args.sam, args)
+
+t = time.time()
+for _ in range(args.n):
+    expected = _copy_annotate(copy.deepcopy(reads), matures, precursors)
+t_copy = time.time() - t
+
+t = time.time()
+for _ in range(args.n):
+    observed = annotate.annotate(copy.deepcopy(reads), matures, precursors,
+                                 quiet=True)
+t_index = time.time() - t
+
+t = time.time()
+for _ in range(args.n):
+    copy.deepcopy(reads)
+t_reads = time.time() - t
+
+print("reads: %s x %s" % (len(reads), args.n))
+print("copy each isomiR: %.2fs" % (t_copy - t_reads))
+print("mature index: %.2fs (%.1fx), different annotations: %s" % (
+    t_index - t_reads, (t_copy - t_reads) / (t_index - t_reads),
+    sum(1 for e, o in zip(_summary(expected), _summary(observed)) if e != o)))
@@ -0,0 +1,115 @@
+"""Compare mirtop.gff.compare with the version keeping all the attributes
+
+Reads the reference as *mirtop.gff.compare.read_reference()* did before
+(UID: [Variant, dict with all the attributes]) and as it does now, and
+compares a target file with both. Use --reference and --target with big
+files, or files with -n lines are created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from mirtop.gff import compare
+from mirtop.gff.classgff import read_features
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--reference", help="GFF file used as reference.")
+parser.add_argument("--target", help="GFF file compared to the reference.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the files.")
+parser.add_argument("-n", type=int, default=200000,
+                    help="Number of lines of the created files.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _old_reference(fn):
+    srna = dict()
+    for gff in read_features(fn):
+        attr = gff.attributes
+        srna[attr['UID']] = [compare._simplify(attr['Variant']), attr]
+    return srna
+
+
+def _old(fn, reference):
+    results = list()
+    seen_reference = set()
+    for gff in read_features(fn):
+        attr = gff.attributes
+        variant = compare._simplify(attr['Variant'])
+        if attr['UID'] in reference:
+            mirna = "Y" if attr['Name'] == reference[attr['UID']][1]['Name'] else attr['Name']
+            results.append([attr['UID'], "D", mirna,
+                            compare._accuracy(variant, reference[attr['UID']][0])])
+            seen_reference.add(attr['UID'])
+        else:
+            results.append([attr['UID'], "E", attr['Name'],
+                            compare._accuracy(variant, "")])
+    for uid in reference:
+        if uid not in seen_reference:
+            results.append([uid, "M", "N", compare._accuracy("", reference[uid][0])])
+    return results
+
+
+def _measure(function, *params):
+    t = time.time()
+    result = function(*params)
+    return result, time.time() - t
+
+
+def _memory(function, *params):
+    tracemalloc.start()
+    function(*params)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+tmp_dir = tempfile.mkdtemp()
+reference_fn, target_fn = args.reference, args.target
+if not reference_fn:
+    with open(args.example) as inh:
+        lines = inh.readlines()
+    header = [line for line in lines if line.startswith("#")]
+    body = [line for line in lines if not line.startswith("#")]
+    variants = ["iso_5p:-1", "iso_3p:+2", "iso_add3p:+1,iso_snv_seed", "NA"]
+    reference_fn = os.path.join(tmp_dir, "reference.gff")
+    target_fn = os.path.join(tmp_dir, "target.gff")
+    with open(reference_fn, 'w') as ref, open(target_fn, 'w') as target:
+        ref.writelines(header)
+        target.writelines(header)
+        for idx in range(args.n):
+            line = body[idx % len(body)].replace("UID=", "UID=%s" % idx)
+            ref.write(line)
+            if random.random() < 0.9:
+                target.write(re.sub("Variant=[^;]*", "Variant=%s" %
+                                    random.choice(variants), line))
+
+m_old = _memory(_old_reference, reference_fn)
+m_new = _memory(compare.read_reference, reference_fn)
+old_ref, t_old_ref = _measure(_old_reference, reference_fn)
+old, t_old = _measure(_old, target_fn, old_ref)
+del old_ref
+new_ref, t_new_ref = _measure(compare.read_reference, reference_fn)
+out_fn = os.path.join(tmp_dir, "new.txt")
+with open(out_fn, 'w') as outh:
+    _, t_new = _measure(compare._compare_to_reference, target_fn, new_ref, outh)
+with open(out_fn) as inh:
+    new = [line.split("\t") for line in inh]
+same = [[r[0], r[1], r[2]] + list(r[3].values()) for r in old] == \
+       [[r[1], r[3], r[4]] + [v.strip() for v in r[5:]] for r in new]
+print("lines: %s" % args.n)
+print("reference: before %.2fs %.0fMB, after %.2fs %.0fMB (%.1fx less memory)" % (
+    t_old_ref, m_old, t_new_ref, m_new, m_old / m_new))
+print("compare: before %.2fs, after %.2fs" % (t_old, t_new))
+print("same results: %s" % same)
+shutil.rmtree(tmp_dir)
@@ -0,0 +1,95 @@
+"""Compare mirtop counts with the version building a pandas table
+
+Writes the counts of a GFF file as *mirtop.gff.convert.convert_gff_counts()*
+did before (all the rows in one DataFrame, drop_duplicates and to_csv)
+and as it does now, and reports time and peak memory. Use --gff with a
+big merged file, or a file with -n lines and -s samples is created from
+the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from mirtop.gff import convert
+from mirtop.gff.classgff import read_features
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of lines of the created file.")
+parser.add_argument("-s", type=int, default=200,
+                    help="Number of samples of the created file.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _old(fn, out_fn):
+    samples = convert._get_samples(fn)
+    lines = []
+    for gff in read_features(fn):
+        attr = gff.attributes
+        variant = attr.get("Variant", "")
+        lines.append([attr["UID"], attr["Read"], attr["Name"], variant] +
+                     convert._expand(variant) +
+                     attr["Expression"].strip().split(","))
+    df = pd.DataFrame(lines, columns=['UID', 'Read', 'miRNA', 'Variant',
+                                      'iso_5p', 'iso_3p', 'iso_add3p',
+                                      'iso_snp'] + samples)
+    df = df.drop_duplicates()
+    df.to_csv(out_fn, sep="\t", index=False)
+
+
+def _new(fn, out_dir):
+    convert.convert_gff_counts(argparse.Namespace(gff=fn, out=out_dir,
+                                                  add_extra=False))
+
+
+def _measure(function, *params):
+    tracemalloc.start()
+    t = time.time()
+    function(*params)
+    elapsed = time.time() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+tmp_dir = tempfile.mkdtemp()
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        body = [line for line in inh if not line.startswith("#")]
+    fn = os.path.join(tmp_dir, "bench.gff")
+    with open(fn, 'w') as outh:
+        outh.write("## mirGFF3. VERSION 1.1\n")
+        outh.write("## COLDATA: %s\n" % ",".join("s%s" % s for s in range(args.s)))
+        for idx in range(args.n):
+            line = body[idx % len(body)]
+            expression = ",".join(str(random.choice([0, 0, 1, 2, 10]))
+                                  for _ in range(args.s))
+            outh.write(re.sub("Expression=[^;]*", "Expression=%s" % expression,
+                              line))
+
+old_fn = os.path.join(tmp_dir, "old.tsv")
+new_fn = os.path.join(tmp_dir, "%s.tsv" % os.path.splitext(os.path.basename(fn))[0])
+t_old, m_old = _measure(_old, fn, old_fn)
+t_new, m_new = _measure(_new, fn, tmp_dir)
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+print("before %.2fs %.0fMB, after %.2fs %.0fMB (%.1fx less memory)" % (
+    t_old, m_old, t_new, m_new, m_old / m_new))
+with open(old_fn) as old, open(new_fn) as new:
+    print("same file: %s" % (old.read() == new.read()))
+shutil.rmtree(tmp_dir)
@@ -0,0 +1,99 @@
+"""Compare mirtop export of several formats with the single-pass engine
+
+Exports a GFF file to seqbuster, fasta, isomir and vcf formats as
+*mirtop export* did before (one run for each format, loading the
+reference each time and opening the file of each sample for each line
+in seqbuster format) and as it does now (--format with all of them).
+Use --gff with a big merged file, or a file with -n lines and -s
+samples is created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import filecmp
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from mirtop.exporter import engine, seqbuster, isomirs, fasta, vcf
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa")
+parser.add_argument("--gtf", default="data/examples/annotate/hsa.gff3")
+parser.add_argument("-n", type=int, default=2000,
+                    help="Number of lines of the created file.")
+parser.add_argument("-s", type=int, default=500,
+                    help="Number of samples of the created file.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+class _old_seqbuster(seqbuster.writer):
+    """Open the file of each sample for each line."""
+
+    def __init__(self, *params):
+        seqbuster.writer.__init__(self, *params)
+        for out_file in self.outputs:
+            self.files.close(out_file)
+
+    def add(self, rec):
+        files = self.files
+        self.files = _append()
+        seqbuster.writer.add(self, rec)
+        self.files = files
+
+
+class _append:
+    def write(self, fn, line):
+        with open(fn, 'a') as outh:
+            outh.write(line)
+
+
+def _export(fn, out_dir, writers):
+    engine.export(argparse.Namespace(files=[fn], out=out_dir,
+                                     hairpin=args.hairpin, gtf=args.gtf,
+                                     sps="hsa", database=None), writers)
+
+
+tmp_dir = tempfile.mkdtemp()
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        body = [line for line in inh if not line.startswith("#")]
+    fn = os.path.join(tmp_dir, "bench.gff")
+    with open(fn, 'w') as outh:
+        outh.write("## mirGFF3. VERSION 1.1\n")
+        outh.write("## source-ontology: miRBasev21\n")
+        outh.write("## COLDATA: %s\n" % ",".join("s%s" % s for s in range(args.s)))
+        for idx in range(args.n):
+            line = body[idx % len(body)]
+            expression = ",".join(str(random.choice([0, 0, 1, 2, 10]))
+                                  for _ in range(args.s))
+            outh.write(re.sub("Expression=[^;]*", "Expression=%s" % expression,
+                              line))
+
+old_dir = os.path.join(tmp_dir, "old")
+new_dir = os.path.join(tmp_dir, "new")
+os.mkdir(old_dir)
+os.mkdir(new_dir)
+t = time.time()
+for writer in [_old_seqbuster, fasta.writer, isomirs.writer, vcf.writer]:
+    _export(fn, old_dir, [writer])
+t_old = time.time() - t
+t = time.time()
+_export(fn, new_dir, [seqbuster.writer, fasta.writer, isomirs.writer, vcf.writer])
+t_new = time.time() - t
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+print("before %.2fs, after %.2fs (%.1fx)" % (t_old, t_new, t_old / t_new))
+match, mismatch, errors = filecmp.cmpfiles(old_dir, new_dir, os.listdir(old_dir),
+                                           shallow=False)
+print("same files: %s" % (not mismatch and not errors))
+shutil.rmtree(tmp_dir)
@@ -0,0 +1,99 @@
+"""Compare mirtop.gff.classgff with the version parsing all the attributes
+
+Reads a GFF file as *mirtop.gff.body.read()* did before (parse, paste
+and parse again) and as it does now, and the same for the commands
+only looking at a few columns. Use --gff with a big merged file, or
+a file with -n lines is created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from mirtop.gff.body import paste_columns
+from mirtop.gff.classgff import feature, read_features
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("-n", type=int, default=500000,
+                    help="Number of lines of the created file.")
+args = parser.parse_args()
+
+
+class old_feature:
+    def __init__(self, line):
+        self.line = line
+        self.attributes = {}
+        self.columns = {}
+        if line.startswith("#"):
+            return
+        cols = line.strip().split("\t")
+        self.attributes = OrderedDict()
+        sep = "=" if line.find("Name=") > -1 else " "
+        for item in cols[8].split(";"):
+            pair = item.strip().split(sep)
+            if len(pair) > 1:
+                self.attributes[pair[0].strip()] = pair[1].strip()
+        self.columns = dict(zip(["chrom", "source", "type", "start", "end",
+                                 "score", "strand", "ext"], cols))
+
+
+def _old(fn):
+    with open(fn) as inh:
+        for line in inh:
+            if line.startswith("#"):
+                continue
+            gff = old_feature(paste_columns(old_feature(line), sep="="))
+            gff.attributes["UID"]
+
+
+def _new(fn):
+    for gff in read_features(fn):
+        paste_columns(gff, sep="=")
+        gff.attributes["UID"]
+
+
+def _old_columns(fn):
+    with open(fn) as inh:
+        for line in inh:
+            if line.startswith("#"):
+                continue
+            old_feature(line).columns["start"]
+
+
+def _new_columns(fn):
+    for gff in read_features(fn):
+        gff.columns["start"]
+
+
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        body = [line for line in inh if not line.startswith("#")]
+    fn = tempfile.mktemp(suffix=".gff")
+    with open(fn, 'w') as outh:
+        for idx in range(args.n):
+            outh.write(body[idx % len(body)])
+
+same = all(old_feature(paste_columns(old_feature(gff.line), "=")).attributes ==
+           feature(paste_columns(gff, "=")).attributes
+           for gff in read_features(fn))
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+for name, old, new in [("read", _old, _new),
+                       ("columns", _old_columns, _new_columns)]:
+    t = time.time()
+    old(fn)
+    t_old = time.time() - t
+    t = time.time()
+    new(fn)
+    t_new = time.time() - t
+    print("%s: before %.2fs, after %.2fs (%.1fx)" % (
+        name, t_old, t_new, t_old / t_new))
+print("same attributes: %s" % same)
+if not args.gff:
+    os.remove(fn)
@@ -0,0 +1,104 @@
+"""Bytes used per read by mirtop.mirna.realign.hits and isomir
+
+The reads are stored as *mirtop.bam.bam._analyze_line()* does, and
+compared with the classes without __slots__ that kept the
+pysam segment of each alignment.
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import tracemalloc
+from collections import defaultdict
+
+import pysam
+
+from mirtop.mirna.realign import hits, isomir, make_id
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", type=int, default=100000,
+                    help="Number of reads.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+class old_hits:
+    def __init__(self):
+        self.sequence = ""
+        self.idseq = ""
+        self.precursors = defaultdict(old_isomir)
+        self.score = []
+        self.best_hits = []
+        self.counts = 0
+
+    def set_sequence(self, seq):
+        self.sequence = seq
+        self.idseq = make_id(seq)
+
+
+class old_isomir:
+    def __init__(self):
+        self.t5 = []
+        self.t3 = []
+        self.add = []
+        self.subs = []
+        self.external = ""
+        self.align = None
+        self.cigar = None
+        self.filter = "Pass"
+        self.map_score = 0
+        self.end = None
+        self.start = None
+        self.mirna = None
+        self.strand = "+"
+
+
+header = pysam.AlignmentHeader.from_dict(
+    {"SQ": [{"SN": "hsa-let-7a-1", "LN": 80}, {"SN": "hsa-let-7a-2", "LN": 80}]})
+reads = []
+for idx in range(args.n):
+    seq = "".join(random.choice("ACGT") for _ in range(random.randint(18, 25)))
+    sam = "\t".join(["seq_%s_x%s" % (idx, random.randint(1, 100)), "0",
+                     "hsa-let-7a-1", "6", "255", "%sM" % len(seq), "*", "0", "0",
+                     seq, "*"])
+    reads.append((sam.split("\t")[0], seq, sam, random.randint(1, 2)))
+
+
+def _store(hits_class, isomir_class, keep_segment):
+    stored = dict()
+    for name, seq, sam, n_hits in reads:
+        read = hits_class()
+        read.set_sequence(str(seq))
+        read.counts = int(name.split("_x")[1])
+        for pos in range(n_hits):
+            iso = isomir_class()
+            if keep_segment:
+                iso.align = pysam.AlignedSegment.fromstring(sam, header)
+            iso.start = 5 + pos
+            iso.end = iso.start + len(seq) - 1
+            iso.subs, iso.add, iso.cigar = [], [], "%sM" % len(seq)
+            chrom = "hsa-let-7a-%s" % (pos + 1)
+            if keep_segment:
+                read.precursors[(chrom, iso.start)] = iso
+            else:
+                read.set_precursor(chrom, iso)
+        stored[name] = read
+    return stored
+
+
+def _bytes(hits_class, isomir_class, keep_segment):
+    tracemalloc.start()
+    stored = _store(hits_class, isomir_class, keep_segment)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del stored
+    return size / float(args.n)
+
+
+before = _bytes(old_hits, old_isomir, True)
+after = _bytes(hits, isomir, False)
+print("reads: %s" % args.n)
+print("before: %.0f bytes per read" % before)
+print("after: %.0f bytes per read (%.1fx)" % (after, before / after))
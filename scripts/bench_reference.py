@@ -0,0 +1,68 @@
+"""Compare loading a compiled reference with reading the FASTA and GFF files
+
+Creates miRBase-like hairpin and GFF files with -n precursors, compiles
+them with mirtop.mirna.reference and times the layouts used by the
+commands read from the files and from the compiled reference.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from mirtop.mirna import fasta, mapper, reference
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of precursors.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+tmp_dir = tempfile.mkdtemp()
+os.environ[reference.CACHE_ENV] = tmp_dir
+hairpin = os.path.join(tmp_dir, "hairpin.fa")
+gtf = os.path.join(tmp_dir, "hsa.gff3")
+with open(hairpin, 'w') as fa, open(gtf, 'w') as gff:
+    gff.write("# microRNAs:               miRBase v21\n")
+    for idx in range(args.n):
+        name = "hsa-mir-%s" % idx
+        size = random.randint(60, 110)
+        seq = "".join(random.choice("ACGU") for _ in range(size))
+        fa.write(">%s MI%07d Homo sapiens %s stem-loop\n" % (name, idx, name))
+        fa.write("%s\n%s\n" % (seq[:60], seq[60:]))
+        start = random.randint(1, 10 ** 8)
+        gff.write("chr1\t.\tmiRNA_primary_transcript\t%s\t%s\t.\t+\t.\t"
+                  "ID=MI%07d;Alias=MI%07d;Name=%s\n" % (
+                      start, start + size - 1, idx, idx, name))
+        for arm, pos in (("5p", 5), ("3p", size - 27)):
+            gff.write("chr1\t.\tmiRNA\t%s\t%s\t.\t+\t.\tID=MIMAT%07d%s;"
+                      "Alias=MIMAT%07d%s;Name=hsa-miR-%s-%s;"
+                      "Derives_from=MI%07d\n" % (
+                          start + pos, start + pos + 21, idx, arm, idx, arm,
+                          idx, arm, idx))
+
+t = time.time()
+expected = (fasta.read_precursor(hairpin, "hsa"),
+            mapper.read_gtf_to_precursor(gtf, None),
+            mapper.read_gtf_to_mirna(gtf))
+t_files = time.time() - t
+
+t = time.time()
+reference.bundle(hairpin, gtf, "hsa").save()
+t_build = time.time() - t
+
+t = time.time()
+ref = reference.load(hairpin, gtf, "hsa")
+observed = (ref.precursors, ref.matures, ref.genomic)
+t_load = time.time() - t
+
+print("precursors: %s" % args.n)
+print("files: %.2fs, build: %.2fs" % (t_files, t_build))
+print("compiled: %.2fs (%.1fx), same layouts: %s" % (
+    t_load, t_files / t_load, expected == observed))
+shutil.rmtree(tmp_dir)
@@ -0,0 +1,96 @@
+"""Compare the seqbuster importer with the one of other git revision
+
+Reads a seqbuster file with *mirtop.importer.seqbuster* of --rev
+(one dictionary for each line, and annotating each line by itself
+with --low-memory before this change) and of the working tree, and
+checks the GFF lines are the same. Use --mirna with a big file, or a
+file with -n lines is created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import types
+
+from mirtop.bam import filter
+from mirtop.importer import seqbuster
+from mirtop.mirna import fasta, mapper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--mirna", help="seqbuster file, a big one is better.")
+parser.add_argument("--example", default="data/examples/seqbuster/reads.mirna",
+                    help="seqbuster file with the lines repeated to create the file.")
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa")
+parser.add_argument("--gtf", default="data/examples/annotate/hsa.gff3")
+parser.add_argument("-n", type=int, default=100000,
+                    help="Number of lines of the created file.")
+parser.add_argument("--rev", default="HEAD",
+                    help="git revision with the importer to compare.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _module(rev):
+    """mirtop.importer.seqbuster at git revision *rev*."""
+    source = subprocess.check_output(["git", "show", "%s:mirtop/importer/seqbuster.py" % rev])
+    module = types.ModuleType("seqbuster_%s" % rev)
+    exec(compile(source, "seqbuster_%s.py" % rev, "exec"), module.__dict__)
+    return module
+
+
+def _read(module, fn, options):
+    filter._tune_cache.clear()
+    t = time.time()
+    reads = module.read_file(fn, options)
+    t_reads = time.time() - t
+    # kept as text, so the objects don't slow down the next run
+    reads = _hits(reads)
+    filter._tune_cache.clear()
+    out_handle = io.StringIO()
+    t = time.time()
+    module.read_file_low_memory(fn, "sample", options, out_handle)
+    return t_reads, time.time() - t, (reads, out_handle.getvalue())
+
+
+def _hits(reads):
+    return "\n".join("%s %s %s %s" % (r, reads[r].sequence, reads[r].counts,
+                                       [(p, iso.format()) for p, iso in reads[r].precursors.items()])
+                     for r in reads)
+
+
+options = argparse.Namespace(precursors=fasta.read_precursor(args.hairpin, "hsa"),
+                             matures=mapper.read_gtf_to_precursor(args.gtf, None),
+                             database="miRBasev21", out_format="gff",
+                             add_extra=False, keep_name=False)
+tmp_dir = tempfile.mkdtemp()
+fn = args.mirna
+if not fn:
+    with open(args.example) as inh:
+        header = inh.readline()
+        body = [line.split("\t") for line in inh]
+    fn = os.path.join(tmp_dir, "bench.mirna")
+    with open(fn, 'w') as outh:
+        outh.write(header)
+        for idx in range(args.n):
+            cols = list(random.choice(body))
+            cols[1] = "seq_%s_x%s" % (idx, random.randint(1, 100))
+            # one change to get different sequences
+            pos = random.randint(0, len(cols[0]) - 1)
+            cols[0] = cols[0][:pos] + random.choice("ACGT") + cols[0][pos + 1:]
+            outh.write("\t".join(cols))
+
+r_old, t_old, old = _read(_module(args.rev), fn, options)
+r_new, t_new, new = _read(seqbuster, fn, options)
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+print("read_file before %.2fs, after %.2fs (%.1fx)" % (r_old, r_new, r_old / r_new))
+print("--low-memory before %.2fs, after %.2fs (%.1fx)" % (t_old, t_new, t_old / t_new))
+print("same hits and lines: %s" % (old == new))
+shutil.rmtree(tmp_dir)
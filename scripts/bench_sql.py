@@ -0,0 +1,77 @@
+"""Compare loading a GFF file into SQLite in batches with one insert per row
+
+Loads the file as *mirtop sql --create* did before (insert and commit
+each line) and as it does now. Use --gff with a big file, or a file
+with -n lines is created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from mirtop.sql import sql
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/annotate/SQL_sample.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of lines of the created file.")
+args = parser.parse_args()
+
+
+def _old(fn, db):
+    conn = sqlite3.connect(db)
+    source = ""
+    with open(fn) as inh:
+        for text in inh:
+            if text.startswith("## source-ontology"):
+                source = text.strip().split(' ')[-1]
+            elif text.startswith("## COLDATA"):
+                sql.create_table(conn, ["%s text" % s.replace('-', '_') for s in
+                                        text.strip().split(' ')[-1].split(',')])
+            elif not text.startswith("#"):
+                sql.gff_insert_values(conn, sql._gff_values(text, source))
+    conn.close()
+
+
+def _new(fn, db):
+    sql.insert_sql(argparse.Namespace(gff=fn, out=os.path.dirname(db),
+                                      db=os.path.basename(db)))
+
+
+def _rows(db):
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT * FROM data_sets").fetchall()
+    conn.close()
+    return rows
+
+
+tmp_dir = tempfile.mkdtemp()
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        lines = inh.readlines()
+    header = [line for line in lines if line.startswith("#")]
+    body = [line for line in lines if not line.startswith("#")]
+    fn = os.path.join(tmp_dir, "bench.gff")
+    with open(fn, 'w') as outh:
+        outh.writelines(header)
+        for idx in range(args.n):
+            outh.write(body[idx % len(body)])
+
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+times = []
+for name, load in [("old", _old), ("new", _new)]:
+    t = time.time()
+    load(fn, os.path.join(tmp_dir, "%s.db" % name))
+    times.append(time.time() - t)
+print("row by row %.2fs, batches %.2fs (%.1fx)" % (
+    times[0], times[1], times[0] / times[1]))
+print("same rows: %s" % (_rows(os.path.join(tmp_dir, "old.db")) ==
+                         _rows(os.path.join(tmp_dir, "new.db"))))
+shutil.rmtree(tmp_dir)
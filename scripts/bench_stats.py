@@ -0,0 +1,94 @@
+"""Compare mirtop.gff.stats with the version using a long pandas table
+
+Computes the stats of a GFF file as *mirtop.gff.stats._calc_stats()* did
+before (one row for each category, sample and line, and a groupby for
+each summary) and as it does now. Use --gff with a big merged file, or
+a file with -n lines and -s samples is created from the example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+import pandas as pd
+
+from mirtop.gff import stats
+from mirtop.gff.classgff import read_features
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of lines of the created file.")
+parser.add_argument("-s", type=int, default=200,
+                    help="Number of samples of the created file.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _old(fn):
+    samples = stats._get_samples(fn)
+    lines = []
+    seen = set()
+    ok = re.compile('pass', re.IGNORECASE)
+    for gff in read_features(fn):
+        attr = gff.attributes
+        if not ok.match(attr['Filter']):
+            continue
+        key = "-".join([attr['UID'], attr.get('Variant', ''), attr['Name']])
+        if key in seen:
+            continue
+        seen.add(key)
+        counts = dict(zip(samples, attr['Expression'].split(",")))
+        variant = attr.get('Variant', '')
+        for s in counts:
+            if int(counts[s]) > 0:
+                lines.append([gff.columns['type'], s, counts[s]])
+            if variant.find("iso") == -1:
+                continue
+            for v in variant.split(","):
+                if int(counts[s]) > 0:
+                    lines.append([v.split(":")[0], s, counts[s]])
+    df = pd.DataFrame.from_records(lines, columns=["category", "sample", "counts"])
+    df.counts = df.counts.astype(int)
+    out = []
+    for suffix, how in [("sum", "sum"), ("count", "count"), ("mean", "mean")]:
+        df_how = getattr(df.groupby(['category', 'sample'], as_index=False), how)()
+        df_how['category'] = ["%s_%s" % (r, suffix) for r in df_how['category']]
+        out.append(stats._add_missing(df_how))
+    return pd.concat(out)
+
+
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        body = [line for line in inh if not line.startswith("#")]
+    fn = tempfile.mktemp(suffix=".gff")
+    with open(fn, 'w') as outh:
+        outh.write("## mirGFF3. VERSION 1.1\n")
+        outh.write("## COLDATA: %s\n" % ",".join("s%s" % s for s in range(args.s)))
+        for idx in range(args.n):
+            line = body[idx % len(body)].replace("UID=", "UID=%s" % idx)
+            expression = ",".join(str(random.choice([0, 0, 1, 2, 10]))
+                                  for _ in range(args.s))
+            outh.write(re.sub("Expression=[^;]*", "Expression=%s" % expression,
+                              line))
+
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+t = time.time()
+expected = _old(fn)
+t_old = time.time() - t
+t = time.time()
+observed = stats._calc_stats(fn)
+t_new = time.time() - t
+print("before %.2fs, after %.2fs (%.1fx)" % (t_old, t_new, t_old / t_new))
+print("same table: %s" % (expected.to_csv() == observed.to_csv()))
+if not args.gff:
+    os.remove(fn)
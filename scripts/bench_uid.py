@@ -0,0 +1,45 @@
+"""Compare mirtop.mirna.uid with mintplates.convert"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+from mirtop.mirna import mintplates, uid
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", type=int, default=200000,
+                    help="Number of sequences.")
+parser.add_argument("--unique", type=int, default=20000,
+                    help="Number of different sequences.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+unique = ["".join(random.choice("ACGT") for _ in range(random.randint(18, 26)))
+          for _ in range(args.unique)]
+seqs = [random.choice(unique) for _ in range(args.n)]
+
+t = time.time()
+expected = [mintplates.convert(seq, True, "iso") for seq in seqs]
+t_encode = time.time() - t
+t = time.time()
+decoded = [mintplates.convert(plate, False, "iso") for plate in expected]
+t_decode = time.time() - t
+
+uid.clear_cache()
+t = time.time()
+plates = [uid.encode(seq) for seq in seqs]
+t_uid_encode = time.time() - t
+t = time.time()
+observed = [uid.decode(plate) for plate in plates]
+t_uid_decode = time.time() - t
+
+print("sequences: %s (%s different)" % (args.n, args.unique))
+print("encode: mintplates %.2fs, uid %.2fs (%.1fx), different: %s" % (
+    t_encode, t_uid_encode, t_encode / t_uid_encode,
+    sum(1 for e, o in zip(expected, plates) if e != o)))
+print("decode: mintplates %.2fs, uid %.2fs (%.1fx), different: %s" % (
+    t_decode, t_uid_decode, t_decode / t_uid_decode,
+    sum(1 for e, o in zip(decoded, observed) if e != o)))
@@ -0,0 +1,56 @@
+"""Compare mirtop.gff.body.variant_with_nt with and without the cache
+
+Gets the nts changes of each line of a GFF file -r times, as the
+*--add-extra* option does when the same sequences are in several
+samples or files, parsing every line as before and with the cached
+*variant_nt()*, in one process and in --jobs processes.
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from mirtop.gff import body
+from mirtop.gff.classgff import feature, read_features
+from mirtop.mirna import fasta, mapper
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", default="data/examples/gff/correct_file.gff",
+                    help="GFF file with miRBase names.")
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa")
+parser.add_argument("--gtf", default="data/examples/annotate/hsa.gff3")
+parser.add_argument("-r", type=int, default=2000,
+                    help="Number of times each line is read.")
+parser.add_argument("--jobs", type=int, default=4)
+args = parser.parse_args()
+
+precursors = fasta.read_precursor(args.hairpin, "hsa")
+matures = mapper.read_gtf_to_precursor(args.gtf, None)
+lines = [gff.line for gff in read_features(args.gff)] * args.r
+
+
+def _old(line):
+    attr = feature(line).attributes
+    return body._variant_nt(attr["UID"], attr["Parent"], attr["Name"],
+                            attr.get("Variant", ""), precursors, matures)
+
+
+t = time.time()
+expected = [_old(line) for line in lines]
+t_old = time.time() - t
+body._nt_cache.clear()
+t = time.time()
+observed = [body.variant_with_nt(line, precursors, matures) for line in lines]
+t_new = time.time() - t
+keys = []
+for line in lines:
+    attr = feature(line).attributes
+    keys.append((attr["UID"], attr["Parent"], attr["Name"], attr.get("Variant", "")))
+body._nt_cache.clear()
+t = time.time()
+parallel = body.variants_nt(keys, precursors, matures, args.jobs)
+t_jobs = time.time() - t
+print("lines: %s" % len(lines))
+print("before %.2fs, cached %.2fs (%.1fx), %s jobs from parsed fields %.2fs" % (
+    t_old, t_new, t_old / t_new, args.jobs, t_jobs))
+print("same changes: %s" % (expected == observed == parallel))
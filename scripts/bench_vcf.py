@@ -0,0 +1,83 @@
+"""Compare the VCF exporter with the one of other git revision
+
+Writes the VCF file of a GFF file with *mirtop.exporter.vcf.create_vcf()*
+of --rev (walking the Cigar one character at a time and adding the
+counts in python lists before this change) and of the working tree,
+and checks the variant lines are the same. Use --gff with a big merged
+file, or a file with -n lines and -s samples is created from the
+example data.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import types
+
+from mirtop.exporter import vcf
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gff", help="GFF file, a big merged file is better.")
+parser.add_argument("--example", default="data/examples/gff/correct_file.gff",
+                    help="GFF with the lines repeated to create the file.")
+parser.add_argument("--hairpin", default="data/examples/annotate/hairpin.fa")
+parser.add_argument("--gtf", default="data/examples/annotate/hsa.gff3")
+parser.add_argument("-n", type=int, default=20000,
+                    help="Number of lines of the created file.")
+parser.add_argument("-s", type=int, default=1000,
+                    help="Number of samples of the created file.")
+parser.add_argument("--rev", default="HEAD",
+                    help="git revision with the exporter to compare.")
+parser.add_argument("--seed", type=int, default=42,
+                    help="set up seed for reproducibility.")
+args = parser.parse_args()
+random.seed(args.seed)
+
+
+def _module(rev):
+    """mirtop.exporter.vcf at git revision *rev*."""
+    source = subprocess.check_output(["git", "show", "%s:mirtop/exporter/vcf.py" % rev])
+    module = types.ModuleType("vcf_%s" % rev)
+    exec(compile(source, "vcf_%s.py" % rev, "exec"), module.__dict__)
+    return module
+
+
+def _write(module, fn, out_file):
+    t = time.time()
+    module.create_vcf(fn, args.hairpin, args.gtf, out_file, None)
+    return time.time() - t
+
+
+tmp_dir = tempfile.mkdtemp()
+fn = args.gff
+if not fn:
+    with open(args.example) as inh:
+        body = [line for line in inh if not line.startswith("#")]
+    fn = os.path.join(tmp_dir, "bench.gff")
+    with open(fn, 'w') as outh:
+        outh.write("## mirGFF3. VERSION 1.1\n")
+        outh.write("## source-ontology: miRBasev21\n")
+        outh.write("## COLDATA: %s\n" % ",".join("s%s" % s for s in range(args.s)))
+        for idx in range(args.n):
+            line = body[idx % len(body)]
+            expression = ",".join(str(random.choice([0, 0, 1, 2, 10]))
+                                  for _ in range(args.s))
+            outh.write(re.sub("Expression=[^;]*", "Expression=%s" % expression,
+                              line))
+
+old_fn = os.path.join(tmp_dir, "old.vcf")
+new_fn = os.path.join(tmp_dir, "new.vcf")
+t_old = _write(_module(args.rev), fn, old_fn)
+t_new = _write(vcf, fn, new_fn)
+print("file: %s (%.1f MB)" % (fn, os.path.getsize(fn) / 1e6))
+print("before %.2fs, after %.2fs (%.1fx)" % (t_old, t_new, t_old / t_new))
+with open(old_fn) as old, open(new_fn) as new:
+    print("same variants: %s" % (
+        sorted(line.strip() for line in old if line.strip() and not line.startswith("#")) ==
+        sorted(line.strip() for line in new if not line.startswith("#"))))
+shutil.rmtree(tmp_dir)
@@ -122,6 +122,33 @@ class AutomatedAnalysisTest(unittest.TestCase):
             print(" ".join(clcode))
             subprocess.check_call(clcode)
 
+    ##@attr(complete=True)
+    ##@attr(cmd=True)
+    def test_srnaseq_annotation_bam_threads(self):
+        """Run miraligner analysis with several processes
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "gff",
+                      "--sps", "hsa", "--add-extra",
+                      "--hairpin", "../../data/examples/annotate/hairpin.fa",
+                      "--gtf", "../../data/examples/annotate/hsa.gff3",
+                      "-o", "test_out_mirs",
+                      "../../data/examples/annotate/sim_isomir.sam"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            clcode[-2:-1] = ["test_out_mirs_threads", "--threads", "2"]
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            for fn in ["mirtop.gff", "sim_isomir.gff"]:
+                with open(os.path.join("test_out_mirs", fn)) as inh:
+                    expected = inh.readlines()
+                with open(os.path.join("test_out_mirs_threads", fn)) as inh:
+                    observed = inh.readlines()
+                if expected != observed:
+                    raise ValueError("%s is different with --threads." % fn)
+
     ##@attr(complete=True)
     ##@attr(low_memory=True)
     ##@attr(cmd=True)
@@ -140,6 +167,35 @@ class AutomatedAnalysisTest(unittest.TestCase):
             print(" ".join(clcode))
             subprocess.check_call(clcode)
 
+    ##@attr(complete=True)
+    ##@attr(low_memory=True)
+    ##@attr(cmd=True)
+    def test_srnaseq_annotation_bam_chunk_reads(self):
+        """Run miraligner analysis
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "gff", "--low-memory", "--chunk-reads", "3",
+                      "--sps", "hsa", "--add-extra",
+                      "--hairpin", "../../data/examples/annotate/hairpin.fa",
+                      "--gtf", "../../data/examples/annotate/hsa.gff3",
+                      "-o", "test_out_mirs",
+                      "../../data/examples/annotate/sim_isomir.sam"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            for name, option in [("test_out_mirs_read", ["--chunk-reads", "1"]),
+                                 ("test_out_mirs_bytes", ["--chunk-bytes", "2000"])]:
+                chunk = clcode[:3] + option + clcode[5:-2] + [name, clcode[-1]]
+                print(" ".join(chunk))
+                subprocess.check_call(chunk)
+                with open(os.path.join("test_out_mirs", "sim_isomir.gff")) as inh:
+                    expected = inh.readlines()
+                with open(os.path.join(name, "sim_isomir.gff")) as inh:
+                    observed = inh.readlines()
+                if expected != observed:
+                    raise ValueError("Different lines with %s" % " ".join(option))
+
     ##@attr(cmd_bam_genomic=True)
     ##@attr(complete=True)
     ##@attr(cmd=True)
@@ -313,6 +369,27 @@ class AutomatedAnalysisTest(unittest.TestCase):
             if sum(1 for line in open('test_out_mirs/mirtop_stats.txt')) == 1:
                 raise ValueError("File is empty, something is wrong with stats cmd.")
 
+    ##@attr(complete=True)
+    ##@attr(cmd_reference=True)
+    ##@attr(cmd=True)
+    def test_reference_build(self):
+        """
+        Run compilation of the reference
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "reference", "build",
+                      "--sps", "hsa",
+                      "--hairpin", "../../data/examples/annotate/hairpin.fa",
+                      "--gtf", "../../data/examples/annotate/hsa.gff3",
+                      "-o", "test_out_reference"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            if not [fn for fn in os.listdir("test_out_reference")
+                    if fn.endswith(".mirtop")]:
+                raise ValueError("Compiled reference not found.")
+
     ##@attr(complete=True)
     ##@attr(cmd_merge=True)
     ##@attr(cmd=True)
@@ -333,6 +410,36 @@ class AutomatedAnalysisTest(unittest.TestCase):
             print(" ".join(clcode))
             subprocess.check_call(clcode)
 
+    ##@attr(complete=True)
+    ##@attr(cmd_merge=True)
+    ##@attr(cmd=True)
+    def test_merge_bam_jobs(self):
+        """
+        Run collapse two samples processed at the same time
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "gff",
+                      "--sps", "hsa", "--add-extra",
+                      "--hairpin", "../../data/examples/annotate/hairpin.fa",
+                      "--gtf", "../../data/examples/annotate/hsa.gff3",
+                      "-o", "test_out_mirs",
+                      "../../data/merge/samples1.sam",
+                      "../../data/merge/samples2.sam"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            clcode[-3:-2] = ["test_out_mirs_jobs", "--jobs", "2"]
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            for fn in ["mirtop.gff", "samples1.gff", "samples2.gff"]:
+                with open(os.path.join("test_out_mirs", fn)) as inh:
+                    expected = inh.readlines()
+                with open(os.path.join("test_out_mirs_jobs", fn)) as inh:
+                    observed = inh.readlines()
+                if expected != observed:
+                    raise ValueError("%s is different with --jobs." % fn)
+
     ##@attr(complete=True)
     ##@attr(cmd_export_seqbuster=True)
     ##@attr(cmd=True)
@@ -391,6 +498,30 @@ class AutomatedAnalysisTest(unittest.TestCase):
             print(" ".join(clcode))
             subprocess.check_call(clcode)
 
+    ##@attr(complete=True)
+    ##@attr(cmd_export_formats=True)
+    ##@attr(cmd=True)
+    def test_export_formats(self):
+        """
+        Run export command with several formats at the same time
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "export",
+                      "-o", "test_out_mirs",
+                      "--format", "seqbuster,fasta,isomir,vcf",
+                      "--hairpin", "../../data/examples/annotate/hairpin.fa",
+                      "--gtf", "../../data/examples/annotate/hsa.gff3",
+                      "../../data/examples/gff/correct_file.gff"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            for fn in ["let7a-5p.mirna", "correct_file.fasta",
+                       "correct_file_rawData.tsv", "correct_file.vcf.gz",
+                       "correct_file.vcf.gz.tbi"]:
+                if not os.path.exists(os.path.join("test_out_mirs", fn)):
+                    raise ValueError("%s not created." % fn)
+
     ##@attr(complete=True)
     ##@attr(cmd_count=True)
     ##@attr(cmd=True)
@@ -518,6 +649,37 @@ class AutomatedAnalysisTest(unittest.TestCase):
             print(" ".join(clcode))
             subprocess.check_call(clcode)
 
+    ##@attr(complete=True)
+    ##@attr(cmd_validate=True)
+    ##@attr(cmd=True)
+    def test_sql_create_long_cmd(self):
+        """Run sql command to incorporate GFF to SQLite in long format
+        """
+        with make_workdir():
+            clcode = ["mirtop",
+                      "sql",
+                      "-c",
+                      "--gff",
+                      "../../data/examples/annotate/SQL_sample.gff",
+                      "--schema",
+                      "long",
+                      "-o",
+                      ".",
+                      "--db",
+                      "long.db"]
+            print("")
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+            clcode = ["mirtop",
+                      "sql",
+                      "-q",
+                      "--db",
+                      "long.db",
+                      "-e",
+                      "isomirs-per-sample"]
+            print(" ".join(clcode))
+            subprocess.check_call(clcode)
+
     ##@attr(complete=True)
     ##@attr(cmd_validate=True)
     ##@attr(cmd=True)
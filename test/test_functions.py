@@ -122,6 +122,42 @@ class FunctionsTest(unittest.TestCase):
         map_mir = mapper.read_gtf_to_mirna("data/examples/annotate/hsa.gff3")
         print(map_mir)
 
+    ##@attr(reference=True)
+    def test_reference(self):
+        """Test compiled reference"""
+        import os
+        import shutil
+        import tempfile
+        from mirtop.mirna import fasta, mapper, reference
+        hairpin = "data/examples/annotate/hairpin.fa"
+        gtf = "data/examples/annotate/hsa.gff3"
+        tmp_dir = tempfile.mkdtemp()
+        cache = os.environ.get(reference.CACHE_ENV)
+        os.environ[reference.CACHE_ENV] = tmp_dir
+        try:
+            fn = reference.bundle(hairpin, gtf, "hsa").save()
+            ref = reference.load(hairpin, gtf, "hsa", "miRBasev21")
+            if not ref.layouts or ref.path() != fn:
+                raise ValueError("Compiled reference not loaded.")
+            if ref.precursors != fasta.read_precursor(hairpin, "hsa") or \
+                    ref.matures != mapper.read_gtf_to_precursor(gtf, None) or \
+                    ref.genomic != mapper.read_gtf_to_mirna(gtf) or \
+                    ref.chrom != mapper.read_gtf_chr2mirna(gtf):
+                raise ValueError("Compiled reference is different.")
+            changed = os.path.join(tmp_dir, "hairpin.fa")
+            shutil.copy(hairpin, changed)
+            with open(changed, 'a') as outh:
+                outh.write(">hsa-mir-new\nACGT\n")
+            ref = reference.load(changed, gtf, "hsa")
+            if ref.layouts or "hsa-mir-new" not in ref.precursors:
+                raise ValueError("Compiled reference used for changed files.")
+        finally:
+            if cache is None:
+                del os.environ[reference.CACHE_ENV]
+            else:
+                os.environ[reference.CACHE_ENV] = cache
+            shutil.rmtree(tmp_dir)
+
     ##@attr(read_line=True)
     def test_read_line(self):
         """Read GFF/GTF line"""
@@ -179,6 +215,9 @@ class FunctionsTest(unittest.TestCase):
         if not make_cigar("AAA-AAATAAA", "AGACAAA-AAA") == "MAMD3MI3M":
             raise ValueError("Cigar not eq to MAMD3MI3M: %s" %
                              make_cigar("AAA-AAATAAA", "AGACAAA-AAA"))
+        if not make_cigar("AAATAAA", "AAACAAAT") == "3MT3M":
+            raise ValueError("Cigar not eq to 3MT3M: %s" %
+                             make_cigar("AAATAAA", "AAACAAAT"))
         # test expand cigar
         if not expand_cigar("3MA3M") == "MMMAMMM":
             raise ValueError("Cigar 3MA3M not eqaul to MMMAMMM but to %s" %
@@ -188,6 +227,178 @@ class FunctionsTest(unittest.TestCase):
             raise ValueError("3MA3M not equal AAATCCC but %s" %
                              cigar2snp("3MA3M", "AAATCCC"))
 
+    ##@attr(tune_cache=True)
+    def test_tune_cache(self):
+        """testing cache of realignment results"""
+        from mirtop.bam import filter
+        precursor = "TGAGGTAGTAGGTTGTATAGTTTTAGGGTCACACCC"
+        seq = "TGAGGTAGTAGGTTGTATAGTTAA"
+        filter.clear_tune_cache()
+        expected = filter.tune(seq, precursor, 0, None)
+        first = filter.tune_cached(seq, "mir", precursor, 0, None)
+        first[0].append([0, "A", "T"])
+        second = filter.tune_cached(seq, "mir", precursor, 0, None)
+        if list(second) != list(expected):
+            raise ValueError("Cached result %s differs from %s" % (
+                second, expected))
+        if filter._tune_stats != {"hits": 1, "misses": 1}:
+            raise ValueError("Wrong cache counts: %s" % filter._tune_stats)
+        filter.clear_tune_cache()
+
+    ##@attr(tune_many=True)
+    def test_tune_many(self):
+        """testing realignment of many reads at once"""
+        from mirtop.bam import filter
+        precursor = "TGAGGTAGTAGGTTGTATAGTTTTAGGGTCACACCC"
+        reads = ["TGAGGTAGTAGGTTGTATAGTT", "TGAGGTAGTAGGTTGTATAGTA",
+                 "TGAGGTCGTAGGTTGTATAGAA", "TGAGGTAGTAGGTTGTATAGTTTTAG",
+                 "TGAGGTAGTAGTTGTATAGTT", "TGAGGTAGTAGGTTGTATAGCC"]
+        reads += [reads[0][:pos] + "A" + reads[0][pos + 1:] for pos in range(22)]
+        reads += [seq[:-1] + "T" for seq in reads]
+        items = []
+        for seq in reads * 2:
+            for start in range(3):
+                items.append((seq, "mir", precursor, start, None))
+                items.append((seq, "mir", precursor, start, [(0, len(seq))]))
+        filter.clear_tune_cache()
+        batch = filter.tune_many(items)
+        for item, result in zip(items, batch):
+            expected = filter.tune(item[0], item[2], item[3], item[4])
+            if list(result) != list(expected):
+                raise ValueError("%s: %s != %s" % (item, result, expected))
+        filter.clear_tune_cache()
+
+    ##@attr(uid=True)
+    def test_uid(self):
+        """testing UID codec against MINTplates"""
+        import random
+        from mirtop.mirna import mintplates, uid
+        random.seed(42)
+
+        def _convert(fn, *args):
+            try:
+                return fn(*args)
+            except KeyError:
+                return KeyError
+        seqs = ["".join(random.choice("ACGTacgtU") for _ in range(size))
+                for size in list(range(1, 61)) * 20]
+        plates = [uid.encode(seq) for seq in seqs]
+        for seq, plate in zip(seqs, plates):
+            if plate != mintplates.convert(seq, True, "iso"):
+                raise ValueError("Wrong UID for %s: %s" % (seq, plate))
+            if uid.decode(plate) != seq.upper().replace("U", "T"):
+                raise ValueError("Wrong sequence for %s" % plate)
+        wrong = [plate[:-1] for plate in plates[:200]]
+        wrong += [plate + random.choice("B0A-") for plate in plates[:200]]
+        wrong += [plate.replace("-", "", 1) for plate in plates[:50]]
+        wrong += ["22-BBBBBBBB", "iso-x-BB", "ACGTN", "iso-5-BB-BB"]
+        for plate in wrong:
+            expected = _convert(mintplates.convert, plate, False, "iso")
+            if _convert(uid.decode, plate) != expected:
+                raise ValueError("Different output for %s" % plate)
+        for seq in ["ACGTN", "ACG-T", "ACGT\n"]:
+            if _convert(uid.encode, seq) != KeyError:
+                raise ValueError("Invalid sequence encoded: %s" % seq)
+        cache_size = uid.CACHE_SIZE
+        uid.CACHE_SIZE = 2
+        try:
+            uid.clear_cache()
+            for seq in ["AAA", "CCC", "AAA", "GGG"]:
+                uid.encode(seq)
+            if list(uid._encoded) != ["AAA", "GGG"]:
+                raise ValueError("Wrong sequences in cache: %s" % list(uid._encoded))
+        finally:
+            uid.CACHE_SIZE = cache_size
+            uid.clear_cache()
+
+    ##@attr(nucleotides=True)
+    def test_nucleotides(self):
+        """testing nucleotide kernel against Bio.Seq"""
+        import random
+        from Bio.Seq import Seq
+        from mirtop.mirna import nucleotides
+        random.seed(42)
+        seqs = ["".join(random.choice("ACGTUNacgtnRYKM") for _ in range(size))
+                for size in range(0, 40)]
+        expected = [str(Seq(seq).reverse_complement()) for seq in seqs]
+        for seq, rc in zip(seqs, expected):
+            if nucleotides.reverse_complement(seq) != rc:
+                raise ValueError("Wrong reverse complement for %s" % seq)
+        if not nucleotides.is_valid("ACgt") or nucleotides.is_valid("AC2TGC"):
+            raise ValueError("Wrong validation of sequences")
+        if nucleotides.mismatches("ACGTA", "ACCTAG") != [2]:
+            raise ValueError("Wrong mismatches")
+        if nucleotides.to_array(["ACG", "TTA"]).tolist() != [[65, 67, 71], [84, 84, 65]]:
+            raise ValueError("Wrong matrix of sequences")
+        if nucleotides.count_mismatches(["ACG", "TTA", "TTA"], ["ACG", "TAA", "AAT"]) != [0, 1, 3]:
+            raise ValueError("Wrong number of mismatches")
+        if nucleotides.mismatch_matrix(["ACG"], ["AGC"]).tolist() != [[False, True, True]]:
+            raise ValueError("Wrong matrix of mismatches")
+
+    ##@attr(hits=True)
+    def test_hits(self):
+        """testing compact storage of reads"""
+        import copy
+        import pickle
+        from mirtop.mirna.realign import hits, isomir, make_id
+        read = hits()
+        read.set_sequence("TGAGGTAGTAGGTTGTATAGTT")
+        iso = isomir()
+        iso.set_pos(5, 22)
+        read.set_precursor("hsa-let-7a-1", iso)
+        if hasattr(read, "__dict__") or hasattr(iso, "__dict__"):
+            raise ValueError("hits and isomir should use __slots__")
+        if read.idseq != make_id(read.sequence):
+            raise ValueError("Wrong UID %s" % read.idseq)
+        for other in [copy.deepcopy(read), pickle.loads(pickle.dumps(read))]:
+            if other.idseq != read.idseq or \
+                    list(other.precursors) != [("hsa-let-7a-1", 5)]:
+                raise ValueError("Read not copied properly")
+
+    ##@attr(annotate_index=True)
+    def test_annotate_index(self):
+        """testing annotation with the mature index"""
+        from mirtop.mirna import annotate
+        from mirtop.mirna.realign import hits, isomir
+        precursor = "TGAGGTAGTAGGTTGTATAGTTTTAGGGTCACACCCACCACTGGGAGATAA"
+        matures = {"pre": {"mir-1": [0, 21], "mir-2": [2, 23],
+                           "mir-3": [30, 50]}}
+        reads = dict()
+        for name, start, size in [("both", 1, 22), ("last", 31, 20),
+                                  ("none", 12, 22)]:
+            read = hits()
+            read.set_sequence(precursor[start:start + size])
+            iso = isomir()
+            iso.set_pos(start, size)
+            read.set_precursor("pre", iso)
+            reads[name] = read
+        annotate.annotate(reads, matures, {"pre": precursor}, quiet=True)
+        found = dict((r, list(reads[r].precursors.values())[0]) for r in reads)
+        if found["both"].mirna != "mir-2" or found["both"].t5 != "G":
+            raise ValueError("Wrong annotation %s %s" % (
+                found["both"].mirna, found["both"].t5))
+        if found["last"].mirna != "mir-3" or found["last"].t5 != "a":
+            raise ValueError("Wrong annotation %s %s" % (
+                found["last"].mirna, found["last"].t5))
+        if found["none"].mirna:
+            raise ValueError("Read annotated to %s" % found["none"].mirna)
+
+    ##@attr(aligner=True)
+    def test_aligner(self):
+        """testing banded aligner"""
+        from mirtop.mirna.aligner import global_align, align_many
+        ref = "TGAGGTAGTAGGTTGTATAGTT"
+        expected = {
+            "TGAGGTAGTAGGTTGTATAGTT": (ref, ref, 22.0, 0, 22),
+            "TGAGGTAGTAGTTGTATAGTT": ("TGAGGTAGTAG-TTGTATAGTT", ref, 20.0, 0, 22),
+            "TGAGGTAGCAGGTTGTATTGTT": ("TGAGGTAGCAGGTTGTATTGTT", ref, 18.0, 0, 22)}
+        for seq in expected:
+            if global_align(seq, ref) != expected[seq]:
+                raise ValueError("Wrong alignment %s" % str(global_align(seq, ref)))
+        pairs = [(seq, ref) for seq in expected] * 40
+        if align_many(pairs, band=1) != [expected[seq] for seq, _ in pairs]:
+            raise ValueError("align_many differs from global_align")
+
     ##@attr(sequence=True)
     def test_is_sequence(self):
         """testing if string is valid sequence"""
@@ -196,6 +407,10 @@ class FunctionsTest(unittest.TestCase):
             raise ValueError("ACTGC should return true.")
         if is_sequence("AC2TGC"):
             raise ValueError("AC2TGC should return false.")
+        if not is_sequence("actgc") or not is_sequence("ACTGC\n"):
+            raise ValueError("Lower case and a new line at the end are valid.")
+        if is_sequence("ACT\nGC") or is_sequence("ACTGC\n\n"):
+            raise ValueError("New lines inside the sequence are not valid.")
 
     ##@attr(locala=True)
     def test_locala(self):
@@ -231,6 +446,112 @@ class FunctionsTest(unittest.TestCase):
         print(gff.columns)
         print(gff.attributes)
 
+    ##@attr(class_gff=True)
+    def test_read_features(self):
+        """Test lazy attributes and streaming GFF reader"""
+        from mirtop.gff.classgff import feature, read_features
+        line = ("hsa-let-7a-1\tmiRBasev21\tisomiR\t4\t25\t0\t+\t.\t"
+                "UID=iso-22-0; Read=TGAGG; Name=hsa-let-7a-5p;"
+                " Parent=hsa-let-7a-1; Variant=iso_5p:+1; Expression=1,2;")
+        gff = feature(line)
+        if gff._attributes is not None:
+            raise ValueError("Attributes parsed before being used.")
+        if list(gff.attributes.keys())[:2] != ["UID", "Read"]:
+            raise ValueError("Wrong attributes %s" % gff.attributes)
+        if gff.attributes["Expression"] != "1,2" or gff.columns["start"] != "4":
+            raise ValueError("Wrong values %s %s" % (gff.columns, gff.attributes))
+        gff.attributes["Expression"] = "3"
+        if gff.paste_columns().find("Expression=3;") < 0:
+            raise ValueError("Changed attribute not pasted.")
+        if feature("## COLDATA: s1").attributes:
+            raise ValueError("Header with attributes.")
+        features = list(read_features("data/examples/gff/correct_file.gff"))
+        with open("data/examples/gff/correct_file.gff") as inh:
+            lines = [l for l in inh if not l.startswith("#")]
+        if [f.line for f in features] != lines:
+            raise ValueError("Wrong lines read.")
+        numbered = list(read_features("data/examples/gff/correct_file.gff", numbered=True))
+        if [num for num, f in numbered][:1] != [5] or len(numbered) != len(lines):
+            raise ValueError("Wrong line numbers %s" % [num for num, f in numbered])
+        for line in lines + [line.replace("=", " ").replace("Name ", "Name  ")]:
+            gff = feature(line)
+            values = [gff.attribute(key) for key in ["UID", "Name", "Variant"]]
+            if gff._attributes is not None and "Name  " not in line:
+                raise ValueError("Attributes parsed to get one of them.")
+            if values != [feature(line).attributes[key] for key in ["UID", "Name", "Variant"]]:
+                raise ValueError("Wrong attribute values %s" % values)
+
+    ##@attr(merge=True)
+    def test_merger(self):
+        """Test merge of samples written on disk"""
+        import argparse
+        import os
+        from collections import OrderedDict
+        from mirtop.gff import body, header, merge
+        args = argparse.Namespace(out_format="gff", keep_name=False)
+        dts = OrderedDict()
+        samples = []
+        for fn in ["2samples.gff", "correct_file.gff", "3wrong_type.gff",
+                   "missing_filter_type.gff"]:
+            fn = os.path.join("data/examples/gff", fn)
+            samples.extend(header.read_samples(fn))
+            dts[fn] = body.read(fn, args)
+        expected = merge.merge(dts, samples)
+        expected = [hit[4] for m in expected
+                    for s in sorted(expected[m].keys()) for hit in expected[m][s]]
+        max_open = merge.MAX_OPEN_FILES
+        merge.MAX_OPEN_FILES = 2
+        merged = merge.merger()
+        try:
+            for fn in dts:
+                merged.add(dts[fn])
+            observed = [hit[4] for hit in merged.merged(samples)]
+        finally:
+            merge.MAX_OPEN_FILES = max_open
+            merged.close()
+        if observed != expected:
+            raise ValueError("Different merged lines:\n%s\n%s" % (observed, expected))
+        if os.path.exists(merged.tmp_dir):
+            raise ValueError("Temporary files not removed.")
+
+    ##@attr(merge=True)
+    def test_merger_multimapped(self):
+        """Test merge of samples with reads mapped to several precursors"""
+        from collections import OrderedDict
+        from mirtop.gff import header, merge
+        from mirtop.importer import optimir
+        args = argparse.Namespace(out_format="gff", keep_name=False,
+                                  add_extra=False, database="miRBasev21",
+                                  gtf="data/examples/annotate/hsa.gff3")
+        fn = "data/examples/optimir/synthetic_100_full.gff3"
+        dts = OrderedDict()
+        dts[fn] = optimir.read_file(fn, args)
+        samples = header.read_samples(fn)
+        fn = "data/examples/gff/correct_file.gff"
+        dts[fn] = optimir.read_file(fn, args)
+        samples.extend(header.read_samples(fn))
+        expected = merge.merge(dts, samples)
+        expected = [hit[4] for m in expected
+                    for s in sorted(expected[m].keys()) for hit in expected[m][s]]
+        n_lines = sum(len(dts[fn][m][s]) for fn in dts
+                      for m in dts[fn] for s in dts[fn][m])
+        max_open, max_lines = merge.MAX_OPEN_FILES, merge.MAX_LINES
+        merge.MAX_OPEN_FILES = 2
+        merge.MAX_LINES = 5
+        merged = merge.merger()
+        try:
+            for fn in dts:
+                merged.add(dts[fn])
+            observed = [hit[4] for hit in merged.merged(samples)]
+        finally:
+            merge.MAX_OPEN_FILES, merge.MAX_LINES = max_open, max_lines
+            merged.close()
+        if len(expected) >= n_lines:
+            raise ValueError("No lines with the same UID in the samples.")
+        if observed != expected:
+            raise ValueError("Different merged lines:\n%s\n%s" % (
+                "\n".join(observed), "\n".join(expected)))
+
     ##@attr(merge=True)
     def test_merge(self):
         """Test merge functions"""
@@ -250,6 +571,32 @@ class FunctionsTest(unittest.TestCase):
         if expression != "1,2":
             raise ValueError("This is wrong: %s" % expression)
 
+    ##@attr(variant_nt=True)
+    def test_variant_nt(self):
+        """testing cached nts changes of the variants"""
+        from mirtop.mirna import fasta, mapper
+        from mirtop.gff import body
+        from mirtop.gff.classgff import read_features
+        precursors = fasta.read_precursor("data/examples/annotate/hairpin.fa",
+                                          "hsa")
+        matures = mapper.read_gtf_to_precursor(
+            "data/examples/annotate/hsa.gff3", None)
+        fn = "data/examples/gff/correct_file.gff"
+        expected = [body._variant_nt(g.attributes["UID"], g.attributes["Parent"],
+                                     g.attributes["Name"], g.attributes["Variant"],
+                                     precursors, matures)
+                    for g in read_features(fn)]
+        observed = [body.variant_with_nt(g.line, precursors, matures)
+                    for g in read_features(fn)]
+        keys = [(g.attributes["UID"], g.attributes["Parent"], g.attributes["Name"],
+                 g.attributes["Variant"]) for g in read_features(fn)]
+        body._nt_cache.clear()
+        parallel = body.variants_nt(keys, precursors, matures, jobs=2)
+        if expected != observed or expected != parallel:
+            raise ValueError("Different nts changes with the cache.")
+        if not expected[0].startswith("iso_5p:GA,"):
+            raise ValueError("Wrong nts changes %s" % expected[0])
+
     ##@attr(align_mature=True)
     def test_variant(self):
         """testing get mature sequence"""
@@ -351,6 +698,206 @@ class FunctionsTest(unittest.TestCase):
                                bam.read_bam,
                                gtf="data/db/mirbase/hsa.gff3", genomic=True))
 
+    ##@attr(bam_regions=True)
+    def test_bam_regions(self):
+        """testing reading precursors from indexed BAM files"""
+        import pysam
+        from mirtop.bam import bam
+
+        def _lines(gff):
+            return [hit[4] for chrom in gff for start in sorted(gff[chrom])
+                    for hit in gff[chrom][start]]
+
+        def _read_selected(fn, args):
+            args.precursor_names = "hsa-let-7a*"
+            return bam.read_bam(fn, args)
+
+        def _read_regions(fn, args):
+            if bam._by_region(fn, args):
+                raise ValueError("Indexed BAM read by precursor without --precursors")
+            return bam._read_region_bam(fn, args, True)
+
+        with make_workdir() as workdir:
+            bam_fn = os.path.join(workdir, "sim_isomir.bam")
+            pysam.sort("-o", bam_fn, "data/examples/annotate/sim_isomir.sam")
+            pysam.index(bam_fn)
+            expected = _lines(annotate("data/examples/annotate/sim_isomir.sam",
+                                       bam.read_bam))
+            if _lines(annotate(bam_fn, bam.read_bam)) != expected or \
+                    _lines(annotate(bam_fn, _read_regions)) != expected:
+                raise ValueError("Different output reading by precursor")
+            expected = [line for line in expected
+                        if line.startswith("hsa-let-7a")]
+            if not expected or \
+                    _lines(annotate(bam_fn, _read_selected)) != expected:
+                raise ValueError("Wrong precursors selected")
+
+    ##@attr(bam_threads=True)
+    def test_bam_threads(self):
+        """testing realigning blocks of BAM reads in other processes"""
+        from mirtop.gff import body
+        from mirtop.bam import bam, filter
+        from mirtop.mirna import fasta, mapper
+        from mirtop.mirna.annotate import annotate
+
+        def _lines(gff):
+            return [hit[4] for chrom in gff for start in sorted(gff[chrom])
+                    for hit in gff[chrom][start]]
+
+        fn = "data/examples/annotate/sim_isomir.sam"
+        args = argparse.Namespace()
+        args.hairpin = "data/examples/annotate/hairpin.fa"
+        args.gtf = "data/examples/annotate/hsa.gff3"
+        args.precursors = fasta.read_precursor(args.hairpin, "hsa")
+        args.matures = mapper.read_gtf_to_precursor(args.gtf, None)
+        args.database = "miRBasev21"
+        args.out_format = "gff"
+        args.add_extra = True
+        args.keep_name = False
+        args.genomic = False
+        args.out = None
+        args.threads = 2
+        filter.clear_tune_cache()
+        ann = annotate(bam.read_bam(fn, args), args.matures, args.precursors)
+        expected = _lines(body.create(ann, args.database, "Example", args))
+        serial = filter.tune_cache_stats()
+        filter.clear_tune_cache()
+        block_size = bam.BLOCK_SIZE
+        bam.BLOCK_SIZE = 5
+        try:
+            observed = _lines(bam.read_bam_parallel(fn, "Example", args))
+        finally:
+            bam.BLOCK_SIZE = block_size
+        if not expected or observed != expected:
+            raise ValueError("Different lines with --threads")
+        stats = filter.tune_cache_stats()
+        if stats["hits"] + stats["misses"] != serial["hits"] + serial["misses"]:
+            raise ValueError("Cache stats of the workers are missing: %s %s" % (
+                stats, serial))
+
+    ##@attr(intervals=True)
+    def test_intervals(self):
+        """testing overlap of genomic alignments with precursors"""
+        from mirtop.bam import intervals
+        precursors = intervals.index().load("data/db/mirbase/hsa.gff3",
+                                            "miRBasev22")
+        hits = precursors.overlap("9", 94175961, 94175982, "+")
+        if [h[2] for h in hits] != ["hsa-let-7a-1"]:
+            raise ValueError("Wrong overlap %s" % hits)
+        if intervals.lift(hits[0], 94175961, 94175982, "+") != 5:
+            raise ValueError("Wrong position in precursor")
+        if precursors.overlap("9", 94175961, 94175982, "-") or \
+                precursors.overlap("9", 94176036, 94176050, "+") or \
+                precursors.overlap("1", 94175961, 94175982, "+"):
+            raise ValueError("Overlap outside precursors")
+        hits = precursors.overlap("11", 122146567, 122146587, "-")
+        if intervals.lift(hits[0], 122146567, 122146587, "-") != 6:
+            raise ValueError("Wrong position in precursor")
+
+    ##@attr(manatee=True)
+    def test_manatee(self):
+        """testing Manatee alignments lifted to the precursors"""
+        from mirtop.importer import manatee
+        from mirtop.mirna import fasta, mapper
+        from mirtop.mirna.realign import reverse_complement
+        args = argparse.Namespace()
+        args.hairpin = "data/examples/annotate/hairpin.fa"
+        args.gtf = "data/examples/annotate/hsa.gff3"
+        args.sps = "hsa"
+        args.precursors = fasta.read_precursor(args.hairpin, "hsa")
+        args.matures = mapper.read_gtf_to_precursor(args.gtf, None)
+        args.database = mapper.guess_database(args)
+        args.out_format = "gff"
+        args.add_extra = False
+        args.keep_name = False
+        args.genomic = False
+        # hsa-let-7a-5p in hsa-let-7a-3 (+) and hsa-let-7a-2 (-)
+        plus = args.precursors["hsa-let-7a-3"][3:25]
+        minus = args.precursors["hsa-let-7a-2"][4:26]
+        with make_workdir() as wd:
+            args.out = wd
+            fn = os.path.join(wd, "manatee.sam")
+            with open(fn, 'w') as outh:
+                for cols in [["r1", "0", "chr22", "46112751", plus, "10"],
+                             ["r2", "16", "chr11", "122146568",
+                              reverse_complement(minus), "5"]]:
+                    print("\t".join(cols[:4] + ["255", "22M", "*", "0", "0",
+                                                cols[4], "*", "X", "X", "X",
+                                                cols[5]]), file=outh)
+            reads = manatee.read_file(fn, args.database, args)
+        lines = [hit[4] for chrom in reads for start in reads[chrom]
+                 for hit in reads[chrom][start]]
+        if len(lines) != 2 or any("ref_miRNA" not in line or
+                                  "hsa-let-7a-5p" not in line for line in lines):
+            raise ValueError("Wrong Manatee lines %s" % lines)
+
+    ##@attr(group=True)
+    def test_group(self):
+        """testing grouping alignments by name"""
+        from mirtop.bam import group
+        fn = "data/examples/annotate/sim_isomir.sam"
+        in_memory = [line.to_string() for line in
+                     group.by_name(group.open_bam(fn))]
+        with make_workdir() as wd:
+            spilled = [line.to_string() for line in
+                       group.by_name(group.open_bam(fn), wd, max_lines=10)]
+        if in_memory != spilled:
+            raise ValueError("Different order after spilling to disk.")
+        seen = set()
+        current = None
+        for line in in_memory:
+            name = line.split("\t")[0]
+            if name != current and name in seen:
+                raise ValueError("%s is not grouped." % name)
+            seen.add(name)
+            current = name
+        if sorted(["r10", "r2", "r1"], key=group.name_key) != ["r1", "r2", "r10"]:
+            raise ValueError("Names are not sorted as samtools.")
+
+    ##@attr(group=True)
+    def test_group_primary(self):
+        """testing primary alignments go first as samtools sort -n"""
+        import pysam
+        from mirtop.gff import body
+        from mirtop.bam import bam, group
+        from mirtop.mirna import fasta, mapper
+        from mirtop.mirna.annotate import annotate
+        fn = "data/examples/annotate/sim_isomir.sam"
+        args = argparse.Namespace()
+        args.hairpin = "data/examples/annotate/hairpin.fa"
+        args.gtf = "data/examples/annotate/hsa.gff3"
+        args.precursors = fasta.read_precursor(args.hairpin, "hsa")
+        args.matures = mapper.read_gtf_to_precursor(args.gtf, None)
+        args.database = "miRBasev21"
+        args.out_format = "gff"
+        args.add_extra = True
+        args.keep_name = False
+        args.genomic = False
+        args.out = None
+        with make_workdir() as wd:
+            # secondary alignments before the primary one of each read
+            reverse_fn = os.path.join(wd, "reverse.sam")
+            sorted_fn = os.path.join(wd, "sorted.sam")
+            with open(fn) as inh:
+                lines = inh.readlines()
+            with open(reverse_fn, 'w') as outh:
+                outh.writelines([line for line in lines if line.startswith("@")])
+                outh.writelines([line for line in lines if not line.startswith("@")][::-1])
+            pysam.sort("-n", "-o", sorted_fn, reverse_fn)
+            expected = [line.to_string() for line in group.open_bam(sorted_fn)]
+            in_memory = [line.to_string() for line in
+                         group.by_name(group.open_bam(reverse_fn))]
+            spilled = [line.to_string() for line in
+                       group.by_name(group.open_bam(reverse_fn), wd, max_lines=10)]
+            if in_memory != expected or spilled != expected:
+                raise ValueError("Different order than samtools sort -n.")
+            gff = []
+            for sam_fn in [sorted_fn, reverse_fn]:
+                ann = annotate(bam.read_bam(sam_fn, args), args.matures, args.precursors)
+                gff.append(body.create(ann, args.database, "Example", args))
+            if gff[0] != gff[1]:
+                raise ValueError("Different GFF when secondary alignments go first.")
+
     ##@attr(keep_name=True)
     def test_keep_name(self):
         from mirtop.bam import bam
@@ -375,6 +922,38 @@ class FunctionsTest(unittest.TestCase):
         print("\nno frequency\n")
         annotate("data/examples/seqbuster/seqbuster_nofreq.mirna", seqbuster.read_file)
 
+    ##@attr(seqbuster_low_memory=True)
+    def test_seqbuster_low_memory(self):
+        """testing seqbuster files by chunks against line by line"""
+        from mirtop.importer import seqbuster
+        from mirtop.mirna import fasta, mapper
+        try:
+            from StringIO import StringIO
+        except ImportError:
+            from io import StringIO
+        args = argparse.Namespace()
+        args.hairpin = "data/examples/annotate/hairpin.fa"
+        args.gtf = "data/examples/annotate/hsa.gff3"
+        args.precursors = fasta.read_precursor(args.hairpin, "hsa")
+        args.matures = mapper.read_gtf_to_precursor(args.gtf, None)
+        args.database = "miRBasev21"
+        args.out_format = "gff"
+        args.add_extra = True
+        args.keep_name = False
+        observed = []
+        block_size = seqbuster.BLOCK_SIZE
+        try:
+            for block in [1, 4]:
+                seqbuster.BLOCK_SIZE = block
+                out_handle = StringIO()
+                seqbuster.read_file_low_memory("data/examples/seqbuster/reads.mirna",
+                                               "reads", args, out_handle)
+                observed.append(out_handle.getvalue())
+        finally:
+            seqbuster.BLOCK_SIZE = block_size
+        if not observed[0] or observed[0] != observed[1]:
+            raise ValueError("Different lines by chunks:\n%s\n%s" % tuple(observed))
+
     ##@attr(srnabench=True)
     def test_srnabench(self):
         """testing reading srnabench files function"""
@@ -453,6 +1032,105 @@ class FunctionsTest(unittest.TestCase):
 
         return True
 
+    ##@attr(counts=True)
+    def test_counts_matrix(self):
+        """testing convert_gff_counts with one column per sample and mtx"""
+        from mirtop.gff.convert import convert_gff_counts
+        import tempfile
+        args = argparse.Namespace()
+        args.gff = 'data/examples/gff/2samples.gff'
+        args.out = tempfile.mkdtemp()
+        args.add_extra = False
+        args.matrix = ["mtx", "mtx"]
+        convert_gff_counts(args)
+        with open(os.path.join(args.out, "2samples.tsv")) as inh:
+            tsv = [line.rstrip("\n").split("\t") for line in inh]
+        with open(os.path.join(args.out, "2samples.mtx")) as inh:
+            mtx = inh.read().splitlines()
+        with open(os.path.join(args.out, "2samples.cols.tsv")) as inh:
+            cols = inh.read().splitlines()
+        shutil.rmtree(args.out)
+        if tsv[0][-2:] != ["samples1", "sample2"] or cols[1:] != tsv[0][-2:]:
+            raise ValueError("Wrong samples %s %s" % (tsv[0], cols))
+        nrows, ncols, nnz = map(int, mtx[1].split())
+        counts = [[0] * ncols for _ in range(nrows)]
+        for entry in mtx[2:]:
+            row, col, count = map(int, entry.split())
+            counts[row - 1][col - 1] = count
+        if counts != [[int(c) for c in line[-2:]] for line in tsv[1:]]:
+            raise ValueError("Different counts in mtx and tsv files.")
+        if nnz != sum(1 for line in counts for c in line if c):
+            raise ValueError("Wrong number of entries: %s" % nnz)
+
+    ##@attr(counts=True)
+    def test_counts_header(self):
+        """testing the header and rows of the counts file"""
+        from mirtop.gff.convert import convert_gff_counts
+        args = argparse.Namespace()
+        args.gff = 'data/examples/gff/2samples.gff'
+        args.add_extra = False
+        args.matrix = None
+        with make_workdir() as workdir:
+            args.out = workdir
+            convert_gff_counts(args)
+            with open(os.path.join(workdir, "2samples.tsv")) as inh:
+                lines = inh.readlines()
+        # one column for each sample, without quotes
+        if lines[0] != "UID\tRead\tmiRNA\tVariant\tiso_5p\tiso_3p\t" \
+                       "iso_add3p\tiso_snp\tsamples1\tsample2\n":
+            raise ValueError("Wrong header: %s" % lines[0])
+        if lines[1] != "iso-24-5URPV39QFE\tGATGAGGTAGTAGGTTGTATAGTT\t" \
+                       "hsa-let-7a-5p\tiso_5p:-2\t-2\t0\t0\t0\t66\t33\n":
+            raise ValueError("Wrong row: %s" % lines[1])
+
+    ##@attr(counts_matrix=True)
+    def test_counts_matrix_values(self):
+        """testing counts of the matrix files"""
+        from mirtop.gff import matrix
+        if matrix.counts(["2.0", "3", "0"]) != [2, 3, 0]:
+            raise ValueError("Wrong counts read from Expression.")
+        try:
+            matrix.counts(["2.5"])
+        except ValueError:
+            pass
+        else:
+            raise ValueError("Counts that are not whole numbers accepted.")
+        if matrix.formats(["mtx", "hdf5", "mtx"]) != ["mtx", "hdf5"] or \
+                matrix.formats(None):
+            raise ValueError("Wrong matrix formats.")
+
+    ##@attr(counts_matrix=True)
+    def test_counts_matrix_binary(self):
+        """testing convert_gff_counts with parquet and hdf5 files"""
+        from mirtop.gff.convert import convert_gff_counts
+        import tempfile
+        try:
+            import pyarrow.parquet
+            import h5py
+        except ImportError:
+            self.skipTest("pyarrow and h5py are needed for --matrix parquet/hdf5")
+        args = argparse.Namespace()
+        args.gff = 'data/examples/gff/2samples.gff'
+        args.out = tempfile.mkdtemp()
+        args.add_extra = False
+        args.matrix = ["parquet", "hdf5"]
+        convert_gff_counts(args)
+        with open(os.path.join(args.out, "2samples.tsv")) as inh:
+            tsv = [line.rstrip("\n").split("\t") for line in inh]
+        table = pyarrow.parquet.read_table(os.path.join(args.out, "2samples.parquet"))
+        parquet = [list(row.values()) for row in table.to_pylist()]
+        with h5py.File(os.path.join(args.out, "2samples.h5"), 'r') as h5:
+            samples = [s.decode() for s in h5["samples"][:]]
+            counts = h5["counts"][:].tolist()
+            uids = [u.decode() for u in h5["rows/UID"][:]]
+        shutil.rmtree(args.out)
+        expected = [line[:-2] + [int(c) for c in line[-2:]] for line in tsv[1:]]
+        if table.schema.names != tsv[0] or parquet != expected:
+            raise ValueError("Different rows in parquet and tsv files.")
+        if samples != tsv[0][-2:] or counts != [line[-2:] for line in expected] \
+                or uids != [line[0] for line in tsv[1:]]:
+            raise ValueError("Different rows in hdf5 and tsv files.")
+
     ##@attr(stats=True)
     def test_stats(self):
         """testing stats function"""
@@ -462,6 +1140,79 @@ class FunctionsTest(unittest.TestCase):
         stats._dump_log(df, version, None)
         print(df)
 
+    ##@attr(stats=True)
+    def test_stats_jobs(self):
+        """testing stats function with several files at the same time"""
+        from mirtop.gff import stats
+        import tempfile
+        args = argparse.Namespace()
+        args.files = ["data/examples/gff/correct_file.gff",
+                      "data/examples/gff/2samples.gff"]
+        out = []
+        for jobs in [1, 2]:
+            args.jobs = jobs
+            args.out = tempfile.mkdtemp()
+            stats.stats(args)
+            with open(os.path.join(args.out, "mirtop_stats.txt")) as inh:
+                out.append(inh.readlines()[1:])
+            shutil.rmtree(args.out)
+        if out[0] != out[1]:
+            raise ValueError("Different stats with --jobs.")
+        acc = stats.accumulator(["s1", "s2", "s1"])
+        acc.add(["isomiR", "iso_5p"], "1,0,3")
+        acc.add(["isomiR"], "2,5,0")
+        if list(acc.rows()) != [("iso_5p", "s1", 3, 1, 3.0),
+                                ("isomiR", "s1", 3, 1, 3.0),
+                                ("isomiR", "s2", 5, 1, 5.0)]:
+            raise ValueError("Wrong stats: %s" % list(acc.rows()))
+
+    ##@attr(compare=True)
+    def test_compare(self):
+        """testing compare function with the compact reference"""
+        from mirtop.gff import compare
+        import tempfile
+        if compare._accuracy("iso_5p,iso_snv_seed", "iso_5p,iso_3p") != {
+                "iso_5p": "TP", "iso_3p": "FN", "iso_add3p": "TN",
+                "iso_snv": "FP", "iso_snv_seed": "FP", "iso_snv_central": "TN",
+                "iso_snv_central_supp": "TN", "iso_snv_central_offset": "TN"}:
+            raise ValueError("Wrong accuracy.")
+        args = argparse.Namespace()
+        args.files = ["data/examples/gff/correct_file.gff",
+                      "data/examples/gff/2samples.gff",
+                      "data/examples/gff/correct_file.gff"]
+        out = []
+        for jobs in [1, 2]:
+            args.jobs = jobs
+            args.out = tempfile.mkdtemp()
+            compare.compare(args)
+            with open(os.path.join(args.out, "summary.txt")) as inh:
+                out.append(inh.readlines())
+            shutil.rmtree(args.out)
+        if out[0] != out[1]:
+            raise ValueError("Different comparison with --jobs.")
+        tags = set(line.split("\t")[3] for line in out[0] if line.startswith("correct"))
+        if tags != set(["D"]):
+            raise ValueError("Reference compared to itself has tags %s" % tags)
+        with make_workdir() as workdir:
+            line = ("hsa-let-7a-1\tmiRBasev21\tisomiR\t3\t26\t0\t+\t.\t"
+                    "UID=%s; Name=hsa-let-7a-5p; Variant=%s\n")
+            with open(os.path.join(workdir, "reference.gff"), "w") as outh:
+                outh.write(line % ("iso-24-5URPV39QFE", "iso_5p:-2,iso_add3p:1"))
+                outh.write(line % ("iso-23-I0S31NSL0E", "iso_5p:-1"))
+            with open(os.path.join(workdir, "target.gff"), "w") as outh:
+                outh.write(line % ("iso-24-5URPV39QFE", "iso_add3p:1,iso_5p:-2"))
+                outh.write(line % ("iso-23-I0S31NSL0E", "iso_5p:-1"))
+            reference = compare.read_reference(
+                os.path.join(workdir, "reference.gff"))
+            with self.assertLogs(compare.logger, "INFO") as logs:
+                compare._compare_to_reference(
+                    os.path.join(workdir, "target.gff"), reference)
+            # same and different are counted comparing the Variant strings
+            if not set(["Number of sequences matches reference: 1",
+                        "Number of sequences different than reference: 1"]) <= \
+                    set(record.getMessage() for record in logs.records):
+                raise ValueError("Wrong same/different counts: %s" % logs.output)
+
     ##@attr(variant=True)
     def test_string_variant(self):
         """testing parsing string variants"""
@@ -526,6 +1277,65 @@ class FunctionsTest(unittest.TestCase):
         print("\n")
         _process("data/examples/gff/2samples.gff", None)
 
+    #@attr(export_handles=True)
+    def test_export_handles(self):
+        """testing buffered files with few open at the same time"""
+        from mirtop.exporter.engine import handles
+        import tempfile
+        out = tempfile.mkdtemp()
+        files = handles(max_open=2, buffer_lines=2)
+        names = [os.path.join(out, "s%s.txt" % idx) for idx in range(5)]
+        files.start(names[0])
+        files.write(names[0], "old\n")
+        files.close(names[0])
+        for fn in names:
+            files.start(fn)
+        for line in range(7):
+            for fn in names:
+                files.write(fn, "%s\n" % line)
+        opened = len(files._open)
+        files.close()
+        observed = []
+        for fn in names:
+            with open(fn) as inh:
+                observed.append(inh.read())
+        shutil.rmtree(out)
+        if opened > 2:
+            raise ValueError("More than 2 files open: %s" % opened)
+        expected = "".join("%s\n" % line for line in range(7))
+        if observed != [expected] * len(names):
+            raise ValueError("Wrong content: %s" % observed)
+
+    #@attr(export_vcf=True)
+    def test_export_vcf(self):
+        """testing Cigar runs and compressed and indexed VCF"""
+        from mirtop.exporter import vcf
+        import pysam
+        import tempfile
+        runs = vcf.parse_cigar("10MC11MDDI")
+        if runs != [(10, "M"), (1, "C"), (11, "M"), (1, "D"), (1, "D"), (1, "I")]:
+            raise ValueError("Wrong Cigar runs: %s" % runs)
+        hairpin = "TGAGGTAGTAGGTTGTATAGTTTTAGGGTCACACCCACCACTG"
+        keys = vcf.cigar_2_key("5MA3MDD4M", "TGAGGAAGTGTATAGTT", hairpin[:22],
+                               100, 0, 0, 0, 21, hairpin)
+        if keys != ([105, 109], ["A", "D2"], ["T", "TAG"], ["A", "T"]):
+            raise ValueError("Wrong variants: %s" % str(keys))
+        out = tempfile.mkdtemp()
+        fn = os.path.join(out, "correct_file.vcf.gz")
+        vcf.create_vcf("data/examples/gff/correct_file.gff",
+                       "data/examples/annotate/hairpin.fa",
+                       "data/examples/annotate/hsa.gff3", fn, None)
+        tbx = pysam.TabixFile(fn)
+        contigs = tbx.contigs
+        rows = [row.split("\t") for row in tbx.fetch("chr9")]
+        tbx.close()
+        shutil.rmtree(out)
+        if contigs != ["chr9"] or len(rows) != 3:
+            raise ValueError("Wrong variants in VCF: %s %s" % (contigs, rows))
+        positions = [int(row[1]) for row in rows]
+        if positions != sorted(positions):
+            raise ValueError("VCF not sorted: %s" % positions)
+
     #@attr(update=True)
     def test_update(self):
         from mirtop.gff.update import update_file
@@ -549,6 +1359,85 @@ class FunctionsTest(unittest.TestCase):
         os.remove(os.path.join(args.out, "SQL_sample.db"))
         return True
 
+    #@attr(sql_bulk=True)
+    def test_sql_bulk(self):
+        """testing bulk loading of sql.py against row by row inserts"""
+        from mirtop.sql import sql
+        import sqlite3
+        import tempfile
+        out = tempfile.mkdtemp()
+        args = argparse.Namespace()
+        args.db = "bulk.db"
+        args.gff = 'data/examples/annotate/SQL_sample.gff'
+        args.out = out
+        batch_size = sql.BATCH_SIZE
+        sql.BATCH_SIZE = 7
+        try:
+            sql.insert_sql(args)
+        finally:
+            sql.BATCH_SIZE = batch_size
+        conn = sqlite3.connect(os.path.join(out, "bulk.db"))
+        observed = conn.execute("SELECT * FROM data_sets").fetchall()
+        indexes = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")]
+        conn.close()
+        conn = sqlite3.connect(os.path.join(out, "rows.db"))
+        source = ""
+        with open(args.gff) as inh:
+            for text in inh:
+                if text.startswith("## source-ontology"):
+                    source = text.strip().split(' ')[-1]
+                elif text.startswith("## COLDATA"):
+                    sql.create_table(conn, ["%s text" % s.replace('-', '_') for s in
+                                            text.strip().split(' ')[-1].split(',')])
+                elif not text.startswith("#"):
+                    sql.gff_insert_values(conn, sql._gff_values(text, source))
+        expected = conn.execute("SELECT * FROM data_sets").fetchall()
+        conn.close()
+        shutil.rmtree(out)
+        if observed != expected:
+            raise ValueError("Bulk loading gives different rows.")
+        if len([idx for idx in indexes if idx.startswith("data_sets_")]) != len(sql.INDEXED_COLUMNS):
+            raise ValueError("Missing indexes: %s" % indexes)
+
+    #@attr(sql_long=True)
+    def test_sql_long(self):
+        """testing long format of sql.py against one column per sample"""
+        from mirtop.sql import sql
+        import sqlite3
+        import tempfile
+        out = tempfile.mkdtemp()
+        args = argparse.Namespace()
+        args.gff = 'data/examples/annotate/SQL_sample.gff'
+        args.out = out
+        args.db = "wide.db"
+        sql.insert_sql(args)
+        args.db = "long.db"
+        args.schema = "long"
+        sql.insert_sql(args)
+        queries = ["SELECT * FROM data_sets", "SELECT * FROM mirna_summary",
+                   "SELECT * FROM sample_summary"]
+        conn = sqlite3.connect(os.path.join(out, "wide.db"))
+        wide = [conn.execute(q).fetchall() for q in queries]
+        counts = [float(row[-1]) for row in wide[0]]
+        conn.close()
+        conn = sqlite3.connect(os.path.join(out, "long.db"))
+        long = [conn.execute(q).fetchall() for q in queries]
+        expression = [c for c, in conn.execute(
+            "SELECT count FROM expression ORDER BY isomir_id")]
+        args.count, args.txtout, args.miRNA = "T", None, None
+        sql.stats_per_sample(conn, args)
+        conn.close()
+        if args.count != "T":
+            raise ValueError("stats-per-sample changed the arguments.")
+        shutil.rmtree(out)
+        if [row[:-1] for row in wide[0]] != long[0]:
+            raise ValueError("Different isomiRs in long format.")
+        if wide[1:] != long[1:]:
+            raise ValueError("Different summaries in long format.")
+        if expression != [c for c in counts if c]:
+            raise ValueError("Different counts in long format.")
+
     #@attr(issue64=True)
     def test_issue64(self):
         from mirtop.bam.filter import tune